@@ -0,0 +1,239 @@
+import asyncio
+import hmac
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+from aiohttp import web
+from telebot import apihelper, types
+
+from webhook import MAX_UPDATE_SIZE, chat_key
+
+# Таймаут долгого опроса getUpdates в секундах
+LONG_POLLING_TIMEOUT = 25
+
+# Максимальная задержка перед повтором getUpdates после ошибки в секундах
+MAX_POLLING_BACKOFF = 30
+
+
+class AsyncRuntime:
+    """
+    Асинхронная среда выполнения бота на asyncio.
+
+    Прием обновлений (долгий опрос getUpdates или webhook) выполняется
+    в цикле событий без блокирующего ввода-вывода, и каждое обновление
+    становится задачей asyncio. Задачи одного чата выполняются по порядку,
+    задачи разных чатов - параллельно. Обработчики бота синхронные и
+    вызываются в пуле из handler_threads потоков. Они не ждут отправки
+    сообщений, построения графиков и скачивания файлов: эти шаги
+    завершаются в очереди отправки, пуле процессов графиков и пуле
+    работы с файлами бота.
+
+    Память ограничена: одновременно в работе не более max_updates
+    обновлений. При достижении предела опрос приостанавливается, а
+    webhook отвечает 503, и Telegram повторяет доставку позже.
+    """
+
+    def __init__(self, bot, handler_threads=16, max_updates=1000):
+        """
+        Args:
+        - bot (telebot.TeleBot): Бот; обработчики вызываются через
+         bot.process_new_updates.
+        - handler_threads (int): Количество потоков для обработчиков.
+        - max_updates (int): Максимальное количество обновлений в работе.
+        """
+        self.bot = bot
+        self.handler_threads = handler_threads
+        self.max_updates = max_updates
+        # Последняя задача каждого чата: следующая ждет ее завершения
+        self._tails = {}
+        self._in_flight = 0
+        self._slots = None
+        self._executor = None
+
+    def in_flight(self):
+        """
+        Returns:
+        - int: Количество обновлений в работе.
+        """
+        return self._in_flight
+
+    async def run_polling(self):
+        """
+        Получает обновления долгим опросом getUpdates.
+
+        Returns:
+            None
+        """
+        await self._start()
+        url = _api_url(self.bot.token, "getUpdates")
+        timeout = aiohttp.ClientTimeout(total=LONG_POLLING_TIMEOUT + 10)
+        offset = None
+        errors = 0
+        try:
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                while True:
+                    params = {"timeout": LONG_POLLING_TIMEOUT}
+                    if offset is not None:
+                        params["offset"] = offset
+                    try:
+                        async with session.get(url, params=params) as reply:
+                            data = await reply.json(content_type=None)
+                        if not data.get("ok"):
+                            raise aiohttp.ClientError(
+                                data.get("description", "getUpdates"))
+                    except (aiohttp.ClientError, asyncio.TimeoutError,
+                            ValueError) as e:
+                        errors += 1
+                        print(e)
+                        await asyncio.sleep(random.uniform(
+                            0, min(MAX_POLLING_BACKOFF, 2 ** errors)))
+                        continue
+                    errors = 0
+
+                    for item in data["result"]:
+                        offset = item["update_id"] + 1
+                        # Ждем свободного места, не запрашивая новые
+                        # обновления
+                        await self._slots.acquire()
+                        self._dispatch(types.Update.de_json(item))
+        finally:
+            await self._stop()
+
+    async def run_webhook(self, host, port, path="/", secret_token=None):
+        """
+        Принимает обновления HTTP-сервером aiohttp (режим webhook).
+
+        Args:
+        - host (str): Адрес, на котором принимаются запросы.
+        - port (int): Порт.
+        - path (str): Путь, на который Telegram отправляет обновления.
+        - secret_token (Optional[str]): Значение заголовка
+         X-Telegram-Bot-Api-Secret-Token, переданное в set_webhook.
+
+        Returns:
+            None
+        """
+        await self._start()
+
+        async def receive(request):
+            secret = request.headers.get(
+                "X-Telegram-Bot-Api-Secret-Token", "")
+            if secret_token is not None \
+                    and not hmac.compare_digest(secret, secret_token):
+                return web.Response(status=403)
+            try:
+                data = await request.json()
+                if not isinstance(data, dict) or "update_id" not in data:
+                    raise ValueError("Нет update_id.")
+                update = types.Update.de_json(data)
+            except (ValueError, KeyError, TypeError, AttributeError):
+                return web.Response(status=400)
+
+            if self._slots.locked():
+                return web.Response(status=503, headers={"Retry-After": "1"})
+            await self._slots.acquire()
+            self._dispatch(update)
+            return web.Response()
+
+        async def health(request):
+            return web.Response(text=f"{self.in_flight()}")
+
+        app = web.Application(client_max_size=MAX_UPDATE_SIZE)
+        app.router.add_post(path, receive)
+        app.router.add_get("/healthz", health)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, host, port).start()
+            # Сервер работает до отмены задачи
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+            await self._stop()
+
+    async def _start(self):
+        """
+        Создает пул потоков обработчиков и ограничитель обновлений.
+
+        Returns:
+            None
+        """
+        self._slots = asyncio.Semaphore(self.max_updates)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.handler_threads,
+            thread_name_prefix="handler")
+
+    async def _stop(self, timeout=10):
+        """
+        Дожидается обработки принятых обновлений и останавливает пул.
+
+        Args:
+        - timeout (float): Максимальное время ожидания в секундах.
+
+        Returns:
+            None
+        """
+        if self._tails:
+            await asyncio.wait(list(self._tails.values()), timeout=timeout)
+        self._executor.shutdown(wait=False)
+
+    def _dispatch(self, update):
+        """
+        Создает задачу обработки обновления после предыдущей задачи
+        того же чата (место в ограничителе уже занято).
+
+        Args:
+        - update (types.Update): Обновление.
+
+        Returns:
+            None
+        """
+        key = chat_key(update)
+        task = asyncio.ensure_future(
+            self._process(update, self._tails.get(key)))
+        self._tails[key] = task
+        self._in_flight += 1
+
+        def finished(task):
+            self._in_flight -= 1
+            self._slots.release()
+            if self._tails.get(key) is task:
+                del self._tails[key]
+
+        task.add_done_callback(finished)
+
+    async def _process(self, update, previous):
+        """
+        Обрабатывает обновление в пуле потоков.
+
+        Args:
+        - update (types.Update): Обновление.
+        - previous (Optional[asyncio.Task]): Предыдущая задача чата.
+
+        Returns:
+            None
+        """
+        if previous is not None:
+            # Ошибка предыдущего обновления не мешает следующему
+            await asyncio.wait([previous])
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(
+                self._executor, self.bot.process_new_updates, [update])
+        except Exception as e:
+            print(e)
+
+
+def _api_url(token, method):
+    """
+    Args:
+    - token (str): Токен бота.
+    - method (str): Метод Bot API.
+
+    Returns:
+    - str: Адрес метода с учетом apihelper.API_URL.
+    """
+    if apihelper.API_URL is None:
+        return f"https://api.telegram.org/bot{token}/{method}"
+    return apihelper.API_URL.format(token, method)
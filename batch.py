@@ -0,0 +1,320 @@
+import codecs
+import csv
+import io
+import itertools
+
+import numpy as np
+
+from economics import deficit_surplus, kpv_frontier, solve_market_equilibrium
+
+# Количество строк, обрабатываемых за один векторный вызов
+CHUNK_ROWS = 50000
+
+# Столбцы результата пакетного расчета рыночного равновесия
+EQUILIBRIUM_COLUMNS = ["A", "B", "C", "D", "P", "Q", "status"]
+
+# Столбцы результата пакетного расчета дефицита/излишка
+DEFICIT_COLUMNS = ["A", "B", "C", "D", "E", "Qd - Qs", "status"]
+
+# Статус строки с не конечным значением (nan, inf) в данных или результате
+NON_FINITE_STATUS = "не конечное значение"
+
+# Столбцы вершин общей КПВ: производитель (номер строки с данными), его
+# объемы, альтернативная стоимость товара Б и вершина после переключения
+FRONTIER_COLUMNS = ["producer", "A", "Б", "A / Б", "Б total", "A total"]
+
+
+def iter_lines(chunks, encoding="utf-8-sig"):
+    """
+    Превращает поток байтов в поток строк, не загружая файл целиком.
+
+    Args:
+    - chunks (Iterable[bytes]): Части файла.
+    - encoding (str): Кодировка файла.
+
+    Returns:
+    - Iterator[str]: Строки файла без символов перевода строки.
+
+    Raises:
+    - UnicodeDecodeError: Если файл не в указанной кодировке.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    tail = ""
+    for chunk in chunks:
+        lines = (tail + decoder.decode(chunk)).split("\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail.rstrip("\r")
+
+
+def iter_tables(lines, chunk_rows=CHUNK_ROWS):
+    """
+    Читает числовую таблицу из строк CSV блоками по chunk_rows строк.
+
+    Разделитель (',' или ';') определяется по первой строке; при
+    разделителе ';' допускается десятичная запятая. Первая строка
+    пропускается, если это заголовок. Все блоки должны иметь одинаковое
+    количество столбцов.
+
+    Args:
+    - lines (Iterable[str]): Строки CSV-файла.
+    - chunk_rows (int): Количество строк в блоке.
+
+    Returns:
+    - Iterator[np.ndarray]: Блоки формы (строки, столбцы).
+
+    Raises:
+    - ValueError: Если таблица пуста или содержит некорректные значения.
+    """
+    lines = iter(lines)
+    first = next(lines, None)
+    if first is None:
+        raise ValueError("Файл пуст.")
+
+    delimiter = ";" if ";" in first else ","
+
+    def clean(line):
+        return line.replace(",", ".") if delimiter == ";" else line
+
+    # Строки блока и их номера в файле (для сообщений об ошибках)
+    block = []
+    numbers = []
+    # Заголовок - первая строка, которую нельзя прочитать как числа
+    try:
+        [float(value) for value in clean(first).split(delimiter)]
+        block.append(clean(first))
+        numbers.append(1)
+    except ValueError:
+        pass
+
+    columns = None
+    for number, line in enumerate(lines, 2):
+        if line.strip():
+            block.append(clean(line))
+            numbers.append(number)
+        if len(block) >= chunk_rows:
+            table = _load_block(block, numbers, delimiter)
+            columns = _check_columns(table, columns, numbers[0])
+            yield table
+            block = []
+            numbers = []
+
+    if block:
+        table = _load_block(block, numbers, delimiter)
+        columns = _check_columns(table, columns, numbers[0])
+        yield table
+    elif columns is None:
+        raise ValueError("В файле нет строк с данными.")
+
+
+def _load_block(block, numbers, delimiter):
+    """
+    Читает блок строк CSV как числовую таблицу.
+
+    Args:
+    - block (List[str]): Строки блока.
+    - numbers (List[int]): Номера этих строк в файле.
+    - delimiter (str): Разделитель значений.
+
+    Returns:
+    - np.ndarray: Блок формы (строки, столбцы).
+
+    Raises:
+    - ValueError: С номером первой строки, которую не удалось прочитать.
+    """
+    try:
+        return np.loadtxt(block, delimiter=delimiter, ndmin=2)
+    except ValueError:
+        pass
+
+    # Сообщение numpy непонятно пользователю: ищем строку сами
+    width = None
+    for line, number in zip(block, numbers):
+        values = line.split(delimiter)
+        if width is None:
+            width = len(values)
+        if len(values) != width:
+            raise ValueError(
+                f"Строка {number}: {len(values)} столбцов вместо {width}.")
+        try:
+            [float(value) for value in values]
+        except ValueError:
+            raise ValueError(f"Строка {number}: значения должны быть числами.")
+    raise ValueError("Значения должны быть числами.")
+
+
+def _check_columns(table, columns, number):
+    """
+    Проверяет, что количество столбцов блока совпадает с предыдущими.
+
+    Args:
+    - table (np.ndarray): Блок таблицы.
+    - columns (Optional[int]): Количество столбцов предыдущих блоков.
+    - number (int): Номер первой строки блока в файле.
+
+    Returns:
+    - int: Количество столбцов.
+
+    Raises:
+    - ValueError: Если количество столбцов отличается.
+    """
+    if columns is not None and table.shape[1] != columns:
+        raise ValueError(
+            f"Строка {number}: {table.shape[1]} столбцов вместо {columns}.")
+    return table.shape[1]
+
+
+def solve_equilibrium_rows(table):
+    """
+    Рассчитывает рыночное равновесие для блока строк A, B, C, D.
+
+    Args:
+    - table (np.ndarray): Блок формы (строки, 4).
+
+    Returns:
+    - Tuple[Iterator[list], int]: Строки результата и количество строк,
+     для которых равновесие не определено (D + B = 0, не конечные
+     коэффициенты или результат).
+    """
+    # Не конечные значения отмечаются статусом, а не предупреждением
+    with np.errstate(all="ignore"):
+        price, value, valid = solve_market_equilibrium(*table.T)
+    status = np.select(
+        [~np.isfinite(table).all(axis=1), ~valid,
+         ~(np.isfinite(price) & np.isfinite(value))],
+        [NON_FINITE_STATUS, "D + B = 0", NON_FINITE_STATUS], "ok")
+    rows = (
+        row + [p, q, s] if s == "ok" else row + ["", "", s]
+        for row, p, q, s in zip(table.tolist(), price.round(2).tolist(),
+                                value.round(2).tolist(), status.tolist())
+    )
+    return rows, int((status != "ok").sum())
+
+
+def solve_deficit_rows(table):
+    """
+    Рассчитывает объем дефицита/излишка для блока строк A, B, C, D, E.
+
+    Args:
+    - table (np.ndarray): Блок формы (строки, 5).
+
+    Returns:
+    - Tuple[Iterator[list], int]: Строки результата и количество строк
+     с отрицательным уровнем цены или не конечными значениями.
+    """
+    with np.errstate(all="ignore"):
+        gap = deficit_surplus(*table.T)
+    status = np.select(
+        [~np.isfinite(table).all(axis=1), table[:, 4] < 0,
+         ~np.isfinite(gap)],
+        [NON_FINITE_STATUS, "E < 0", NON_FINITE_STATUS], "")
+    situation = np.where(gap > 0, "дефицит",
+                         np.where(gap < 0, "излишек", "равновесие"))
+    rows = (
+        row + [g, s] if not error else row + ["", error]
+        for row, g, s, error in zip(table.tolist(), gap.round(2).tolist(),
+                                    situation.tolist(), status.tolist())
+    )
+    return rows, int((status != "").sum())
+
+
+# Расчет по количеству столбцов файла: (столбцы результата, функция)
+SOLVERS = {
+    4: (EQUILIBRIUM_COLUMNS, solve_equilibrium_rows),
+    5: (DEFICIT_COLUMNS, solve_deficit_rows),
+}
+
+
+def write_frontier(tables, writer):
+    """
+    Строит общую КПВ производителей из строк A, Б и записывает ее вершины.
+
+    В отличие от остальных расчетов, порядок производителей зависит от
+    всего файла, поэтому блоки собираются в один массив перед расчетом.
+
+    Args:
+    - tables (Iterable[np.ndarray]): Блоки формы (строки, 2).
+    - writer (csv.writer): Запись CSV с результатами.
+
+    Returns:
+    - Tuple[int, int, Tuple[np.ndarray, np.ndarray]]: Количество строк,
+     количество некорректных строк (отрицательные или не конечные объемы)
+     и вершины кривой (объемы товара Б и товара А).
+
+    Raises:
+    - ValueError: Если в файле нет ни одной корректной строки.
+    """
+    table = np.concatenate(list(tables))
+    valid = np.isfinite(table).all(axis=1) & (table >= 0).all(axis=1)
+    numbers = np.flatnonzero(valid) + 1
+    if not len(numbers):
+        raise ValueError("В файле нет строк с неотрицательными объемами.")
+
+    max_a, max_b = table[valid].T
+    order, cost, vertex_b, vertex_a = kpv_frontier(max_a, max_b)
+
+    writer.writerow(FRONTIER_COLUMNS)
+    writer.writerow(["", "", "", "", 0.0, round(float(vertex_a[0]), 2)])
+    # Производители без товара Б (бесконечная стоимость) - пустая ячейка
+    writer.writerows(
+        [n, a, b, c if c != float("inf") else "", vb, va]
+        for n, a, b, c, vb, va in zip(
+            numbers[order].tolist(), max_a[order].tolist(),
+            max_b[order].tolist(), cost.round(4).tolist(),
+            vertex_b[1:].round(2).tolist(), vertex_a[1:].round(2).tolist())
+    )
+    return len(table), int((~valid).sum()), (vertex_b, vertex_a)
+
+
+def process_csv(chunks, output, chunk_rows=CHUNK_ROWS):
+    """
+    Потоковый пакетный расчет: чтение, разбор, векторный расчет и запись
+    результата блоками, поэтому объем памяти не зависит от размера файла.
+
+    Файл из 4 столбцов (A, B, C, D) рассчитывается как рыночное
+    равновесие, из 5 столбцов (A, B, C, D, E) - как дефицит/излишек, из
+    2 столбцов (A, Б - объемы производителей) - как общая КПВ.
+
+    Args:
+    - chunks (Iterable[bytes]): Части входного CSV-файла.
+    - output (IO[bytes]): Файл для записи CSV с результатами.
+    - chunk_rows (int): Количество строк в блоке.
+
+    Returns:
+    - Tuple[int, int, int, Optional[tuple]]: Количество столбцов входного
+     файла, количество строк, количество строк, для которых результат не
+     определен, и вершины КПВ (для файла из 2 столбцов, иначе None).
+
+    Raises:
+    - ValueError: Если файл не удалось прочитать.
+    - UnicodeDecodeError: Если файл не в кодировке UTF-8.
+    """
+    text = io.TextIOWrapper(output, encoding="utf-8", newline="")
+    writer = csv.writer(text)
+    columns = rows = invalid = 0
+    frontier = None
+    tables = iter_tables(iter_lines(chunks), chunk_rows)
+
+    for table in tables:
+        if not columns:
+            columns = table.shape[1]
+            if columns == 2:
+                rows, invalid, frontier = write_frontier(
+                    itertools.chain([table], tables), writer)
+                break
+            if columns not in SOLVERS:
+                raise ValueError(
+                    f"Ожидается 2, 4 или 5 столбцов, в файле {columns}.")
+            writer.writerow(SOLVERS[columns][0])
+
+        result, block_invalid = SOLVERS[columns][1](table)
+        writer.writerows(result)
+        rows += len(table)
+        invalid += block_invalid
+
+    text.flush()
+    text.detach()
+    return columns, rows, invalid, frontier
@@ -0,0 +1,72 @@
+"""
+Бенчмарк построения графиков КПВ.
+
+Сравнивает построение фигуры заново для каждого графика (plot_kpv_fresh)
+с заготовкой, в которой меняются только данные (plot_kpv). Оба варианта
+запускаются в текущем процессе после прогрева matplotlib на одинаковых
+наборах входных данных.
+
+Использование:
+    python bench_charts.py [--charts 50] [--runs 5]
+"""
+import argparse
+import statistics
+import sys
+import time
+
+import charts
+
+
+def measure(render, inputs):
+    """
+    Строит графики по всем наборам данных.
+
+    Args:
+    - render (Callable[..., bytes]): Функция построения графика.
+    - inputs (List[tuple]): Наборы входных данных.
+
+    Returns:
+    - float: Среднее время построения одного графика в секундах.
+    """
+    started = time.perf_counter()
+    for args in inputs:
+        render(*args)
+    return (time.perf_counter() - started) / len(inputs)
+
+
+def main():
+    """
+    Сравнивает медианное время построения графика двумя способами.
+
+    Returns:
+    - int: Код завершения.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--charts", type=int, default=50,
+                        help="количество графиков в одном замере")
+    parser.add_argument("--runs", type=int, default=5,
+                        help="количество замеров")
+    args = parser.parse_args()
+
+    charts.warm_up()
+    # Разные данные на каждом графике, чтобы менялись границы осей
+    inputs = [
+        (100 + i, 50 + i % 7, 80 + i % 13, 60 + i % 5)
+        for i in range(args.charts)
+    ]
+
+    results = {}
+    for render in (charts.plot_kpv_fresh, charts.plot_kpv):
+        results[render.__name__] = statistics.median(
+            measure(render, inputs) for _ in range(args.runs))
+
+    fresh = results["plot_kpv_fresh"]
+    template = results["plot_kpv"]
+    print(f"Новая фигура (plot_kpv_fresh): {fresh * 1000:.1f} мс/график")
+    print(f"Заготовка (plot_kpv): {template * 1000:.1f} мс/график")
+    print(f"Ускорение: {fresh / template:.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""
+Бенчмарк холодного старта бота.
+
+Измеряет в отдельном процессе время от запуска интерпретатора до обработки
+первого текстового обновления (импорт bot.py и отправка ответа на /start).
+Запросы к Telegram подменяются заглушкой, поэтому токен и сеть не нужны.
+
+Завершается с кодом 1, если время превышает бюджет или если при старте
+были загружены библиотеки графиков.
+
+Использование:
+    python bench_startup.py [--budget 1.5] [--runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+# Библиотеки, которые не должны загружаться до первого графика
+HEAVY_MODULES = ("matplotlib", "numpy")
+
+
+def _fake_request_sender(method, url, **kwargs):
+    """
+    Заглушка запросов к Telegram: на любой метод возвращает сообщение.
+
+    Returns:
+    - SimpleNamespace: Объект, похожий на ответ requests.
+    """
+    result = {
+        "message_id": 1,
+        "date": 0,
+        "chat": {"id": 1, "type": "private"},
+        "text": "",
+    }
+    payload = {"ok": True, "result": result}
+    return SimpleNamespace(
+        status_code=200,
+        reason="OK",
+        text=json.dumps(payload),
+        json=lambda: payload,
+    )
+
+
+def run_child():
+    """
+    Замер внутри свежего процесса: импорт бота и обработка /start.
+
+    Печатает результат в формате JSON.
+
+    Returns:
+        None
+    """
+    started = time.perf_counter()
+
+    from telebot import apihelper, types
+
+    apihelper.CUSTOM_REQUEST_SENDER = _fake_request_sender
+
+    import bot
+
+    imported = time.perf_counter()
+
+    update = types.Update.de_json({
+        "update_id": 1,
+        "message": {
+            "message_id": 1,
+            "date": 0,
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "bench"},
+            "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        },
+    })
+    bot.bot.threaded = False
+    bot.bot.process_new_updates([update])
+    # Ответ уходит из очереди отправки: ждем, пока он будет отправлен
+    bot.outbound.join()
+
+    finished = time.perf_counter()
+    print(json.dumps({
+        "import": imported - started,
+        "first_update": finished - started,
+        "heavy_modules": [
+            name for name in HEAVY_MODULES if name in sys.modules
+        ],
+    }))
+
+
+def main():
+    """
+    Запускает несколько замеров и сравнивает медиану с бюджетом.
+
+    Returns:
+    - int: Код завершения (0 - в пределах бюджета).
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--budget", type=float, default=1.5,
+                        help="бюджет времени до первого обновления, с")
+    parser.add_argument("--runs", type=int, default=5,
+                        help="количество замеров")
+    parser.add_argument("--child", action="store_true",
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child()
+        return 0
+
+    results = []
+    for _ in range(args.runs):
+        output = subprocess.run(
+            [sys.executable, __file__, "--child"],
+            # Токен в формате Telegram; запросы все равно не уходят в сеть
+            env=dict(os.environ, BOT_TOKEN="123456:bench", STATE_DB_PATH=""),
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    import_time = statistics.median(r["import"] for r in results)
+    first_update = statistics.median(r["first_update"] for r in results)
+    heavy = sorted({name for r in results for name in r["heavy_modules"]})
+
+    print(f"Импорт bot.py: {import_time * 1000:.1f} мс")
+    print(f"До первого обновления: {first_update * 1000:.1f} мс"
+          f" (бюджет {args.budget * 1000:.0f} мс)")
+
+    failed = False
+    if first_update > args.budget:
+        print("Превышен бюджет времени холодного старта.")
+        failed = True
+    if heavy:
+        print(f"При старте загружены библиотеки графиков: {', '.join(heavy)}")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,207 @@
-import matplotlib.pyplot as plt
-import numpy as np
+import heapq
+import math
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import BoundedSemaphore
+from urllib.parse import urlparse
+
 import telebot
 from telebot import types
 from telebot.types import ReplyKeyboardRemove
 from telebot.types import ReplyKeyboardMarkup, KeyboardButton
 
-bot = telebot.TeleBot("BOTS_TOKEN")
+from chart_cache import ChartCache
+from flows import (VALUE_SEPARATOR, BulkInputError, Field, Flow, FlowEngine,
+                   finite_float, non_negative, parse_bulk)
+from outbound import OutboundQueue, QueuedTeleBot
+from render_pool import RenderQueueFull, RenderService
+from router import Router
+from sessions import SessionStore
+from transport import BotTransport
+from webhook import WebhookServer
+
+# Общий лимит Telegram на отправку сообщений в секунду
+SEND_RATE = 30
+
+# Лимит отправки в один чат в секунду и количество сообщений подряд
+CHAT_SEND_RATE = 1
+CHAT_SEND_BURST = 3
+
+# Количество потоков отправки сообщений
+SEND_WORKERS = 4
+
+# Количество потоков обработчиков обновлений
+HANDLER_THREADS = 2
+
+# Очередь исходящих сообщений с учетом лимитов Telegram
+outbound = OutboundQueue(
+    rate=SEND_RATE, chat_rate=CHAT_SEND_RATE, chat_burst=CHAT_SEND_BURST,
+    workers=SEND_WORKERS)
+
+bot = QueuedTeleBot(os.environ.get("BOT_TOKEN", "BOTS_TOKEN"), outbound,
+                    num_threads=HANDLER_THREADS)
+
+# Публичный адрес для режима webhook, например
+# https://bot.example.com/telegram (пустая строка - long polling)
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "")
+
+# Адрес и порт встроенного HTTP-сервера в режиме webhook
+WEBHOOK_LISTEN = os.environ.get("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", 8443))
+
+# Секрет, который Telegram передает в заголовке каждого запроса
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET") or None
+
+# Потоки обработки обновлений в режиме webhook и размер очереди каждого
+WEBHOOK_WORKERS = int(os.environ.get("WEBHOOK_WORKERS", 4))
+WEBHOOK_QUEUE_SIZE = int(os.environ.get("WEBHOOK_QUEUE_SIZE", 256))
+
+# Среда выполнения: "threads" - потоки telebot, "asyncio" - цикл событий
+# (нужен aiohttp)
+BOT_RUNTIME = os.environ.get("BOT_RUNTIME", "threads")
+
+# Потоки обработчиков и максимальное количество обновлений в работе
+# для BOT_RUNTIME=asyncio
+ASYNC_HANDLER_THREADS = int(os.environ.get("ASYNC_HANDLER_THREADS", 16))
+ASYNC_MAX_UPDATES = int(os.environ.get("ASYNC_MAX_UPDATES", 1000))
+
+# Потоки, в которых скачиваются и рассчитываются присланные файлы, и
+# максимальное количество CSV-файлов в очереди на расчет
+FILE_WORKERS = int(os.environ.get("FILE_WORKERS", 2))
+BATCH_QUEUE_SIZE = int(os.environ.get("BATCH_QUEUE_SIZE", 8))
+
+# Пул для работы с файлами: обработчик только ставит файл в очередь
+file_executor = ThreadPoolExecutor(
+    max_workers=FILE_WORKERS, thread_name_prefix="files")
+
+# Свободные места в очереди CSV-файлов
+batch_slots = BoundedSemaphore(BATCH_QUEUE_SIZE)
+
+# Потоки обработчиков обновлений в выбранной среде выполнения
+if BOT_RUNTIME == "asyncio":
+    UPDATE_THREADS = ASYNC_HANDLER_THREADS
+elif WEBHOOK_URL:
+    UPDATE_THREADS = WEBHOOK_WORKERS
+else:
+    UPDATE_THREADS = HANDLER_THREADS
+
+# Размер пула постоянных соединений с Bot API: потоки отправки, потоки
+# обработчиков выбранного режима, потоки работы с файлами и поток
+# получения обновлений
+HTTP_POOL_SIZE = int(os.environ.get(
+    "HTTP_POOL_SIZE",
+    SEND_WORKERS + UPDATE_THREADS + FILE_WORKERS + 1))
+
+# Транспорт запросов к Bot API; подключается при запуске бота
+transport = BotTransport(pool_size=HTTP_POOL_SIZE)
+
+# Количество процессов для построения графиков
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", os.cpu_count() or 1))
+
+# Максимальное количество графиков в очереди на построение
+RENDER_QUEUE_SIZE = int(os.environ.get("RENDER_QUEUE_SIZE", 32))
+
+# Максимальное время прогрева процессов построения графиков в секундах
+RENDER_WARM_UP_TIMEOUT = 60
+
+# Сервис построения графиков в отдельных процессах
+render_service = RenderService(
+    max_workers=RENDER_WORKERS, queue_size=RENDER_QUEUE_SIZE)
+
+# Максимальное количество графиков каждого типа в кэше file_id
+KPV_CACHE_SIZE = 1024
+
+# Ответ, когда очередь на построение графиков заполнена
+CHARTS_BUSY = "Сейчас строится слишком много графиков."\
+    " Пожалуйста, попробуйте позже."
+
+# Ответ, когда график не удалось построить
+CHART_FAILED = "Не удалось построить график для этих значений."
+
+# Кэш уже отправленных графиков КПВ
+kpv_chart_cache = ChartCache(maxsize=KPV_CACHE_SIZE)
+
+# Отправлять график вместе с точкой рыночного равновесия
+# (EQUILIBRIUM_CHARTS=0 - только текст)
+EQUILIBRIUM_CHARTS = os.environ.get("EQUILIBRIUM_CHARTS", "1") != "0"
+
+# Кэш уже отправленных графиков рыночного равновесия
+equilibrium_chart_cache = ChartCache(maxsize=KPV_CACHE_SIZE)
+
+# Файл для сохранения состояния задач между перезапусками
+# (пустая строка - хранить состояние только в памяти)
+STATE_DB_PATH = os.environ.get("STATE_DB_PATH", "state.sqlite3")
+
+# Время жизни незавершенной задачи в секундах
+FLOW_STATE_TTL = 60 * 60
+
+# Максимальное количество одновременно решаемых задач
+MAX_FLOW_STATES = 10000
+
+# Движок многошаговых задач; состояние каждого чата хранится отдельно
+flow_engine = FlowEngine(
+    bot,
+    SessionStore(ttl=FLOW_STATE_TTL, max_sessions=MAX_FLOW_STATES),
+    on_back=lambda message: handle_back_button(message),
+    read_document=lambda message: read_text_document(message),
+    executor=file_executor,
+)
+
+# Маршрутизатор текстовых сообщений: кнопки меню и команды
+router = Router()
+
+
+# Обработчик всех текстовых сообщений. Во время решения задачи весь ввод,
+# кроме команд и кнопок меню, попадает в нее, иначе обработчик выбирается
+# маршрутизатором.
+@bot.message_handler(content_types=["text"])
+def handle_text(message):
+    """
+    Обработчик текстовых сообщений.
+
+    Args:
+    - message (types.Message): Объект сообщения пользователя.
+
+    Returns:
+        None
+    """
+    # Команды выполняются без состояния и не прерывают начатую задачу, а
+    # кнопка меню, нажатая посреди задачи, начинает выбранную задачу
+    if not router.routes(message.text) and flow_engine.handle(message):
+        return
+    router.dispatch(message)
+
+
+# Обработчик нетекстового ввода для начатой задачи. Зарегистрирован раньше
+# обработчиков файлов, чтобы задача сообщила о некорректном вводе.
+@bot.message_handler(
+    func=lambda message: flow_engine.is_active(message.chat.id),
+    content_types=["photo",
+                   "sticker",
+                   "location",
+                   "contact",
+                   "document",
+                   "video",
+                   "audio",
+                   "voice"],
+)
+def handle_flow_input(message):
+    """
+    Передает сообщение движку задач для заполнения текущего поля.
+
+    Args:
+    - message (types.Message): Объект сообщения пользователя.
+
+    Returns:
+        None
+    """
+    flow_engine.handle(message)
 
 
-@bot.message_handler(commands=["start", "help"])
+@router.command("start", "help")
 def handle_start(message):
     """
     Обработчик команды /start
@@ -19,6 +212,9 @@ def handle_start(message):
     Returns:
         None
     """
+    # Возврат в меню прерывает начатую задачу
+    flow_engine.cancel(message.chat.id)
+
     bot.reply_to(
         message,
         "Привет, я бот для решения экономических задач🤓."\
@@ -36,10 +232,17 @@ def handle_start(message):
     keyboard.add(button1, button2, button3, button4)
 
     # Отправляем клавиатуру с сообщением
-    bot.send_message(message.chat.id, "Выберите опцию:", 
+    bot.send_message(message.chat.id, "Выберите опцию:",
         reply_markup=keyboard)
 
 
+# Фотография, которой бот отвечает на фотографию пользователя
+PHOTO_FILE = "f.jpg"
+
+# file_id уже загруженных в Telegram фотографий по имени файла
+uploaded_photos = {}
+
+
 @bot.message_handler(content_types=["photo"])
 def handle_photo(message):
     """
@@ -51,15 +254,177 @@ def handle_photo(message):
     Returns:
         None
     """
+    chat_id = message.chat.id
+    file_id = uploaded_photos.get(PHOTO_FILE)
+    if file_id is not None:
+        bot.send_photo(chat_id, file_id)
+        return
+
     try:
-        photo = open("f.jpg", "rb")
-        bot.send_photo(message.chat.id, photo)
-        photo.close()
-    except Exception as e:
+        with open(PHOTO_FILE, "rb") as photo:
+            data = photo.read()
+    except OSError as e:
         bot.send_message(
-            message.chat.id, f"Произошла ошибка при обработке изображения:"\
-            " {e}"
-        )
+            chat_id, f"Произошла ошибка при обработке изображения: {e}")
+        return
+
+    def remember(sent):
+        if sent.exception() is None:
+            uploaded_photos[PHOTO_FILE] = sent.result().photo[-1].file_id
+
+    # Фотография загружается один раз, дальше отправляется по file_id;
+    # обработчик не ждет загрузки
+    bot.send_photo(chat_id, data).add_done_callback(remember)
+
+
+# Максимальный размер CSV-файла для пакетного расчета (ограничение
+# Telegram на скачивание файлов ботом - 20 МБ)
+MAX_BATCH_FILE_SIZE = 20 * 1024 * 1024
+
+# Размер результата пакетного расчета, после которого он записывается
+# во временный файл на диске, а не хранится в памяти
+BATCH_SPOOL_SIZE = 1024 * 1024
+
+
+def stream_file(file_path, chunk_size=64 * 1024):
+    """
+    Скачивает файл из Telegram по частям.
+
+    Args:
+    - file_path (str): Путь к файлу на серверах Telegram (File.file_path).
+    - chunk_size (int): Размер части в байтах.
+
+    Returns:
+    - Iterator[bytes]: Части файла.
+    """
+    if telebot.apihelper.FILE_URL is None:
+        url = "https://api.telegram.org/file/bot{0}/{1}"\
+            .format(bot.token, file_path)
+    else:
+        url = telebot.apihelper.FILE_URL.format(bot.token, file_path)
+
+    with transport.session.get(url, stream=True, timeout=(3.05, 60),
+                               proxies=telebot.apihelper.proxy) as response:
+        response.raise_for_status()
+        yield from response.iter_content(chunk_size)
+
+
+def read_text_document(message):
+    """
+    Скачивает небольшой текстовый файл, присланный в ходе задачи.
+
+    Args:
+    - message (types.Message): Сообщение пользователя с файлом.
+
+    Returns:
+    - str: Текст файла.
+
+    Raises:
+    - ValueError: Если файл слишком большой или не в кодировке UTF-8.
+    """
+    if (message.document.file_size or 0) > MAX_COSTS_FILE_SIZE:
+        raise ValueError("Файл слишком большой (максимум 1 МБ).")
+    file_info = bot.get_file(message.document.file_id)
+    try:
+        return b"".join(stream_file(file_info.file_path))\
+            .decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise ValueError("Файл должен быть в кодировке UTF-8.")
+
+
+# Обработчик CSV-файлов для пакетного расчета
+@bot.message_handler(
+    func=lambda message: (message.document.file_name or "")
+    .lower().endswith(".csv"),
+    content_types=["document"],
+)
+def handle_batch_document(message):
+    """
+    Обработчик CSV-файла с коэффициентами многих рынков.
+
+    Строки из 4 столбцов (A, B, C, D) рассчитываются как рыночное
+    равновесие, из 5 столбцов (A, B, C, D, E) - как дефицит/излишек, из
+    2 столбцов (A, Б - объемы производителей) - как общая КПВ.
+    Файл скачивается, рассчитывается и записывается по частям, а результат
+    отправляется пользователю CSV-файлом.
+
+    Args:
+    - message (types.Message): Объект сообщения пользователя.
+
+    Returns:
+        None
+    """
+    if (message.document.file_size or 0) > MAX_BATCH_FILE_SIZE:
+        bot.reply_to(message, "Файл слишком большой (максимум 20 МБ).")
+        return
+    if not batch_slots.acquire(blocking=False):
+        bot.reply_to(message, "Сейчас рассчитывается слишком много файлов."
+                     " Пожалуйста, попробуйте позже.")
+        return
+
+    def finished(future):
+        batch_slots.release()
+        if future.exception() is not None:
+            print(future.exception())
+
+    # Файл скачивается и рассчитывается в пуле, не занимая поток
+    # обработчика
+    file_executor.submit(process_batch_document, message)\
+        .add_done_callback(finished)
+
+
+def process_batch_document(message):
+    """
+    Скачивает CSV-файл, рассчитывает его и отправляет результат.
+
+    Args:
+    - message (types.Message): Сообщение пользователя с CSV-файлом.
+
+    Returns:
+        None
+    """
+    # Модуль с numpy загружается только при первом пакетном расчете
+    from batch import process_csv
+
+    output = tempfile.SpooledTemporaryFile(max_size=BATCH_SPOOL_SIZE)
+    try:
+        file_info = bot.get_file(message.document.file_id)
+        columns, rows, invalid, frontier = process_csv(
+            stream_file(file_info.file_path), output)
+    except (UnicodeDecodeError, ValueError) as e:
+        output.close()
+        bot.reply_to(
+            message,
+            f"Не удалось прочитать CSV-файл: {e} Каждая строка должна"\
+            " содержать коэффициенты A, B, C, D (равновесие),"\
+            " A, B, C, D, E (дефицит/излишек) или объемы A, Б"\
+            " одного производителя (КПВ).")
+        return
+    except Exception:
+        output.close()
+        raise
+
+    if columns == 2:
+        name = "kpv.csv"
+        caption = f"Производителей: {rows}. С отрицательными"\
+            f" объемами (пропущены): {invalid}."
+    elif columns == 4:
+        name = "equilibrium.csv"
+        caption = f"Рассчитано рынков: {rows}. Без равновесия"\
+            f" (D + B = 0 или не конечные значения): {invalid}."
+    else:
+        name = "deficit_surplus.csv"
+        caption = f"Рассчитано рынков: {rows}. С отрицательной"\
+            f" ценой (E < 0) или не конечными значениями: {invalid}."
+
+    output.seek(0)
+    # Временный файл удаляется после отправки
+    bot.send_document(message.chat.id, output, caption=caption,
+                      visible_file_name=name)\
+        .add_done_callback(lambda future: output.close())
+
+    if frontier is not None:
+        send_kpv_frontier_chart(message.chat.id, *frontier)
 
 
 # Обработчик для остальных типов файлов
@@ -90,44 +455,25 @@ def handle_other_types(message):
         "Извините, но обработка этого типа файла не поддерживается.")
 
 
-# Обработчик нажатия на кнопку "Нахождение точки рыночного равновесия"
-@bot.message_handler(
-    func=lambda message: message.text == "Нахождение точки рыночного"\
-    " равновесия",
-    content_types=["text"],
-)
-def handle_market_equilibrium_start(message):
+def make_back_keyboard():
     """
-    Обработчик нажатия на кнопку "Нахождение точки рыночного равновесия".
-
-    Args:
-    - message (types.Message): Объект сообщения пользователя.
+    Создает клавиатуру с кнопкой "Назад".
 
     Returns:
-        None
+    - types.ReplyKeyboardMarkup: Клавиатура.
     """
-    remove_keyboard = types.ReplyKeyboardRemove()
-
-    # Клавиатура с кнопкой "Назад"
     back_keyboard = types.ReplyKeyboardMarkup(
         row_width=1, resize_keyboard=True)
     back_button = types.KeyboardButton("Назад")
     back_keyboard.add(back_button)
-
-    bot.send_message(
-        message.chat.id,
-        "Переменные являются коэффициентами в соответствующих функциях "\
-        "спроса и предложения: Qd = A - B*P. Qs =C + D*P.",
-        reply_markup=back_keyboard)
-    bot.send_message(
-        message.chat.id, "Введите коэффициент A:")
-    bot.register_next_step_handler(
-        message, get_coefficient_A_market_equilibrium)
+    return back_keyboard
 
 
-def get_coefficient_A_market_equilibrium(message):
+# Обработчик нажатия на кнопку "Нахождение точки рыночного равновесия"
+@router.text("Нахождение точки рыночного равновесия")
+def handle_market_equilibrium_start(message):
     """
-    Получение коэффициента A для нахождения точки рыночного равновесия.
+    Обработчик нажатия на кнопку "Нахождение точки рыночного равновесия".
 
     Args:
     - message (types.Message): Объект сообщения пользователя.
@@ -135,190 +481,65 @@ def get_coefficient_A_market_equilibrium(message):
     Returns:
         None
     """
-    try:
-        if message.text is not None:
-            if message.text == "Назад":
-                handle_back_button(message)
-                return
-
-            A = float(message.text)
+    flow_engine.start(message, "market_equilibrium")
 
-            
 
-            bot.send_message(message.chat.id, "Введите коэффициент B:")
-            bot.register_next_step_handler(
-                message, get_coefficient_B_market_equilibrium, A
-            )
-        else:
-            bot.send_message(message.chat.id,
-                             "Пожалуйста, введите числовое значение.")
-            bot.register_next_step_handler(
-                message, get_coefficient_A_market_equilibrium
-            )
-    except ValueError:
-        bot.send_message(
-            message.chat.id,
-            "Пожалуйста, введите числовое значение.")
-        bot.register_next_step_handler(
-            message, get_coefficient_A_market_equilibrium)
+# Ответ, когда результат расчета не помещается в число
+TOO_LARGE = "Значения слишком велики для расчета."
 
 
-def get_coefficient_B_market_equilibrium(message, A):
+def send_market_equilibrium(message, values):
     """
-    Получение коэффициента B для нахождения точки рыночного равновесия.
+    Рассчитывает точку рыночного равновесия и отправляет ответ.
 
     Args:
     - message (types.Message): Объект сообщения пользователя.
-    - A (float): Коэффициент A.
+    - values (dict): Коэффициенты A, B, C и D.
 
     Returns:
         None
     """
     try:
-        if message.text is not None:
-            if message.text == "Назад":
-                handle_back_button(message)
-                return
-
-            B = float(message.text)
-
-            
-
-            bot.send_message(message.chat.id, "Введите коэффициент C:")
-            bot.register_next_step_handler(
-                message,
-                get_coefficient_C_market_equilibrium,
-                A,
-                B,
-            )
-        else:
-            bot.send_message(message.chat.id,
-                             "Пожалуйста, введите числовое значение.")
-            bot.register_next_step_handler(
-                message, get_coefficient_B_market_equilibrium, A
-            )
-    except ValueError:
-        bot.send_message(
+        # Рассчитываем равновесную цену (P*) и объем (Q*)
+        price, value = calculate_market_equilibrium(
+            values["A"], values["B"], values["C"], values["D"])
+    except ZeroDivisionError:
+        # Обработка ошибки деления на ноль
+        bot.send_message(message.chat.id, "Ошибка: Деление на ноль"\
+            " невозможно")
+        handle_back_button(message)
+        return
+    except OverflowError:
+        bot.send_message(message.chat.id, TOO_LARGE)
+        return
+
+    # Отправляем ответ
+    bot.send_message(message.chat.id,
+                     format_market_equilibrium(price, value))
+    if EQUILIBRIUM_CHARTS:
+        send_cached_chart(
             message.chat.id,
-            "Пожалуйста, введите числовое значение.")
-        bot.register_next_step_handler(
-            message, get_coefficient_B_market_equilibrium, A
+            equilibrium_chart_cache,
+            "market_equilibrium",
+            values["A"], values["B"], values["C"], values["D"],
         )
 
 
-def get_coefficient_C_market_equilibrium(
-        message, A, B):
-    """
-    Получение коэффициента C для нахождения точки рыночного равновесия.
-
-    Args:
-    - message (types.Message): Объект сообщения пользователя.
-    - A (float): Коэффициент A.
-    - B (float): Коэффициент B.
-
-    Returns:
-        None
+def format_market_equilibrium(price, value):
     """
-    try:
-        if message.text is not None:
-            if message.text == "Назад":
-                handle_back_button(message)
-                return
-
-            C = float(message.text)
-
-            
-            bot.send_message(message.chat.id, "Введите коэффициент D:")
-            bot.register_next_step_handler(
-                message,
-                get_coefficient_D_market_equilibrium,
-                A,
-                B,
-                C,
-            )
-        else:
-            bot.send_message(message.chat.id,
-                             "Пожалуйста, введите числовое значение.")
-            bot.register_next_step_handler(
-                message,
-                get_coefficient_C_market_equilibrium,
-                A,
-                B,
-            )
-    except ValueError:
-        bot.send_message(
-            message.chat.id,
-            "Пожалуйста, введите числовое значение.")
-        bot.register_next_step_handler(
-            message,
-            get_coefficient_C_market_equilibrium,
-            A,
-            B)
+    Формирует текст ответа о точке рыночного равновесия.
 
-
-def get_coefficient_D_market_equilibrium(
-    message, A, B, C
-):
-    """
-    Получение коэффициента D для нахождения точки рыночного равновесия.
+    Посчитал, что логичнее будет округлить объём до целых, а цену до сотых.
 
     Args:
-    - message (types.Message): Объект сообщения пользователя.
-    - A (float): Коэффициент A.
-    - B (float): Коэффициент B.
-    - C (float): Коэффициент C.
+    - price (float): Равновесная цена.
+    - value (float): Равновесный объем.
 
     Returns:
-        None
+    - str: Текст ответа.
     """
-    try:
-        if message.text is not None:
-            if message.text == "Назад":
-                handle_back_button(message)
-                return
-
-            D = float(message.text)
-
-            try:
-                # Рассчитываем равновесную цену (P*) и объем (Q*)
-                price, value = calculate_market_equilibrium(
-                    A, B, C, D)
-
-                # Отправляем ответ
-                """
-                Посчитал, что логичнее будет округлить объём до целых, а 
-                цену до сотых.
-                """
-                response = f"Рыночное равновесие:\nЦена (P*): "\
-                f"{round(price, 2)}\nОбъем (Q*): {round(value)}"
-                bot.send_message(message.chat.id, response)
-
-            except ZeroDivisionError as e:
-                # Обработка ошибки деления на ноль
-                bot.send_message(message.chat.id, "Ошибка: Деление на ноль"\
-                    " невозможно")
-                handle_back_button(message)
-        else:
-            bot.send_message(message.chat.id,
-                             "Пожалуйста, введите числовое значение.")
-            bot.register_next_step_handler(
-                message,
-                get_coefficient_D_market_equilibrium,
-                A,
-                B,
-                C,
-            )
-    except ValueError:
-        bot.send_message(
-            message.chat.id,
-            "Пожалуйста, введите числовое значение.")
-        bot.register_next_step_handler(
-            message,
-            get_coefficient_D_market_equilibrium,
-            A,
-            B,
-            C,
-        )
+    return f"Рыночное равновесие:\nЦена (P*): "\
+        f"{round(price, 2)}\nОбъем (Q*): {round(value)}"
 
 
 def calculate_market_equilibrium(A, B, C, D):
@@ -333,6 +554,10 @@ def calculate_market_equilibrium(A, B, C, D):
 
     Returns:
     - Tuple[float, float]: Равновесная цена и объем.
+
+    Raises:
+    - ZeroDivisionError: Если D + B = 0.
+    - OverflowError: Если цена или объем не конечны.
     """
 
     # Проверка на деление на ноль
@@ -342,48 +567,47 @@ def calculate_market_equilibrium(A, B, C, D):
 
     # Рассчитываем равновесную цену (P*) и объем (Q*)
     price = (A - C) / (D + B)
-    value = A - B * price 
+    value = A - B * price
+    if not (math.isfinite(price) and math.isfinite(value)):
+        raise OverflowError("Равновесие вне диапазона чисел.")
 
     return price, value
 
 
-# Обработчик нажатия на кнопку "Расчет объема дефицита/излишка"
-@bot.message_handler(
-    func=lambda message: message.text == "Расчет объема дефицита/излишка",
-    content_types=["text"],
-)
-def handle_deficit_or_surplus_calculation_start(message):
+def coefficient_fields(names, example):
     """
-    Обработчик нажатия на кнопку "Расчет объема дефицита/излишка".
+    Создает поля ввода коэффициентов. В приглашении к первому полю
+    указано, что все коэффициенты можно ввести одним сообщением.
 
     Args:
-    - message (types.Message): Объект сообщения пользователя.
+    - names (str): Имена коэффициентов по порядку.
+    - example (str): Пример ввода всех коэффициентов сразу.
 
     Returns:
-        None
+    - List[Field]: Поля задачи.
     """
-    # Создаем объект ReplyKeyboardRemove
-    remove_keyboard = types.ReplyKeyboardRemove()
+    fields = [Field(name, f"Введите коэффициент {name}:") for name in names]
+    fields[0].prompt = f"Введите коэффициент {names[0]} (или все"\
+        f" коэффициенты одним сообщением, например: {example}):"
+    return fields
 
-    # Создаем клавиатуру с кнопкой "Назад"
-    back_keyboard = types.ReplyKeyboardMarkup(
-        row_width=1, resize_keyboard=True)
-    back_button = types.KeyboardButton("Назад")
-    back_keyboard.add(back_button)
 
-    bot.send_message(
-        message.chat.id,
-        "Переменные являются коэффициентами в соответствующих функциях"\
-        " спроса и предложения: Qd = A - B*P. Qs = C + D*P.",
-        reply_markup=back_keyboard,
-    )
-    bot.send_message(message.chat.id, "Введите коэффициент A:")
-    bot.register_next_step_handler(message, get_coefficient_A_deficit_surplus)
+flow_engine.add(Flow(
+    "market_equilibrium",
+    coefficient_fields("ABCD", "100 2 10 3"),
+    on_complete=send_market_equilibrium,
+    intro="Переменные являются коэффициентами в соответствующих функциях "\
+    "спроса и предложения: Qd = A - B*P. Qs =C + D*P.",
+    reply_markup=make_back_keyboard(),
+    bulk=True,
+))
 
 
-def get_coefficient_A_deficit_surplus(message):
+# Обработчик нажатия на кнопку "Расчет объема дефицита/излишка"
+@router.text("Расчет объема дефицита/излишка")
+def handle_deficit_or_surplus_calculation_start(message):
     """
-    Получение коэффициента A1 для расчета объема дефицита/излишка.
+    Обработчик нажатия на кнопку "Расчет объема дефицита/излишка".
 
     Args:
     - message (types.Message): Объект сообщения пользователя.
@@ -391,592 +615,296 @@ def get_coefficient_A_deficit_surplus(message):
     Returns:
         None
     """
-    try:
-        if message.text is not None:
-            if message.text == "Назад":
-                handle_back_button(message)
-                return
-
-            A1 = float(message.text)
-
-            bot.send_message(message.chat.id, "Введите коэффициент B:")
-            bot.register_next_step_handler(
-                message, get_coefficient_B_deficit_surplus, A1
-            )
-        else:
-            bot.send_message(message.chat.id,
-                             "Пожалуйста, введите числовое значение.")
-            bot.register_next_step_handler(
-                message, get_coefficient_A_deficit_surplus)
-    except ValueError:
-        bot.send_message(
-            message.chat.id,
-            "Пожалуйста, введите числовое значение.")
-        bot.register_next_step_handler(
-            message, get_coefficient_A_deficit_surplus)
+    flow_engine.start(message, "deficit_surplus")
 
 
-def get_coefficient_B_deficit_surplus(message, A1):
+def calculate_deficit_surplus(A1, B1, C1, D1, price_level):
     """
-    Получение коэффициента B1 для расчета объема дефицита/излишка.
+    Расчет разницы спроса и предложения при заданном уровне цены.
 
     Args:
-    - message (types.Message): Объект сообщения пользователя.
     - A1 (float): Коэффициент A1.
+    - B1 (float): Коэффициент B1.
+    - C1 (float): Коэффициент C1.
+    - D1 (float): Коэффициент D1.
+    - price_level (float): Уровень цены (E).
 
     Returns:
-        None
+    - float: Разница спроса и предложения (больше нуля - дефицит,
+     меньше нуля - излишек).
+
+    Raises:
+    - OverflowError: Если разница не конечна.
     """
-    try:
-        if message.text is not None:
-            if message.text == "Назад":
-                handle_back_button(message)
-                return
-
-            B1 = float(message.text)
-
-            bot.send_message(message.chat.id, "Введите коэффициент C:")
-            bot.register_next_step_handler(
-                message,
-                get_coefficient_C_deficit_surplus,
-                A1,
-                B1)
-        else:
-            bot.send_message(message.chat.id,
-                             "Пожалуйста, введите числовое значение.")
-            bot.register_next_step_handler(
-                message, get_coefficient_B_deficit_surplus, A1
-            )
-    except ValueError:
-        bot.send_message(
-            message.chat.id,
-            "Пожалуйста, введите числовое значение.")
-        bot.register_next_step_handler(
-            message, get_coefficient_B_deficit_surplus, A1
-        )
+    # Рассчитываем спрос и предложение
+    demand = A1 - B1 * price_level
+    supply = C1 + D1 * price_level
+
+    # Рассчитываем разницу спроса и предложений
+    difference = demand - supply
+    if not math.isfinite(difference):
+        raise OverflowError("Разница вне диапазона чисел.")
+    return difference
 
 
-def get_coefficient_C_deficit_surplus(message, A1, B1):
+def format_deficit_surplus(price_level, deficit_or_surplus):
     """
-    Получение коэффициента C1 для расчета объема дефицита/излишка.
+    Формирует текст ответа об объеме дефицита/излишка.
 
     Args:
-    - message (types.Message): Объект сообщения пользователя.
-    - A1 (float): Коэффициент A1.
-    - B1 (float): Коэффициент B1.
+    - price_level (float): Уровень цены (E).
+    - deficit_or_surplus (float): Разница спроса и предложения.
 
     Returns:
-        None
+    - str: Текст ответа.
     """
-    try:
-        if message.text is not None:
-            if message.text == "Назад":
-                handle_back_button(message)
-                return
-
-            C1 = float(message.text)
-
-            bot.send_message(message.chat.id, "Введите коэффициент D:")
-            bot.register_next_step_handler(
-                message,
-                get_coefficient_D_deficit_surplus,
-                A1,
-                B1,
-                C1,
-            )
-        else:
-            bot.send_message(message.chat.id,
-                             "Пожалуйста, введите числовое значение.")
-            bot.register_next_step_handler(
-                message,
-                get_coefficient_C_deficit_surplus,
-                A1,
-                B1)
-    except ValueError:
-        bot.send_message(
-            message.chat.id,
-            "Пожалуйста, введите числовое значение.")
-        bot.register_next_step_handler(
-            message,
-            get_coefficient_C_deficit_surplus,
-            A1,
-            B1)
+    # Определяем ситуацию на рынке
+    if deficit_or_surplus > 0:
+        situation = "дефицита"
+    elif deficit_or_surplus < 0:
+        situation = "излишка"
+    else:
+        situation = "равновесия"
+
+    return f"При уровне цены в {price_level} денежных единицах"\
+        f" на рынке будет ситуация {situation}. Размер дефицита/излишка"\
+        f" составит: {round(abs(deficit_or_surplus), 2)} единиц товара"\
+        f" (при ситуации дефицита/излишка)"
 
 
-def get_coefficient_D_deficit_surplus(
-    message, A1, B1, C1
-):
+def send_deficit_surplus(message, values):
     """
-    Получение коэффициента D1 для расчета объема дефицита/излишка.
+    Рассчитывает объем дефицита/излишка и отправляет ответ.
 
     Args:
     - message (types.Message): Объект сообщения пользователя.
-    - A1 (float): Коэффициент A1.
-    - B1 (float): Коэффициент B1.
-    - C1 (float): Коэффициент C1.
+    - values (dict): Коэффициенты A, B, C, D и уровень цены E.
 
     Returns:
         None
     """
     try:
-        if message.text is not None:
-            if message.text == "Назад":
-                handle_back_button(message)
-                return
-
-            D1 = float(message.text)
-
-            bot.send_message(message.chat.id, "Введите уровень цены (E):")
-            bot.register_next_step_handler(
-                message,
-                get_price_level_deficit_surplus,
-                A1,
-                B1,
-                C1,
-                D1,
-            )
-        else:
-            bot.send_message(message.chat.id,
-                             "Пожалуйста, введите числовое значение.")
-            bot.register_next_step_handler(
-                message,
-                get_coefficient_D_deficit_surplus,
-                A1,
-                B1,
-                C1,
-            )
-    except ValueError:
-        bot.send_message(
-            message.chat.id,
-            "Пожалуйста, введите числовое значение.")
-        bot.register_next_step_handler(
-            message,
-            get_coefficient_D_deficit_surplus,
-            A1,
-            B1,
-            C1,
-        )
+        deficit_or_surplus = calculate_deficit_surplus(
+            values["A"], values["B"], values["C"], values["D"],
+            values["E"])
+    except OverflowError:
+        bot.send_message(message.chat.id, TOO_LARGE)
+        return
+
+    # Отправляем ответ
+    bot.send_message(message.chat.id,
+                     format_deficit_surplus(values["E"], deficit_or_surplus))
+
+
+flow_engine.add(Flow(
+    "deficit_surplus",
+    coefficient_fields("ABCD", "100 2 10 3 15") + [
+        Field(
+            "E",
+            "Введите уровень цены (E):",
+            validators=[non_negative(
+                "Пожалуйста, введите неотрицательное числовое значение"\
+                " для уровня цены (E).")],
+        ),
+    ],
+    on_complete=send_deficit_surplus,
+    intro="Переменные являются коэффициентами в соответствующих функциях"\
+    " спроса и предложения: Qd = A - B*P. Qs = C + D*P.",
+    reply_markup=make_back_keyboard(),
+    bulk=True,
+))
+
+
+# Максимальный размер файла с издержками
+MAX_COSTS_FILE_SIZE = 1024 * 1024
+
+# Количество крупнейших статей издержек, перечисляемых в ответе
+COST_SOURCES_SHOWN = 10
+
+# Строка издержки: название и размер через запятую, точку с запятой,
+# двоеточие, табуляцию (вставка из таблицы) или пробел. Размер стоит в
+# конце строки, может содержать пробелы между разрядами ('1 000') и
+# десятичную запятую, после него допускается валюта ('руб.', 'рублей', '₽')
+COST_LINE = re.compile(
+    r"^\s*(.+?)(?:\s*[,;:\t]\s*|\s+)"
+    r"([-+]?(?:[1-9]\d{0,2}(?:[ \u00a0\u202f]\d{3})+|0|[1-9]\d*)"
+    r"(?:[.,]\d+)?)\s*(?:(?:руб(?:л[а-яё]*|\.)?|р\.?|₽)\s*)?$",
+    re.IGNORECASE)
 
 
-def get_price_level_deficit_surplus(
-    message, A1, B1, C1, D1
-):
+# Обработчик нажатия на кнопку "Расчет прибыли фирмы"
+@router.text("Расчет прибыли фирмы")
+def handle_profit_calculation_start(message):
     """
-    Получение уровня цены для расчета объема дефицита/излишка.
+    Обработчик нажатия на кнопку "Расчет прибыли фирмы".
 
     Args:
     - message (types.Message): Объект сообщения пользователя.
-    - A1 (float): Коэффициент A1.
-    - B1 (float): Коэффициент B1.
-    - C1 (float): Коэффициент C1.
-    - D1 (float): Коэффициент D1.
-    
+
     Returns:
         None
     """
-    try:
-        if message.text is not None:
-            if message.text == "Назад":
-                handle_back_button(message)
-                return
-
-            price_level = float(message.text)
-
-            # Проверка на отрицательное значение
-            if price_level < 0:
-                bot.send_message(
-                    message.chat.id,
-                    "Пожалуйста, введите неотрицательное числовое значение"\
-                    " для уровня цены (E).",
-                )
-                bot.register_next_step_handler(
-                    message,
-                    get_price_level_deficit_surplus,
-                    A1,
-                    B1,
-                    C1,
-                    D1,
-                )
-                return
-
-            # Рассчитываем спрос и предложение
-            demand = A1 - B1 * price_level
-            supply = C1 + D1 * price_level
-
-            # Рассчитываем разницу спроса и предложений
-            deficit_or_surplus = demand - supply
-
-            # Определяем ситуацию на рынке
-            if deficit_or_surplus > 0:
-                situation = "дефицита"
-            elif deficit_or_surplus < 0:
-                situation = "излишка"
-            else:
-                situation = "равновесия"
-
-            # Отправляем ответ
-            response = f"При уровне цены в {price_level} денежных единицах"\
-            f" на рынке будет ситуация {situation}. Размер дефицита/излишка"\
-            f" составит: {round(abs(deficit_or_surplus), 2)} единиц товара"\
-            f" (при ситуации дефицита/излишка)"
-            bot.send_message(message.chat.id, response)
-        else:
-            bot.send_message(message.chat.id,
-                             "Пожалуйста, введите числовое значение.")
-            bot.register_next_step_handler(
-                message,
-                get_price_level_deficit_surplus,
-                A1,
-                B1,
-                C1,
-                D1,
-            )
-    except ValueError:
-        bot.send_message(
-            message.chat.id,
-            "Пожалуйста, введите числовое значение.")
-        bot.register_next_step_handler(
-            message,
-            get_price_level_deficit_surplus,
-            A1,
-            B1,
-            C1,
-            D1,
-        )
+    flow_engine.start(message, "profit")
 
 
-# Словарь для хранения издержек
-costs = {"переменные": [], "постоянные": []}
+def parse_cost(text):
+    """
+    Разбирает издержку в формате 'Название издержки, размер издержки'.
 
-# Максимальное количество издержек
-MAX_COSTS = 5
+    Логичнее брать переменные с типом float для "издержек". Вместо
+    запятой допускаются точка с запятой, двоеточие, табуляция или пробел,
+    а в размере - десятичная запятая и пробелы между разрядами
+    ('Сырье; 20,5', 'Аренда 1 000 рублей'). Строка, в конце которой нет
+    размера, не принимается.
 
+    Args:
+    - text (str): Строка сообщения пользователя.
 
-# Обработчик нажатия на кнопку "Расчет прибыли фирмы"
-@bot.message_handler(func=lambda message: message.text ==
-                     "Расчет прибыли фирмы", content_types=["text"])
-def handle_profit_calculation_start(message):
+    Returns:
+    - Tuple[str, float]: Название и размер издержки.
+
+    Raises:
+    - ValueError: При некорректном формате.
     """
-    Обработчик нажатия на кнопку "Расчет прибыли фирмы".
+    match = COST_LINE.match(text)
+    if match is None:
+        raise ValueError(text)
+    name, amount = match.groups()
+    amount = re.sub(r"[ \u00a0\u202f]", "", amount)
+    return name, float(amount.replace(",", "."))
 
-    Args:
-    - message (types.Message): Объект сообщения пользователя.
-    
-    Returns:
-        None
+
+def collect_costs(costs, items):
     """
-    if message is not None:
-        # Создаем объект ReplyKeyboardRemove
-        remove_keyboard = types.ReplyKeyboardRemove()
+    Добавляет издержки к собранным.
 
-        # Создаем клавиатуру с кнопкой "Назад"
-        back_keyboard = types.ReplyKeyboardMarkup(
-            row_width=1, resize_keyboard=True)
-        back_button = types.KeyboardButton("Назад")
-        back_keyboard.add(back_button)
-
-        if message.text == "Назад":
-            handle_back_button(message)
-            return
-        bot.send_message(
-            message.chat.id,
-            "Для расчета прибыли фирмы введите следующие данные:",
-            reply_markup=back_keyboard,
-        )
-        bot.send_message(
-            message.chat.id,
-            "1. Объем производства в штуках (Q):")
-        bot.register_next_step_handler(message, get_firm_production_volume)
-
-
-def get_firm_production_volume(message):
-    """
-    Получение объема производства для расчета прибыли фирмы.
+    Итоговая сумма и суммы по статьям обновляются по мере ввода, поэтому
+    расчет прибыли не пересчитывает весь список. Издержки с одинаковым
+    названием складываются в одну статью.
 
     Args:
-    - message (types.Message): Объект сообщения пользователя.
-    
-    Returns:
-        None
-    """
-    try:
-        if message.text is not None:
-            if message.text == "Назад":
-                handle_back_button(message)
-                return
-
-            Q = int(message.text)
-
-            # Проверка на отрицательное значение
-            if Q < 0:
-                bot.send_message(
-                    message.chat.id,
-                    "Пожалуйста, введите неотрицательное числовое значение"\
-                    " для объема производства.",
-                )
-                bot.register_next_step_handler(
-                    message, get_firm_production_volume)
-                return
-
-            bot.send_message(message.chat.id,
-                             "2. Цена за единицу товара (P) в рублях:")
-            bot.register_next_step_handler(message, get_unit_price, Q)
-        else:
-            bot.send_message(message.chat.id,
-                             "Пожалуйста, введите целое числовое значение.")
-            bot.register_next_step_handler(message, 
-                get_firm_production_volume)
-    except ValueError:
-        bot.send_message(
-            message.chat.id,
-            "Некорректный ввод. Введите целое числовое значение для объема"\
-            " производства.",
-        )
-        bot.register_next_step_handler(message, get_firm_production_volume)
-
-
-def get_unit_price(message, Q):
-    """
-    Получение цены за единицу товара для расчета прибыли фирмы.
+    - costs (Optional[dict]): Собранные издержки: сумма (total),
+     количество (count) и суммы по статьям (items).
+    - items (List[Tuple[str, float]]): Новые издержки.
 
-    Args:
-    - message (types.Message): Объект сообщения пользователя.
-    - Q (int): Объем производства.
-    
     Returns:
-        None
+    - dict: Собранные издержки.
     """
-    try:
-        if message.text is not None:
-            if message.text == "Назад":
-                handle_back_button(message)
-                return
-            """
-            Посчитал логичным сделать цену за 1 штуку товара переменной типа
-            float 
-            """
-            P = float(message.text)
-
-            # Проверка на отрицательное значение
-            if P < 0:
-                bot.send_message(
-                    message.chat.id,
-                    "Пожалуйста, введите неотрицательное числовое значение"\
-                    " для цены за единицу товара.",
-                )
-                bot.register_next_step_handler(message, get_unit_price, Q)
-                return
-
-            bot.send_message(
-                message.chat.id,
-                f"3. Постоянные издержки (FC) в рублях. Пожалуйста,"\
-                f" введите данные в формате 'Название"\
-                f" издержки, размер издержки'. (введите"\
-                f" 'готово' для завершения, максимум {MAX_COSTS} издержек):",
-            )
-            bot.register_next_step_handler(message, get_fixed_costs, Q, P)
-        else:
-            bot.send_message(message.chat.id,
-                             "Пожалуйста, введите числовое значение.")
-            bot.register_next_step_handler(message, get_unit_price, Q)
-    except ValueError:
-        bot.send_message(
-            message.chat.id,
-            "Некорректный ввод. Введите числовое значение для цены за"\
-            " единицу товара.",
-        )
-        bot.register_next_step_handler(message, get_unit_price, Q)
+    if not isinstance(costs, dict):
+        # Состояние задачи, сохраненное до появления сводки, хранит
+        # список пар
+        items = [tuple(item) for item in costs or []] + list(items)
+        costs = {"total": 0.0, "count": 0, "items": {}}
 
+    by_name = costs["items"]
+    for name, amount in items:
+        by_name[name] = by_name.get(name, 0.0) + amount
+        costs["total"] += amount
+    costs["count"] += len(items)
+    return costs
 
-def get_fixed_costs(message, Q, P):
-    """
-    Получение постоянных издержек для расчета прибыли фирмы.
 
-    Args:
-    - message (types.Message): Объект сообщения пользователя.
-    - Q (int): Объем производства.
-    - P (float): Цена за единицу товара.
-    
-    Returns:
-        None
+def cost_field(name, prompt, cost_type):
     """
-    try:
-        if message.text is not None:
-            if message.text == "Назад":
-                handle_back_button(message)
-                return
-            if message.text.lower() == "готово":
-                bot.send_message(
-                    message.chat.id,
-                    f"4. Переменные издержки (VC) в рублях. Пожалуйста,"\
-                    f" введите данные в формате 'Название издержки, размер"\
-                    f" издержки'.  (введите 'готово'"\
-                    f" для завершения, максимум {MAX_COSTS} издержек):",
-                )
-                bot.register_next_step_handler(message, get_variable_costs,
-                 Q, P)
-            else:
-                handle_costs_input(message, Q, P, "постоянные")
-        else:
-            bot.send_message(
-                message.chat.id,
-                "Пожалуйста, введите числовое значение.")
-            bot.register_next_step_handler(message, get_fixed_costs, Q, P)
-    except ValueError:
-        bot.send_message(
-            message.chat.id,
-            "Некорректный ввод. Введите числовое значение для цены за"\
-            " единицу издержки.",
-        )
-        bot.register_next_step_handler(message, get_fixed_costs, Q, P)
-
+    Создает повторяемое поле для ввода издержек.
 
-def get_variable_costs(message, Q, P):
-    """
-    Получение переменных издержек для расчета прибыли фирмы.
+    Издержки вводятся по одной на строке: одним сообщением, несколькими
+    сообщениями или текстовым файлом.
 
     Args:
-    - message (types.Message): Объект сообщения пользователя.
-    - Q (int): Объем производства.
-    - P (float): Цена за единицу товара.
-    
+    - name (str): Имя значения в собранных данных.
+    - prompt (str): Приглашение к вводу.
+    - cost_type (str): Тип издержек ('постоянные' или 'переменные').
+
     Returns:
-        None
+    - Field: Поле задачи.
     """
-    try:
-        if message.text is not None:
-            if message.text == "Назад":
-                handle_back_button(message)
-                return
-            if message.text.lower() == "готово":
-                calculate_and_send_response(message, Q, P)
-            else:
-                handle_costs_input(message, Q, P, "переменные")
+    def added(items, costs):
+        if len(items) == 1:
+            head = f"Добавлены {cost_type} издержки:"\
+                f" {items[0][0]}, {items[0][1]}."
         else:
-            bot.send_message(
-                message.chat.id,
-                "Пожалуйста, введите числовое значение.")
-            bot.register_next_step_handler(message, get_variable_costs, Q, P)
-    except ValueError:
-        bot.send_message(
-            message.chat.id,
-            "Некорректный ввод. Введите числовое значение для цены за"\
-            " единицу и.",
-        )
-        bot.register_next_step_handler(message, get_variable_costs, Q, P)
+            head = f"Добавлено строк: {len(items)} на сумму"\
+                f" {round(sum(amount for _, amount in items), 2)} руб."
+        return f"{head} Итого {cost_type}: {round(costs['total'], 2)}"\
+            " руб. Введите следующие или 'Готово'."
+
+    return Field(
+        name,
+        prompt,
+        parse=parse_cost,
+        error="Некорректный ввод. Пожалуйста, введите данные в формате"\
+        " 'Название издержки, размер издержки'.",
+        validators=[(
+            lambda cost: cost[1] >= 0,
+            "Пожалуйста, введите неотрицательное числовое"\
+            " значение для издержек.",
+        )],
+        repeat=True,
+        multiline=True,
+        collect=collect_costs,
+        added=added,
+    )
 
 
-def handle_costs_input(message, Q, P, cost_type):
+def format_cost_sources(costs, template):
     """
-    Обработка ввода издержек для расчета прибыли фирмы.
+    Перечисляет крупнейшие статьи издержек.
 
     Args:
-    - message (types.Message): Объект сообщения пользователя.
-    - Q (int): Объем производства.
-    - P (float): Цена за единицу товара.
-    - cost_type (str): Тип издержек ('постоянные' или 'переменные').
-    
+    - costs (dict): Собранные издержки (результат collect_costs).
+    - template (str): Шаблон статьи с полями name и amount.
+
     Returns:
-        None
+    - str: Статьи через запятую.
     """
-    try:
-        if message.text is not None:
-            if message.text == "Назад":
-                handle_back_button(message)
-                return
-            """
-            Логичнее брать переменные с типом float для "издержек"  
-            """
-            input_costs = message.text.split(", ")
-            name, cost = input_costs[0], float(input_costs[1])
-
-            # Проверка на неотрицательное значение
-            if cost < 0:
-                bot.send_message(
-                    message.chat.id,
-                    "Пожалуйста, введите неотрицательное числовое"\
-                    " значение для издержек.",
-                )
-                bot.register_next_step_handler(
-                    message, handle_costs_input, Q, P, cost_type
-                )
-                return
-
-            if len(costs[cost_type]) < MAX_COSTS:
-                costs[cost_type].append((name, cost))
-                bot.send_message(
-                    message.chat.id,
-                    f"Добавлены {cost_type} издержки: {name}, {cost}."\
-                    f" Введите следующие или 'Готово'.",
-                )#НЕ ВМЕЩАЕТСЯ В <79 СИМВОЛОВ. НЕ БУДЕТ РАБОТАТЬ!!!
-                bot.register_next_step_handler(
-                    message, get_fixed_costs, Q, P
-                )if cost_type == "постоянные" else bot.register_next_step_handler(
-                    message, get_variable_costs, Q, P
-                )
-            else:
-                bot.send_message(
-                    message.chat.id,
-                    f"Достигнуто максимальное количество {cost_type}"\
-                    f" издержек ({MAX_COSTS}). Введите 'Готово'.",
-                )#НЕ ВМЕЩАЕТСЯ В <79 СИМВОЛОВ. НЕ БУДЕТ РАБОТАТЬ!!!
-                bot.register_next_step_handler(
-                    message, get_fixed_costs, Q, P
-                )if cost_type == "постоянные" else bot.register_next_step_handler(
-                    message, get_variable_costs, Q, P
-                )
-        else:
-            bot.send_message(message.chat.id,
-                             "Пожалуйста, введите числовое значение.")
-            bot.register_next_step_handler(message, handle_costs_input)
-    except (ValueError, IndexError):
-        bot.send_message(
-            message.chat.id,
-            "Некорректный ввод. Пожалуйста, введите данные в формате"\
-            " 'Название издержки, размер издержки'.",
-        )
-        bot.register_next_step_handler(
-            message, get_fixed_costs, Q, P
-        ) if cost_type == "постоянные" else bot.register_next_step_handler(
-            message, get_variable_costs, Q, P
-        )
-
-
-def calculate_and_send_response(message, Q, P):
+    items = costs["items"]
+    largest = heapq.nlargest(COST_SOURCES_SHOWN, items.items(),
+                             key=lambda item: item[1])
+    sources = ", ".join(
+        template.format(name=name, amount=amount)
+        for name, amount in largest)
+    if len(items) > COST_SOURCES_SHOWN:
+        sources += f" и еще {len(items) - COST_SOURCES_SHOWN} статей"
+    return sources
+
+
+def calculate_and_send_response(message, values):
     """
     Рассчитывает прибыль фирмы и отправляет ответ пользователю.
 
     Args:
     - message (types.Message): Объект сообщения пользователя.
-    - Q (int): Объем производства.
-    - P (float): Цена за единицу товара.
-    
+    - values (dict): Объем производства Q, цена за единицу товара P и
+     списки постоянных и переменных издержек.
+
     Returns:
         None
     """
     try:
-        # Суммируем постоянные издержки
-        total_fixed_costs = sum(item[1] for item in costs["постоянные"])
+        Q, P = values["Q"], values["P"]
+        # collect_costs без новых издержек приводит к сводке и состояния,
+        # сохраненные в старом формате
+        fixed_costs = collect_costs(values["fixed_costs"], [])
+        variable_costs = collect_costs(values["variable_costs"], [])
 
-        # Суммируем переменные издержки
-        total_variable_costs = sum(item[1] for item in costs["переменные"])
+        # Суммы издержек уже посчитаны при вводе
+        total_fixed_costs = fixed_costs["total"]
+        total_variable_costs = variable_costs["total"]
 
         # Источники постоянных издержек
-        fixed_costs_sources = ", ".join(
-            [f"{source[0]}, "\
-            f"{source[1]} руб." for source in costs["постоянные"]]
-        )
+        fixed_costs_sources = format_cost_sources(
+            fixed_costs, "{name}, {amount} руб.")
 
         # Источники переменных издержек
-        variable_costs_sources = ", ".join(
-            [
-                f"{source[0]} ({source[1]} руб./единицу товара)"
-                for source in costs["переменные"]
-            ]
-        )
+        variable_costs_sources = format_cost_sources(
+            variable_costs, "{name} ({amount} руб./единицу товара)")
 
-        # Рассчитываем прибыль
-        profit = Q * P - ( total_variable_costs - total_fixed_costs )
+        # Рассчитываем прибыль: выручка минус переменные издержки на весь
+        # объем и постоянные издержки (как в /sensitivity)
+        profit = Q * (P - total_variable_costs) - total_fixed_costs
+        if not math.isfinite(profit):
+            raise OverflowError("Прибыль вне диапазона чисел.")
 
         response = (
             f"При реализации {Q} единиц продукции по {P} руб. за единицу"\
@@ -986,13 +914,12 @@ def calculate_and_send_response(message, Q, P):
             f"(включая: {variable_costs_sources}), "
             f"и постоянных издержек в {total_fixed_costs} руб. "
             f"(включая: {fixed_costs_sources}), прибыль составит:"\
-            f" {round(profit, 2)} руб.")
+            f" {round(profit, 2)} руб."
+            f"\n\nПрибыль при других объемах и ценах: /sensitivity {Q} {P}"\
+            f" fc={total_fixed_costs} vc={total_variable_costs}")
 
         bot.send_message(message.chat.id, response)
 
-        costs["переменные"].clear()
-        costs["постоянные"].clear()
-
     except Exception as e:
         bot.send_message(
             message.chat.id,
@@ -1002,8 +929,55 @@ def calculate_and_send_response(message, Q, P):
         print(e)
 
 
+flow_engine.add(Flow(
+    "profit",
+    [
+        Field(
+            "Q",
+            "1. Объем производства в штуках (Q):",
+            parse=int,
+            error="Некорректный ввод. Введите целое числовое значение для"\
+            " объема производства.",
+            validators=[non_negative(
+                "Пожалуйста, введите неотрицательное числовое значение"\
+                " для объема производства.")],
+        ),
+        Field(
+            "P",
+            "2. Цена за единицу товара (P) в рублях:",
+            error="Некорректный ввод. Введите числовое значение для цены за"\
+            " единицу товара.",
+            validators=[non_negative(
+                "Пожалуйста, введите неотрицательное числовое значение"\
+                " для цены за единицу товара.")],
+        ),
+        cost_field(
+            "fixed_costs",
+            "3. Постоянные издержки (FC) в рублях. Пожалуйста,"\
+            " введите данные в формате 'Название"\
+            " издержки, размер издержки' - по одной на строке, можно"\
+            " сразу несколько строк или текстовым файлом. (введите"\
+            " 'готово' для завершения):",
+            "постоянные",
+        ),
+        cost_field(
+            "variable_costs",
+            "4. Переменные издержки (VC) в рублях. Пожалуйста,"\
+            " введите данные в формате 'Название издержки, размер"\
+            " издержки' - по одной на строке, можно сразу несколько"\
+            " строк или текстовым файлом. (введите 'готово'"\
+            " для завершения):",
+            "переменные",
+        ),
+    ],
+    on_complete=calculate_and_send_response,
+    intro="Для расчета прибыли фирмы введите следующие данные:",
+    reply_markup=make_back_keyboard(),
+))
+
+
 # Обработчик нажатия на кнопку "Назад"
-@bot.message_handler(func=lambda message: message.text.lower() == "назад")
+@router.text("Назад")
 def handle_back_button(message):
     """
     Обработчик нажатия на кнопку "Назад". Возвращает пользователя
@@ -1011,10 +985,13 @@ def handle_back_button(message):
 
     Args:
     - message (types.Message): Объект сообщения пользователя.
-    
+
     Returns:
         None
     """
+    # Незавершенная задача больше не нужна
+    flow_engine.cancel(message.chat.id)
+
     # Создаем клавиатуру с задачами
     keyboard = types.ReplyKeyboardMarkup(row_width=2, resize_keyboard=True)
     button1 = types.KeyboardButton("Построение общей КПВ")
@@ -1030,341 +1007,890 @@ def handle_back_button(message):
 
 
 # Обработчик нажатия на кнопку "Построение общей КПВ"
-@bot.message_handler(func=lambda message: message.text ==
-                     "Построение общей КПВ")
+@router.text("Построение общей КПВ")
 def handle_build_kpv(message):
     """
-    Обработчик нажатия на кнопку "Построение общей КПВ". 
+    Обработчик нажатия на кнопку "Построение общей КПВ".
     Инициирует процесс ввода данных для
     построения кривой производительных возможностей.
 
     Args:
     - message (types.Message): Объект сообщения пользователя.
-    
+
     Returns:
         None
     """
-    remove_keyboard = types.ReplyKeyboardRemove()
+    flow_engine.start(message, "kpv")
 
-    # Клавиатура с кнопкой "Назад"
-    back_keyboard = types.ReplyKeyboardMarkup(
-        row_width=1, resize_keyboard=True)
-    back_button = types.KeyboardButton("Назад")
-    back_keyboard.add(back_button)
 
-    bot.send_message(
+def kpv_field(name, good, producer):
+    """
+    Создает поле ввода максимального объема производства для КПВ.
+
+    Args:
+    - name (str): Имя значения в собранных данных.
+    - good (str): Товар ('А' или 'Б').
+    - producer (int): Номер производителя.
+
+    Returns:
+    - Field: Поле задачи.
+    """
+    return Field(
+        name,
+        f"Введите максимальный объем производства товара {good} для"\
+        f" производителя {producer}:",
+        validators=[non_negative(
+            f"Пожалуйста, введите неотрицательное числовое"\
+            f" значение для максимального объема производства"\
+            f" товара {good} для производителя {producer}:")],
+    )
+
+
+def send_kpv(message, values):
+    """
+    Строит и отправляет график общей КПВ по введенным данным.
+
+    Args:
+    - message (types.Message): Объект сообщения пользователя.
+    - values (dict): Максимальные объемы производства A1, B1, A2 и B2.
+
+    Returns:
+        None
+    """
+    # Построение и отправка графика общей КПВ
+    send_kpv_chart(
         message.chat.id,
-        "Введите максимальный объем производства товара А для"\
-        " производителя 1:",
-        reply_markup=back_keyboard,
+        values["A1"],
+        values["B1"],
+        values["A2"],
+        values["B2"],
+    )
+
+
+def send_kpv_chart(
+        chat_id,
+        max_production_A1,
+        max_production_B1,
+        max_production_A2,
+        max_production_B2):
+    """
+    Отправляет график общей КПВ, используя кэш file_id.
+
+    Если такой же график уже отправлялся, Telegram получает только его
+    file_id - без повторного построения и загрузки изображения.
+
+    Args:
+    - chat_id (int): Идентификатор чата.
+    - max_production_A1 (float): Максимальный объем производства товара
+     А для производителя 1.
+    - max_production_B1 (float): Максимальный объем производства товара
+     Б для производителя 1.
+    - max_production_A2 (float): Максимальный объем производства товара
+     А для производителя 2.
+    - max_production_B2 (float): Максимальный объем производства товара
+     Б для производителя 2.
+
+    Returns:
+        None
+    """
+    send_cached_chart(
+        chat_id,
+        kpv_chart_cache,
+        "kpv",
+        max_production_A1,
+        max_production_B1,
+        max_production_A2,
+        max_production_B2,
     )
-    bot.register_next_step_handler(message, get_max_production_A1)
 
 
-def get_max_production_A1(message):
+def send_cached_chart(chat_id, cache, name, *args):
+    """
+    Строит график в пуле процессов и отправляет его, используя кэш file_id.
+
+    Args:
+    - chat_id (int): Идентификатор чата.
+    - cache (ChartCache): Кэш file_id графиков этого типа.
+    - name (str): Имя функции построения из charts.RENDERERS.
+    - args (float): Числовые аргументы функции построения.
+
+    Returns:
+        None
+    """
+    # Ключ нужен только для поиска в кэше: график строится по исходным
+    # значениям, иначе округление исказило бы малые величины
+    key = cache.make_key(*args)
+
+    def remember(sent):
+        if sent.exception() is None:
+            cache.put(key, sent.result().photo[-1].file_id)
+
+    file_id = cache.get(key)
+    if file_id is None:
+        send_chart(chat_id, name, *args, on_sent=remember)
+        return
+
+    def resend(sent):
+        error = sent.exception()
+        if error is None:
+            return
+        if not is_wrong_file_id(error):
+            # Сбой сети или исчерпанные повторы 429: file_id по-прежнему
+            # действителен, и строить график заново незачем
+            print(f"{name}: {error!r}")
+            return
+        # file_id больше не действителен - строим график заново
+        cache.discard(key)
+        send_chart(chat_id, name, *args, on_sent=remember)
+
+    bot.send_photo(chat_id, file_id).add_done_callback(resend)
+
+
+def is_wrong_file_id(error):
     """
-    Обработчик ввода максимального объема производства товара А
-     для производителя 1.
+    Проверяет, отверг ли Telegram отправку из-за недействительного file_id.
+
+    Args:
+    - error (Exception): Ошибка отправки.
+
+    Returns:
+    - bool: True для ответа 400 о неверном идентификаторе файла.
+    """
+    return isinstance(error, telebot.apihelper.ApiTelegramException) \
+        and error.error_code == 400 \
+        and any(marker in error.description.lower()
+                for marker in ("file identifier", "file_id"))
+
+
+def send_chart(chat_id, name, *args, on_sent=None):
+    """
+    Ставит график в очередь на построение и отправляет его, когда он
+    будет готов; обработчик не ждет построения.
+
+    Если график построить не удалось (очередь заполнена, функция
+    построения завершилась ошибкой или упал процесс), пользователь
+    получает сообщение об этом.
+
+    Args:
+    - chat_id (int): Идентификатор чата.
+    - name (str): Имя функции построения из charts.RENDERERS.
+    - args: Аргументы функции построения.
+    - on_sent (Optional[Callable[[Future], None]]): Вызывается с
+     результатом отправки фотографии.
+
+    Returns:
+        None
+    """
+    # Тексты, уже отправленные обработчиком, уходят раньше графика
+    bot.flush(chat_id)
+    try:
+        future = render_service.submit(name, *args)
+    except RenderQueueFull:
+        bot.send_message(chat_id, CHARTS_BUSY)
+        return
+
+    def deliver(future):
+        try:
+            png = future.result()
+        except Exception as e:
+            print(f"{name}: {e!r}")
+            bot.send_message(chat_id, CHART_FAILED)
+            return
+        sent = bot.send_photo(chat_id, png)
+        if on_sent is not None:
+            sent.add_done_callback(on_sent)
+
+    future.add_done_callback(deliver)
+
+
+flow_engine.add(Flow(
+    "kpv",
+    [
+        kpv_field("A1", "А", 1),
+        kpv_field("B1", "Б", 1),
+        kpv_field("A2", "А", 2),
+        kpv_field("B2", "Б", 2),
+    ],
+    on_complete=send_kpv,
+    reply_markup=make_back_keyboard(),
+))
+
+
+# Издержки в аргументах команды /profit: fc=1000 или vc=аренда:50,сырье:20
+PROFIT_COST_ARGUMENT = re.compile(r"\b(fc|vc)\s*=\s*([^\s=]+)",
+                                  re.IGNORECASE)
+
+
+def command_args(message):
+    """
+    Возвращает текст аргументов команды.
+
+    Args:
+    - message (types.Message): Объект сообщения пользователя.
+
+    Returns:
+    - str: Текст после имени команды.
+    """
+    parts = message.text.split(maxsplit=1)
+    return parts[1] if len(parts) > 1 else ""
+
+
+def run_flow_command(message, name, usage):
+    """
+    Решает задачу по аргументам команды за один запрос, не сохраняя
+    состояние диалога.
 
     Args:
     - message (types.Message): Объект сообщения пользователя.
-    
+    - name (str): Имя задачи.
+    - usage (str): Подсказка по формату команды.
+
     Returns:
         None
     """
+    flow = flow_engine.flows[name]
     try:
-        if message.text is not None:
-            if message.text == "Назад":
-                handle_back_button(message)
-                return
-            max_production_A1 = float(message.text)
-            while max_production_A1 < 0:
-                bot.send_message(
-                    message.chat.id,
-                    "Пожалуйста, введите неотрицательное числовое"\
-                    " значение для максимального объема производства"\
-                    " товара А для производителя 1:",
-                )
-                bot.register_next_step_handler(message, get_max_production_A1)
-                return
-
-            bot.send_message(
-                message.chat.id,
-                "Введите максимальный объем производства"\
-                " товара Б для производителя 1:",
-            )
-            bot.register_next_step_handler(
-                message, get_max_production_B1, max_production_A1
-            )
-        else:
-            bot.send_message(message.chat.id,
-                             "Пожалуйста, введите числовое значение.")
-            bot.register_next_step_handler(message, get_max_production_A1)
-    except ValueError:
-        bot.send_message(
-            message.chat.id,
-            "Пожалуйста, введите числовое значение.")
-        bot.register_next_step_handler(message, get_max_production_A1)
+        values = parse_bulk(flow.fields, command_args(message)) or {}
+    except BulkInputError as e:
+        bot.send_message(message.chat.id, f"{e}\n{usage}")
+        return
+
+    if len(values) < len(flow.fields):
+        bot.send_message(message.chat.id, usage)
+        return
+
+    flow.on_complete(message, values)
 
 
-def get_max_production_B1(message, max_production_A1):
+@router.command("equilibrium")
+def handle_equilibrium_command(message):
     """
-    Обработчик ввода максимального объема производства товара
-     Б для производителя 1.
+    Обработчик команды /equilibrium A B C D.
+
+    Args:
+    - message (types.Message): Объект сообщения пользователя.
+
+    Returns:
+        None
+    """
+    run_flow_command(
+        message, "market_equilibrium",
+        "Формат: /equilibrium A B C D, например: /equilibrium 100 2 10 3")
+
+
+@router.command("deficit")
+def handle_deficit_command(message):
+    """
+    Обработчик команды /deficit A B C D E.
 
     Args:
     - message (types.Message): Объект сообщения пользователя.
-    - max_production_A1 (float): Максимальный объем производства
-     товара А для производителя 1.
-    
+
+    Returns:
+        None
+    """
+    run_flow_command(
+        message, "deficit_surplus",
+        "Формат: /deficit A B C D E, например: /deficit 100 2 10 3 15")
+
+
+@router.command("kpv")
+def handle_kpv_command(message):
+    """
+    Обработчик команды /kpv A1 B1 A2 B2 [A3 B3 ...].
+
+    Для двух производителей строит график с точками A, B и C, для трех и
+    более - общую КПВ всех производителей.
+
+    Args:
+    - message (types.Message): Объект сообщения пользователя.
+
     Returns:
         None
     """
+    usage = "Формат: /kpv A1 B1 A2 B2 [A3 B3 ...], например:"\
+        " /kpv 100 50 80 60 или /kpv 100 50; 80 60; 30 45"
+    tokens = [token for token in VALUE_SEPARATOR.split(command_args(message))
+              if token]
+    if len(tokens) <= 4:
+        run_flow_command(message, "kpv", usage)
+        return
+
     try:
-        if message.text is not None:
-            if message.text == "Назад":
-                handle_back_button(message)
-                return
-            max_production_B1 = float(message.text)
-            while max_production_B1 < 0:
-                bot.send_message(
-                    message.chat.id,
-                    "Пожалуйста, введите неотрицательное числовое"\
-                    " значение для максимального объема производства"\
-                    " товара Б для производителя 1:",
-                )
-                bot.register_next_step_handler(
-                    message, get_max_production_B1, max_production_A1
-                )
-                return
-
-            bot.send_message(
-                message.chat.id,
-                "Введите максимальный объем производства товара"\
-                " А для производителя 2:",
-            )
-            bot.register_next_step_handler(
-                message,
-                get_max_production_A2,
-                max_production_A1,
-                max_production_B1)
-        else:
-            bot.send_message(message.chat.id,
-                             "Пожалуйста, введите числовое значение.")
-            bot.register_next_step_handler(
-                message, get_max_production_B1, max_production_A1
-            )
+        values = [finite_float(token) for token in tokens]
+        if len(values) % 2:
+            raise ValueError
     except ValueError:
-        bot.send_message(
-            message.chat.id,
-            "Пожалуйста, введите числовое значение.")
-        bot.register_next_step_handler(
-            message, get_max_production_B1, max_production_A1
-        )
+        bot.send_message(message.chat.id, usage)
+        return
+    send_kpv_frontier(message.chat.id, values[0::2], values[1::2])
+
+
+# Количество строк таблицы вершин в ответе на /kpv
+KPV_TABLE_ROWS = 10
+
+# Максимальное количество вершин на графике общей КПВ
+KPV_CHART_POINTS = 2000
 
+# Количество вершин, до которого они отмечаются на графике точками
+KPV_CHART_MARKERS = 50
 
-def get_max_production_A2(message, max_production_A1, max_production_B1):
+
+def send_kpv_frontier(chat_id, max_a, max_b):
     """
-    Обработчик ввода максимального объема производства товара А для 
-    производителя 2.
+    Строит общую КПВ многих производителей и отправляет порядок их
+    специализации, вершины кривой и график.
+
+    Args:
+    - chat_id (int): Идентификатор чата.
+    - max_a (List[float]): Максимальные объемы производства товара А.
+    - max_b (List[float]): Максимальные объемы производства товара Б.
+
+    Returns:
+        None
+    """
+    # Модуль с numpy загружается только при первом расчете
+    from economics import kpv_frontier
+
+    try:
+        order, cost, vertex_b, vertex_a = kpv_frontier(max_a, max_b)
+    except ValueError as e:
+        bot.send_message(chat_id, str(e))
+        return
+
+    lines = [
+        f"Производителей: {len(order)}. На товар Б переключаются"\
+        " по возрастанию альтернативной стоимости (A / Б).",
+        "Производитель | A / Б | Б | A",
+        f"- | - | 0 | {round(float(vertex_a[0]), 2)}",
+    ]
+    for i in range(min(len(order), KPV_TABLE_ROWS)):
+        # Производитель, не выпускающий товар Б, переключается последним
+        ratio = round(float(cost[i]), 2) if cost[i] < math.inf else "∞"
+        lines.append(
+            f"{order[i] + 1} | {ratio}"\
+            f" | {round(float(vertex_b[i + 1]), 2)}"\
+            f" | {round(float(vertex_a[i + 1]), 2)}")
+    if len(order) > KPV_TABLE_ROWS:
+        lines.append(f"... еще {len(order) - KPV_TABLE_ROWS}")
+    bot.send_message(chat_id, "\n".join(lines))
+
+    send_kpv_frontier_chart(chat_id, vertex_b, vertex_a)
+
+
+def send_kpv_frontier_chart(chat_id, vertex_b, vertex_a):
+    """
+    Отправляет график общей КПВ по ее вершинам.
+
+    Если вершин больше KPV_CHART_POINTS, на графике остаются равномерно
+    выбранные вершины, включая крайние.
+
+    Args:
+    - chat_id (int): Идентификатор чата.
+    - vertex_b (np.ndarray): Объемы товара Б в вершинах.
+    - vertex_a (np.ndarray): Объемы товара А в вершинах.
+
+    Returns:
+        None
+    """
+    if len(vertex_b) > KPV_CHART_POINTS:
+        step = -(-(len(vertex_b) - 1) // (KPV_CHART_POINTS - 1))
+        vertex_b = list(vertex_b[::step]) + [vertex_b[-1]]
+        vertex_a = list(vertex_a[::step]) + [vertex_a[-1]]
+
+    send_chart(
+        chat_id,
+        "kpv_frontier",
+        [float(b) for b in vertex_b],
+        [float(a) for a in vertex_a],
+        len(vertex_b) <= KPV_CHART_MARKERS,
+    )
+
+
+# Максимальное количество цен в одном расчете /sweep
+MAX_SWEEP_POINTS = 2_000_000
+
+# Количество строк таблицы в ответе /sweep
+SWEEP_TABLE_ROWS = 11
+
+# Количество точек на графике /sweep (спрос и предложение линейны,
+# поэтому для графика достаточно редкой сетки)
+SWEEP_CHART_POINTS = 200
+
+# Название ситуации на рынке по знаку разницы спроса и предложения
+SITUATIONS = {1: "дефицит", -1: "излишек", 0: "равновесие"}
+
+
+@router.command("sweep")
+def handle_sweep_command(message):
+    """
+    Обработчик команды /sweep A B C D Pmin Pmax шаг.
+
+    Рассчитывает объем дефицита/излишка сразу для всех цен диапазона и
+    отправляет таблицу цен, при которых дефицит сменяется излишком, и
+    график.
 
     Args:
     - message (types.Message): Объект сообщения пользователя.
-    - max_production_A1 (float): Максимальный объем производства 
-    товара А для производителя 1.
-    - max_production_B1 (float): Максимальный объем производства 
-    товара Б для производителя 1.
-    
+
     Returns:
         None
     """
+    # Модуль с numpy загружается только при первом расчете
+    import numpy as np
+
+    from economics import deficit_surplus, price_grid, sweep_transitions
+
+    usage = "Формат: /sweep A B C D Pmin Pmax шаг, например:"\
+        " /sweep 100 2 10 3 0 50 0.5"
     try:
-        if message.text is not None:
-            if message.text == "Назад":
-                handle_back_button(message)
-                return
-            max_production_A2 = float(message.text)
-            while max_production_A2 < 0:
-                bot.send_message(
-                    message.chat.id,
-                    "Пожалуйста, введите неотрицательное числовое значение"\
-                    " для максимального объема производства товара"\
-                    " А для производителя 2:",
-                )
-                bot.register_next_step_handler(
-                    message,
-                    get_max_production_A2,
-                    max_production_A1,
-                    max_production_B1)
-                return
-
-            bot.send_message(
-                message.chat.id,
-                "Введите максимальный объем производства товара Б"\
-                " для производителя 2:",
-            )
-            bot.register_next_step_handler(
-                message,
-                get_max_production_B2,
-                max_production_A1,
-                max_production_B1,
-                max_production_A2,
-            )
-        else:
-            bot.send_message(message.chat.id,
-                             "Пожалуйста, введите числовое значение.")
-            bot.register_next_step_handler(
-                message,
-                get_max_production_A2,
-                max_production_A1,
-                max_production_B1)
+        A, B, C, D, start, stop, step = (
+            finite_float(value) for value in command_args(message).split())
+        if start < 0:
+            raise ValueError
     except ValueError:
+        bot.send_message(message.chat.id, usage)
+        return
+
+    if step <= 0 or stop < start:
         bot.send_message(
             message.chat.id,
-            "Пожалуйста, введите числовое значение.")
-        bot.register_next_step_handler(
-            message,
-            get_max_production_A2,
-            max_production_A1,
-            max_production_B1)
+            "Шаг должен быть положительным, а Pmax - не меньше Pmin.\n"
+            f"{usage}")
+        return
+
+    # При очень малом шаге частное бесконечно и не приводится к int
+    span = (stop - start) / step
+    if not span < MAX_SWEEP_POINTS:
+        points = f": {int(span) + 1}" if math.isfinite(span) else ""
+        bot.send_message(
+            message.chat.id,
+            f"Слишком много цен в диапазоне{points}"\
+            f" (максимум {MAX_SWEEP_POINTS}). Увеличьте шаг.")
+        return
+
+    prices = price_grid(start, stop, step)
+    # Цены смены ситуации округляем до точности шага
+    digits = max(2, -math.floor(math.log10(step)))
+
+    with np.errstate(over="ignore", invalid="ignore"):
+        gap = deficit_surplus(A, B, C, D, prices)
+    if not np.isfinite(gap).all():
+        bot.send_message(message.chat.id, TOO_LARGE)
+        return
+
+    lines = [f"Цены от {start} до {stop} с шагом {step}: {len(prices)}"\
+             " точек."]
+    transitions = sweep_transitions(prices, gap)
+    for before, after, sign_before, sign_after in transitions:
+        lines.append(
+            f"P {round(before, digits)} → {round(after, digits)}:"\
+            f" {SITUATIONS[sign_before]} → {SITUATIONS[sign_after]}")
+    if not transitions:
+        first = float(gap[0])
+        lines.append(
+            f"На всем диапазоне: {SITUATIONS[(first > 0) - (first < 0)]}.")
+
+    # Несколько равномерно расположенных строк таблицы
+    lines.append("P | Qd | Qs | Qd - Qs")
+    step_rows = max(1, (len(prices) - 1) // (SWEEP_TABLE_ROWS - 1))
+    for i in list(range(0, len(prices), step_rows))[:SWEEP_TABLE_ROWS]:
+        price = float(prices[i])
+        demand = A - B * price
+        supply = C + D * price
+        lines.append(
+            f"{round(price, 2)} | {round(demand, 2)} | {round(supply, 2)}"\
+            f" | {round(demand - supply, 2)}")
+    bot.send_message(message.chat.id, "\n".join(lines))
+
+    chart_prices = price_grid(
+        start, stop, max(step, (stop - start) / SWEEP_CHART_POINTS))
+    send_chart(
+        message.chat.id,
+        "deficit_sweep",
+        chart_prices.tolist(),
+        (A - B * chart_prices).tolist(),
+        (C + D * chart_prices).tolist(),
+    )
 
 
-def get_max_production_B2(
-    message, max_production_A1, max_production_B1, max_production_A2
-):
+def parse_curve(text):
     """
-    Обработчик ввода максимального объема производства товара Б для 
-    производителя 2.
+    Разбирает описание кривой спроса или предложения вида
+    'power 100 -0.5'.
+
+    Args:
+    - text (str): Вид кривой и коэффициенты через пробел.
+
+    Returns:
+    - Tuple[np.ndarray, np.ndarray, np.ndarray]: Слагаемые кривой
+     (результат economics.curve_terms).
+
+    Raises:
+    - ValueError: При неизвестном виде кривой или некорректных
+     коэффициентах.
+    """
+    from economics import curve_terms
+
+    tokens = text.split()
+    if not tokens:
+        raise ValueError("Укажите вид кривой и ее коэффициенты.")
+    try:
+        coefficients = [finite_float(value.replace(",", "."))
+                        for value in tokens[1:]]
+    except ValueError:
+        raise ValueError("Коэффициенты кривой должны быть числами.")
+    return curve_terms(tokens[0].lower(), *coefficients)
+
+
+@router.command("nonlinear")
+def handle_nonlinear_command(message):
+    """
+    Обработчик команды /nonlinear <спрос>; <предложение>.
+
+    Находит точку рыночного равновесия для нелинейных кривых спроса и
+    предложения: степенных, показательных и многочленов.
 
     Args:
     - message (types.Message): Объект сообщения пользователя.
-    - max_production_A1 (float): Максимальный объем производства товара
-     А для производителя 1.
-    - max_production_B1 (float): Максимальный объем производства товара
-     Б для производителя 1.
-    - max_production_A2 (float): Максимальный объем производства товара 
-    А для производителя 2.
-    
+
     Returns:
         None
     """
+    # Модуль с numpy загружается только при первом расчете
+    from economics import solve_nonlinear_equilibrium
+
+    usage = "Формат: /nonlinear <спрос>; <предложение>, где кривая -"\
+        " linear a b (a + b*P), power a b (a*P^b), exponential a b"\
+        " (a*e^(b*P)) или polynomial c0 c1 c2 ... Например:"\
+        " /nonlinear power 100 -0.5; linear 10 3"
+    curves = command_args(message).split(";")
     try:
-        if message.text is not None:
-            if message.text == "Назад":
-                handle_back_button(message)
-                return
-            max_production_B2 = float(message.text)
-            while max_production_B2 < 0:
-                bot.send_message(
-                    message.chat.id,
+        if len(curves) != 2:
+            raise ValueError("Укажите спрос и предложение через ';'.")
+        demand, supply = (parse_curve(curve) for curve in curves)
+    except ValueError as e:
+        bot.send_message(message.chat.id, f"{e}\n{usage}")
+        return
+
+    price, value, converged, iterations = solve_nonlinear_equilibrium(
+        demand, supply)
+    if not converged[0]:
+        bot.send_message(
+            message.chat.id,
+            "Равновесие с неотрицательной ценой не найдено: спрос и"\
+            " предложение не пересекаются.")
+        return
+    if not (math.isfinite(price[0]) and math.isfinite(value[0])):
+        bot.send_message(message.chat.id, TOO_LARGE)
+        return
+
+    bot.send_message(
+        message.chat.id,
+        f"{format_market_equilibrium(float(price[0]), float(value[0]))}"\
+        f"\nИтераций решателя: {int(iterations[0])}")
+
+
+def parse_profit_command(text):
+    """
+    Разбирает аргументы команды /profit.
+
+    Args:
+    - text (str): Аргументы, например 'Q P fc=аренда:1000,свет:200 vc=50'.
+
+    Returns:
+    - dict: Значения Q, P, fixed_costs и variable_costs.
+
+    Raises:
+    - BulkInputError: При некорректных аргументах.
+    """
+    costs = {"fc": [], "vc": []}
+    for kind, items in PROFIT_COST_ARGUMENT.findall(text):
+        kind = kind.lower()
+        for item in filter(None, items.split(",")):
+            name, _, amount = item.rpartition(":")
+            try:
+                cost = finite_float(amount)
+            except ValueError:
+                raise BulkInputError(f"Некорректная издержка: {item}.")
+            if cost < 0:
+                raise BulkInputError(
                     "Пожалуйста, введите неотрицательное числовое"\
-                    " значение для максимального объема производства"\
-                    " товара Б для производителя 2:",
-                )
-                bot.register_next_step_handler(
-                    message,
-                    get_max_production_B2,
-                    max_production_A1,
-                    max_production_B1,
-                    max_production_A2,
-                )
-                return
-
-            # Построение графика общей КПВ
-            plot_kpv(
-                max_production_A1,
-                max_production_B1,
-                max_production_A2,
-                max_production_B2,
-            )
+                    " значение для издержек.")
+            costs[kind].append((name or kind.upper(), cost))
 
-            bot.send_photo(message.chat.id, open("kpv_plot.png", "rb"))
-        else:
-            bot.send_message(message.chat.id,
-                             "Пожалуйста, введите числовое значение.")
-            bot.register_next_step_handler(
-                message,
-                get_max_production_B2,
-                max_production_A1,
-                max_production_B1,
-                max_production_A2,
-            )
-    except ValueError:
+    fields = flow_engine.flows["profit"].fields[:2]
+    values = parse_bulk(fields, PROFIT_COST_ARGUMENT.sub(" ", text))
+    if values is None or len(values) < len(fields):
+        raise BulkInputError("Укажите объем производства Q и цену P.")
+
+    values["fixed_costs"] = collect_costs(None, costs["fc"])
+    values["variable_costs"] = collect_costs(None, costs["vc"])
+    return values
+
+
+@router.command("profit")
+def handle_profit_command(message):
+    """
+    Обработчик команды /profit Q P fc=... vc=...
+
+    Args:
+    - message (types.Message): Объект сообщения пользователя.
+
+    Returns:
+        None
+    """
+    try:
+        values = parse_profit_command(command_args(message))
+    except BulkInputError as e:
         bot.send_message(
             message.chat.id,
-            "Пожалуйста, введите числовое значение.")
-        bot.register_next_step_handler(
-            message,
-            get_max_production_B2,
-            max_production_A1,
-            max_production_B1,
-            max_production_A2,
-        )
+            f"{e}\nФормат: /profit Q P fc=... vc=..., например:"\
+            " /profit 100 50 fc=аренда:1000,свет:200 vc=сырье:20")
+        return
+
+    calculate_and_send_response(message, values)
+
+
+# Диапазон объема или цены в команде /sensitivity: 'q=50..150'
+RANGE_ARGUMENT = re.compile(r"\b([qp])\s*=\s*([^\s=]+?)\.\.([^\s=]+)",
+                            re.IGNORECASE)
+
+# Количество значений объема и цены в сетке сценариев /sensitivity
+SENSITIVITY_GRID = 21
 
+# Количество значений объема и цены в таблице ответа /sensitivity
+SENSITIVITY_TABLE = 5
+
+# Кэш уже отправленных тепловых карт прибыли
+profit_chart_cache = ChartCache(maxsize=KPV_CACHE_SIZE)
+
+
+def parse_sensitivity_command(text):
+    """
+    Разбирает аргументы команды /sensitivity.
+
+    Args:
+    - text (str): Аргументы, например 'Q P fc=... vc=... q=0..200'.
+
+    Returns:
+    - Tuple[dict, dict]: Значения как у parse_profit_command и диапазоны
+     объема и цены ({'q': (min, max), 'p': (min, max)}); по умолчанию
+     от нуля до удвоенного исходного значения.
+
+    Raises:
+    - BulkInputError: При некорректных аргументах.
+    """
+    ranges = {}
+    for name, low, high in RANGE_ARGUMENT.findall(text):
+        try:
+            low, high = finite_float(low), finite_float(high)
+        except ValueError:
+            raise BulkInputError(f"Некорректный диапазон: {name}.")
+        if not 0 <= low < high:
+            raise BulkInputError(
+                f"Диапазон {name} должен быть неотрицательным и"\
+                " возрастающим.")
+        ranges[name.lower()] = (low, high)
+
+    values = parse_profit_command(RANGE_ARGUMENT.sub(" ", text))
+    ranges.setdefault("q", (0.0, 2.0 * values["Q"] or 1.0))
+    ranges.setdefault("p", (0.0, 2.0 * values["P"] or 1.0))
+    return values, ranges
+
+
+@router.command("sensitivity")
+def handle_sensitivity_command(message):
+    """
+    Обработчик команды /sensitivity Q P fc=... vc=... [q=..] [p=..].
+
+    Рассчитывает прибыль для сетки сценариев объема и цены вокруг
+    исходного, объем и цену безубыточности и отправляет таблицу и
+    тепловую карту прибыли.
+
+    Args:
+    - message (types.Message): Объект сообщения пользователя.
 
-def plot_kpv(
-        max_production_A_1,
-        max_production_B_1,
-        max_production_A_2,
-        max_production_B_2):
-    """
-    Строит график кривой производственных возможностей для двух
-     производителей с использованием точек A1, B1 и C1.
-
-    Parameters:
-    - max_production_A_1 (float): Максимальный объем производства товара
-     A1 для производителя 1.
-    - max_production_B_1 (float): Максимальный объем производства товара
-     B1 для производителя 1.
-    - max_production_A_2 (float): Максимальный объем производства товара
-     A1 для производителя 2.
-    - max_production_B_2 (float): Максимальный объем производства товара
-     B1 для производителя 2.
-
-    Генерирует график кривой производственных возможностей и сохраняет
-     его в файл 'kpv_plot.png'.
-    
     Returns:
         None
     """
+    # Модуль с numpy загружается только при первом расчете
+    import numpy as np
 
-    # Создаем списки значений для точек A, B и C
-    point_a = [max_production_A_1 + max_production_A_2, 0]
-    point_b = [
-        max(max_production_A_1, max_production_A_2),
-        max(max_production_B_1, max_production_B_2),
-    ]
-    point_c = [0, max_production_B_1 + max_production_B_2]
-
-    # Извлечение координат точек
-    a_x, a_y = point_a
-    b_x, b_y = point_b
-    c_x, c_y = point_c
-
-    # Построение графика с точками
-    plt.figure(figsize=(8, 6))
-    plt.scatter([a_y, b_y, c_y], [a_x, b_x, c_x], color="red", label="Точки")
-
-    # Проводим отрезки через точки
-    plt.plot([a_y, b_y], [a_x, b_x], color="blue",
-             linestyle="--", label="Производитель 1")
-    plt.plot([b_y, c_y], [b_x, c_x], color="green",
-             linestyle="--", label="Производитель 2")
-
-    # Добавление названий точек
-    plt.text(a_y, a_x, "A", fontsize=12, ha="right", va="bottom")
-    plt.text(b_y, b_x, "B", fontsize=12, ha="left", va="top")
-    plt.text(c_y, c_x, "C", fontsize=12, ha="right", va="top")
-
-    # Настройки графика
-    plt.title("Общая КПВ")
-    plt.xlabel("Производство товара Б")
-    plt.ylabel("Производство товара A")
-    plt.legend()
-    plt.grid(True, linestyle="--", alpha=0.7)
-    plt.savefig("kpv_plot.png")
-    plt.close()
+    from economics import break_even_price, break_even_volume, profit_grid
+
+    try:
+        values, ranges = parse_sensitivity_command(command_args(message))
+    except BulkInputError as e:
+        bot.send_message(
+            message.chat.id,
+            f"{e}\nФормат: /sensitivity Q P fc=... vc=... [q=мин..макс]"\
+            " [p=мин..макс], например: /sensitivity 100 50 fc=1200"\
+            " vc=20 q=0..200")
+        return
+
+    Q, P = values["Q"], values["P"]
+    fixed = values["fixed_costs"]["total"]
+    variable = values["variable_costs"]["total"]
+
+    quantities = np.linspace(*ranges["q"], SENSITIVITY_GRID)
+    prices = np.linspace(*ranges["p"], SENSITIVITY_GRID)
+    profit = profit_grid(quantities, prices, fixed, variable)
+
+    try:
+        volume = float(break_even_volume(P, fixed, variable))
+        price = float(break_even_price(Q, fixed, variable))
+        lines = [
+            f"Прибыль = Q * (P - AVC) - FC при FC = {fixed} руб. и"\
+            f" AVC = {variable} руб./единицу товара.",
+            f"При Q = {Q} и P = {P}: {round(Q * (P - variable) - fixed, 2)}"\
+            " руб.",
+            f"Объем безубыточности при P = {P}: "
+            + (f"{round(volume, 2)}" if volume < math.inf
+               else "нет (цена не выше AVC)"),
+            f"Цена безубыточности при Q = {Q}: "
+            + (f"{round(price, 2)} руб." if price < math.inf
+               else "нет (нулевой объем)"),
+            f"Прибыльных сценариев: {int((profit > 0).sum())} из"\
+            f" {profit.size}.",
+            "Q \\ P | " + " | ".join(
+                f"{round(p, 2)}" for p in
+                np.linspace(*ranges["p"], SENSITIVITY_TABLE)),
+        ]
+        table = profit_grid(np.linspace(*ranges["q"], SENSITIVITY_TABLE),
+                            np.linspace(*ranges["p"], SENSITIVITY_TABLE),
+                            fixed, variable)
+        for q, row in zip(np.linspace(*ranges["q"], SENSITIVITY_TABLE),
+                          table):
+            lines.append(f"{round(q, 2)} | "
+                         + " | ".join(f"{round(x)}" for x in row))
+    except (OverflowError, ValueError):
+        # Прибыль не помещается в число при очень больших значениях
+        bot.send_message(message.chat.id, TOO_LARGE)
+        return
+
+    bot.send_message(message.chat.id, "\n".join(lines))
+
+    send_cached_chart(
+        message.chat.id,
+        profit_chart_cache,
+        "profit_heatmap",
+        *ranges["q"],
+        *ranges["p"],
+        fixed,
+        variable,
+        Q,
+        P,
+    )
+
+
+def enable_persistent_state(filename):
+    """
+    Включает сохранение состояния задач в SQLite.
+
+    После перезапуска бота пользователи продолжают задачу с того же шага
+    с уже введенными значениями.
+
+    Args:
+    - filename (str): Путь к файлу базы данных.
+
+    Returns:
+    - SQLiteStateStore: Хранилище состояний задач.
+    """
+    from state_store import SQLiteStateStore
+
+    store = SQLiteStateStore(
+        filename, ttl=FLOW_STATE_TTL, max_sessions=MAX_FLOW_STATES)
+    flow_engine.store = store
+    return store
 
 
 # Запускаем бота
-bot.polling(none_stop=True)
+if __name__ == "__main__":
+    state_store = None
+    if STATE_DB_PATH:
+        state_store = enable_persistent_state(STATE_DB_PATH)
+
+    # Запросы к Bot API идут через общий пул постоянных соединений
+    transport.install()
+
+    # Прогреваем процессы построения графиков до приема обновлений
+    try:
+        warm_up_total, warm_up_workers = render_service.warm_up(
+            RENDER_WARM_UP_TIMEOUT)
+    except BrokenProcessPool as e:
+        # Расчеты без графиков продолжают работать
+        print(f"Процессы построения графиков не запускаются: {e}")
+    else:
+        print(
+            f"Прогрев графиков: {warm_up_total:.2f} с,"
+            f" процессов: {len(warm_up_workers)}")
+        if len(warm_up_workers) < RENDER_WORKERS:
+            print(
+                f"Прогрев графиков не завершился за"
+                f" {RENDER_WARM_UP_TIMEOUT} с: готово процессов"
+                f" {len(warm_up_workers)} из {RENDER_WORKERS}.")
+
+    webhook_server = None
+    try:
+        if BOT_RUNTIME == "asyncio":
+            # aiohttp загружается только для асинхронной среды выполнения
+            import asyncio
+
+            from aio_runtime import AsyncRuntime
+
+            # Обработчики вызываются из пула потоков среды выполнения
+            bot.threaded = False
+            runtime = AsyncRuntime(
+                bot,
+                handler_threads=ASYNC_HANDLER_THREADS,
+                max_updates=ASYNC_MAX_UPDATES,
+            )
+            if WEBHOOK_URL:
+                bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
+                print(f"Прием обновлений по адресу {WEBHOOK_URL}")
+                asyncio.run(runtime.run_webhook(
+                    WEBHOOK_LISTEN,
+                    WEBHOOK_PORT,
+                    path=urlparse(WEBHOOK_URL).path or "/",
+                    secret_token=WEBHOOK_SECRET,
+                ))
+            else:
+                bot.remove_webhook()
+                asyncio.run(runtime.run_polling())
+        elif WEBHOOK_URL:
+            # Обновления обрабатывают потоки сервера, а не пул telebot
+            bot.threaded = False
+            webhook_server = WebhookServer(
+                bot,
+                host=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                path=urlparse(WEBHOOK_URL).path or "/",
+                secret_token=WEBHOOK_SECRET,
+                workers=WEBHOOK_WORKERS,
+                queue_size=WEBHOOK_QUEUE_SIZE,
+            )
+            bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
+            print(f"Прием обновлений по адресу {WEBHOOK_URL}")
+            webhook_server.serve_forever()
+        else:
+            # Webhook, оставшийся от запуска в другом режиме, мешает getUpdates
+            bot.remove_webhook()
+            bot.polling(none_stop=True)
+    finally:
+        if webhook_server is not None:
+            webhook_server.shutdown(timeout=10)
+        # Дожидаемся файлов, уже принятых в обработку
+        file_executor.shutdown()
+        if state_store is not None:
+            state_store.close()
+        render_service.shutdown()
+        # Отправляем сообщения, уже поставленные в очередь
+        outbound.close(timeout=10)
+        stats = transport.stats()
+        print(
+            f"Запросов к Bot API: {stats['requests']},"
+            f" повторов: {stats['retries']}, ошибок: {stats['errors']},"
+            f" соединений: {stats['connections']},"
+            f" повторное использование: {stats['reuse']:.0%}")
+        transport.close()
@@ -0,0 +1,88 @@
+from collections import OrderedDict
+from threading import Lock
+
+
+class ChartCache:
+    """
+    LRU-кэш идентификаторов уже загруженных в Telegram графиков.
+
+    Ключом служит нормализованный кортеж входных данных графика, значением
+    - file_id фотографии, который Telegram вернул при первой отправке.
+    Повторная отправка по file_id не требует ни построения графика, ни
+    загрузки изображения.
+    """
+
+    def __init__(self, maxsize=1024):
+        """
+        Args:
+        - maxsize (int): Максимальное количество хранимых графиков.
+        """
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def make_key(*values):
+        """
+        Нормализует входные данные графика в ключ кэша.
+
+        Значения приводятся к float и округляются, поэтому "100", "100.0"
+        и "1e2" дают один и тот же ключ.
+
+        Args:
+        - values (float): Входные данные графика.
+
+        Returns:
+        - Tuple[float, ...]: Ключ кэша.
+        """
+        return tuple(round(float(value), 6) + 0.0 for value in values)
+
+    def get(self, key):
+        """
+        Возвращает file_id графика и помечает его как недавно использованный.
+
+        Args:
+        - key (tuple): Ключ кэша.
+
+        Returns:
+        - Optional[str]: file_id или None, если графика нет в кэше.
+        """
+        with self._lock:
+            file_id = self._items.get(key)
+            if file_id is not None:
+                self._items.move_to_end(key)
+            return file_id
+
+    def put(self, key, file_id):
+        """
+        Сохраняет file_id графика, вытесняя давно не использованные записи.
+
+        Args:
+        - key (tuple): Ключ кэша.
+        - file_id (str): Идентификатор фотографии в Telegram.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._items[key] = file_id
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def discard(self, key):
+        """
+        Удаляет запись из кэша (например, если Telegram отверг file_id).
+
+        Args:
+        - key (tuple): Ключ кэша.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._items.pop(key, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
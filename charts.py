@@ -0,0 +1,466 @@
+import time
+from io import BytesIO
+
+import matplotlib
+import numpy as np
+from matplotlib import font_manager
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.colors import TwoSlopeNorm
+from matplotlib.figure import Figure
+
+from economics import profit_grid
+
+# Время прогрева текущего процесса в секундах (None - прогрев не выполнялся)
+warm_up_seconds = None
+
+# Заготовки графиков текущего процесса (None - еще не построены).
+# Процесс-исполнитель строит один график за раз, поэтому заготовки можно
+# переиспользовать без блокировок.
+_kpv_template = None
+_equilibrium_template = None
+
+
+def kpv_points(
+        max_production_A_1,
+        max_production_B_1,
+        max_production_A_2,
+        max_production_B_2):
+    """
+    Рассчитывает вершины общей КПВ двух производителей.
+
+    В точке B товар Б производит тот, у кого ниже альтернативная стоимость
+    товара Б (A / Б), а товар А - другой производитель. Сравнение без
+    деления работает и при нулевых объемах.
+
+    Returns:
+    - Tuple[List[float], List[float], List[float]]: Точки A, B и C в виде
+     [объем товара А, объем товара Б].
+    """
+    point_a = [max_production_A_1 + max_production_A_2, 0]
+    if max_production_A_1 * max_production_B_2\
+            <= max_production_A_2 * max_production_B_1:
+        point_b = [max_production_A_2, max_production_B_1]
+    else:
+        point_b = [max_production_A_1, max_production_B_2]
+    point_c = [0, max_production_B_1 + max_production_B_2]
+    return point_a, point_b, point_c
+
+
+def plot_kpv_fresh(
+        max_production_A_1,
+        max_production_B_1,
+        max_production_A_2,
+        max_production_B_2):
+    """
+    Строит график кривой производственных возможностей для двух
+     производителей с использованием точек A1, B1 и C1.
+
+    Parameters:
+    - max_production_A_1 (float): Максимальный объем производства товара
+     A1 для производителя 1.
+    - max_production_B_1 (float): Максимальный объем производства товара
+     B1 для производителя 1.
+    - max_production_A_2 (float): Максимальный объем производства товара
+     A1 для производителя 2.
+    - max_production_B_2 (float): Максимальный объем производства товара
+     B1 для производителя 2.
+
+    Генерирует график кривой производственных возможностей на отдельном
+     объекте Figure (без глобального состояния pyplot), поэтому функцию
+     можно безопасно вызывать из нескольких потоков одновременно. Фигура
+     строится заново при каждом вызове; используется для сравнения с
+     plot_kpv в bench_charts.py.
+
+    Returns:
+    - bytes: Изображение графика в формате PNG.
+    """
+
+    # Создаем списки значений для точек A, B и C
+    point_a, point_b, point_c = kpv_points(
+        max_production_A_1,
+        max_production_B_1,
+        max_production_A_2,
+        max_production_B_2,
+    )
+
+    # Извлечение координат точек
+    a_x, a_y = point_a
+    b_x, b_y = point_b
+    c_x, c_y = point_c
+
+    # Построение графика с точками на собственной фигуре
+    fig = Figure(figsize=(8, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.scatter([a_y, b_y, c_y], [a_x, b_x, c_x], color="red", label="Точки")
+
+    # Проводим отрезки через точки
+    ax.plot([a_y, b_y], [a_x, b_x], color="blue",
+            linestyle="--", label="Производитель 1")
+    ax.plot([b_y, c_y], [b_x, c_x], color="green",
+            linestyle="--", label="Производитель 2")
+
+    # Добавление названий точек
+    ax.text(a_y, a_x, "A", fontsize=12, ha="right", va="bottom")
+    ax.text(b_y, b_x, "B", fontsize=12, ha="left", va="top")
+    ax.text(c_y, c_x, "C", fontsize=12, ha="right", va="top")
+
+    # Настройки графика
+    ax.set_title("Общая КПВ")
+    ax.set_xlabel("Производство товара Б")
+    ax.set_ylabel("Производство товара A")
+    ax.legend()
+    ax.grid(True, linestyle="--", alpha=0.7)
+
+    # Сохраняем график в память вместо файла на диске
+    buffer = BytesIO()
+    fig.savefig(buffer, format="png")
+    return buffer.getvalue()
+
+
+def plot_deficit_sweep(prices, demand, supply):
+    """
+    Строит график спроса и предложения на диапазоне цен с областями
+    дефицита и излишка.
+
+    Parameters:
+    - prices (List[float]): Цены по возрастанию.
+    - demand (List[float]): Объем спроса при этих ценах.
+    - supply (List[float]): Объем предложения при этих ценах.
+
+    Returns:
+    - bytes: Изображение графика в формате PNG.
+    """
+    fig = Figure(figsize=(8, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+
+    ax.plot(demand, prices, color="blue", label="Спрос (Qd)")
+    ax.plot(supply, prices, color="green", label="Предложение (Qs)")
+
+    # Области дефицита (Qd > Qs) и излишка (Qd < Qs)
+    shortage = [d > s for d, s in zip(demand, supply)]
+    ax.fill_betweenx(prices, demand, supply, where=shortage,
+                     interpolate=True, color="red", alpha=0.2,
+                     label="Дефицит")
+    ax.fill_betweenx(prices, demand, supply,
+                     where=[not x for x in shortage], interpolate=True,
+                     color="orange", alpha=0.2, label="Излишек")
+
+    ax.set_title("Дефицит и излишек на диапазоне цен")
+    ax.set_xlabel("Объем (Q)")
+    ax.set_ylabel("Цена (P)")
+    ax.legend()
+    ax.grid(True, linestyle="--", alpha=0.7)
+
+    buffer = BytesIO()
+    fig.savefig(buffer, format="png")
+    return buffer.getvalue()
+
+
+class _KpvTemplate:
+    """
+    Заготовка графика общей КПВ.
+
+    Фигура, заголовок, подписи осей, сетка и легенда создаются один раз;
+    для нового графика меняются только координаты точек, отрезков и
+    подписей точек.
+    """
+
+    def __init__(self):
+        self.figure = Figure(figsize=(8, 6))
+        FigureCanvasAgg(self.figure)
+        self.ax = self.figure.add_subplot()
+        self.points = self.ax.scatter([0, 0, 0], [0, 0, 0], color="red",
+                                      label="Точки")
+        self.producer_1, = self.ax.plot([], [], color="blue",
+                                        linestyle="--",
+                                        label="Производитель 1")
+        self.producer_2, = self.ax.plot([], [], color="green",
+                                        linestyle="--",
+                                        label="Производитель 2")
+        self.label_a = self.ax.text(0, 0, "A", fontsize=12,
+                                    ha="right", va="bottom")
+        self.label_b = self.ax.text(0, 0, "B", fontsize=12,
+                                    ha="left", va="top")
+        self.label_c = self.ax.text(0, 0, "C", fontsize=12,
+                                    ha="right", va="top")
+
+        self.ax.set_title("Общая КПВ")
+        self.ax.set_xlabel("Производство товара Б")
+        self.ax.set_ylabel("Производство товара A")
+        # Фиксированное положение легенды: поиск лучшего места ("best")
+        # пересчитывался бы при каждом сохранении. Точка B всегда лежит
+        # выше отрезка AC, поэтому угол у начала координат свободен.
+        self.ax.legend(loc="lower left")
+        self.ax.grid(True, linestyle="--", alpha=0.7)
+
+    def render(self, point_a, point_b, point_c):
+        """
+        Обновляет данные заготовки и сохраняет график.
+
+        Returns:
+        - bytes: Изображение графика в формате PNG.
+        """
+        (a_x, a_y), (b_x, b_y), (c_x, c_y) = point_a, point_b, point_c
+
+        self.points.set_offsets([(a_y, a_x), (b_y, b_x), (c_y, c_x)])
+        self.producer_1.set_data([a_y, b_y], [a_x, b_x])
+        self.producer_2.set_data([b_y, c_y], [b_x, c_x])
+        self.label_a.set_position((a_y, a_x))
+        self.label_b.set_position((b_y, b_x))
+        self.label_c.set_position((c_y, c_x))
+        # Точки лежат на концах отрезков, поэтому границ линий достаточно
+        self.ax.relim()
+        self.ax.autoscale_view()
+
+        buffer = BytesIO()
+        self.figure.savefig(buffer, format="png")
+        return buffer.getvalue()
+
+
+def plot_kpv(
+        max_production_A_1,
+        max_production_B_1,
+        max_production_A_2,
+        max_production_B_2):
+    """
+    Строит график кривой производственных возможностей для двух
+     производителей с использованием точек A1, B1 и C1.
+
+    Parameters:
+    - max_production_A_1 (float): Максимальный объем производства товара
+     A1 для производителя 1.
+    - max_production_B_1 (float): Максимальный объем производства товара
+     B1 для производителя 1.
+    - max_production_A_2 (float): Максимальный объем производства товара
+     A1 для производителя 2.
+    - max_production_B_2 (float): Максимальный объем производства товара
+     B1 для производителя 2.
+
+    Использует заготовку графика текущего процесса, поэтому функцию нельзя
+     вызывать из нескольких потоков одновременно (для этого есть
+     plot_kpv_fresh).
+
+    Returns:
+    - bytes: Изображение графика в формате PNG.
+    """
+    global _kpv_template
+
+    point_a, point_b, point_c = kpv_points(
+        max_production_A_1,
+        max_production_B_1,
+        max_production_A_2,
+        max_production_B_2,
+    )
+
+    if _kpv_template is None:
+        _kpv_template = _KpvTemplate()
+    return _kpv_template.render(point_a, point_b, point_c)
+
+
+class _EquilibriumTemplate:
+    """
+    Заготовка графика спроса и предложения.
+
+    Фигура, оси, сетка, подписи и легенда создаются один раз; для нового
+    графика меняются только данные линий, положение точки равновесия и ее
+    подпись.
+    """
+
+    def __init__(self):
+        self.figure = Figure(figsize=(8, 6))
+        FigureCanvasAgg(self.figure)
+        self.ax = self.figure.add_subplot()
+        self.demand, = self.ax.plot([], [], color="blue",
+                                    label="Спрос (Qd)")
+        self.supply, = self.ax.plot([], [], color="green",
+                                    label="Предложение (Qs)")
+        self.point = self.ax.scatter([0], [0], color="red", zorder=3,
+                                     label="Равновесие")
+        self.label = self.ax.annotate(
+            "", (0, 0), xytext=(8, 8), textcoords="offset points",
+            fontsize=12)
+
+        self.ax.set_title("Рыночное равновесие")
+        self.ax.set_xlabel("Объем (Q)")
+        self.ax.set_ylabel("Цена (P)")
+        self.ax.legend()
+        self.ax.grid(True, linestyle="--", alpha=0.7)
+
+    def render(self, prices, demand, supply, price, value):
+        """
+        Обновляет данные заготовки и сохраняет график.
+
+        Returns:
+        - bytes: Изображение графика в формате PNG.
+        """
+        self.demand.set_data(demand, prices)
+        self.supply.set_data(supply, prices)
+        self.point.set_offsets([(value, price)])
+        self.label.xy = (value, price)
+        self.label.set_text(f"P*={round(price, 2)}, Q*={round(value)}")
+        self.ax.relim()
+        self.ax.autoscale_view()
+
+        buffer = BytesIO()
+        self.figure.savefig(buffer, format="png")
+        return buffer.getvalue()
+
+
+def plot_market_equilibrium(A, B, C, D):
+    """
+    Строит график спроса (Qd = A - B * P) и предложения (Qs = C + D * P)
+    с точкой рыночного равновесия (P*, Q*).
+
+    Использует заготовку графика текущего процесса, поэтому функцию нельзя
+    вызывать из нескольких потоков одновременно.
+
+    Parameters:
+    - A (float): Коэффициент A.
+    - B (float): Коэффициент B.
+    - C (float): Коэффициент C.
+    - D (float): Коэффициент D (B + D не равно нулю).
+
+    Returns:
+    - bytes: Изображение графика в формате PNG.
+    """
+    global _equilibrium_template
+
+    price = (A - C) / (D + B)
+    value = A - B * price
+
+    # Диапазон цен вокруг равновесной; при положительной цене - от нуля
+    span = abs(price) or 1
+    low = max(0, price - span) if price > 0 else price - span
+    prices = [low, price + span]
+    demand = [A - B * p for p in prices]
+    supply = [C + D * p for p in prices]
+
+    if _equilibrium_template is None:
+        _equilibrium_template = _EquilibriumTemplate()
+    return _equilibrium_template.render(prices, demand, supply, price, value)
+
+
+def plot_kpv_frontier(vertex_b, vertex_a, markers=True):
+    """
+    Строит общую КПВ многих производителей по вершинам ломаной.
+
+    Parameters:
+    - vertex_b (List[float]): Объемы товара Б в вершинах.
+    - vertex_a (List[float]): Объемы товара А в вершинах.
+    - markers (bool): Отмечать вершины точками.
+
+    Returns:
+    - bytes: Изображение графика в формате PNG.
+    """
+    fig = Figure(figsize=(8, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+
+    ax.plot(vertex_b, vertex_a, color="blue",
+            marker="o" if markers else None, markersize=4,
+            label="Общая КПВ")
+    ax.fill_between(vertex_b, vertex_a, color="blue", alpha=0.1,
+                    label="Достижимые объемы")
+
+    ax.set_title("Общая КПВ")
+    ax.set_xlabel("Производство товара Б")
+    ax.set_ylabel("Производство товара A")
+    ax.legend()
+    ax.grid(True, linestyle="--", alpha=0.7)
+
+    buffer = BytesIO()
+    fig.savefig(buffer, format="png")
+    return buffer.getvalue()
+
+
+def plot_profit_heatmap(
+        min_quantity,
+        max_quantity,
+        min_price,
+        max_price,
+        fixed_costs,
+        variable_costs,
+        quantity,
+        price,
+        points=200):
+    """
+    Строит тепловую карту прибыли по объему и цене с линией
+    безубыточности.
+
+    Parameters:
+    - min_quantity, max_quantity (float): Диапазон объемов производства.
+    - min_price, max_price (float): Диапазон цен за единицу товара.
+    - fixed_costs (float): Постоянные издержки.
+    - variable_costs (float): Переменные издержки на единицу товара.
+    - quantity, price (float): Исходный сценарий, отмечаемый точкой.
+    - points (int): Количество значений объема и цены на графике.
+
+    Returns:
+    - bytes: Изображение графика в формате PNG.
+    """
+    quantities = np.linspace(min_quantity, max_quantity, points)
+    prices = np.linspace(min_price, max_price, points)
+    profit = profit_grid(quantities, prices, fixed_costs, variable_costs)
+
+    fig = Figure(figsize=(8, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+
+    # Убыток - красный, прибыль - зеленый, ноль - середина шкалы
+    low, high = profit.min(), profit.max()
+    norm = TwoSlopeNorm(0, low, high) if low < 0 < high else None
+    mesh = ax.pcolormesh(prices, quantities, profit, cmap="RdYlGn",
+                         norm=norm, shading="auto")
+    fig.colorbar(mesh, ax=ax, label="Прибыль, руб.")
+    if low < 0 < high:
+        ax.contour(prices, quantities, profit, levels=[0], colors="black",
+                   linestyles="--")
+        ax.plot([], [], color="black", linestyle="--",
+                label="Безубыточность")
+    ax.scatter([price], [quantity], color="blue", zorder=3,
+               label="Исходный сценарий")
+
+    ax.set_title("Прибыль при разных объемах и ценах")
+    ax.set_xlabel("Цена за единицу товара (P)")
+    ax.set_ylabel("Объем производства (Q)")
+    ax.legend(loc="upper left")
+
+    buffer = BytesIO()
+    fig.savefig(buffer, format="png")
+    return buffer.getvalue()
+
+
+def warm_up():
+    """
+    Прогревает matplotlib в текущем процессе.
+
+    Принудительно выбирает бэкенд Agg, загружает кэш шрифтов, ищет шрифт
+    с кириллическими глифами и строит пробные графики (заодно создавая
+    заготовку графика равновесия), чтобы первый пользователь после
+    запуска не ждал инициализации matplotlib.
+
+    Returns:
+    - float: Время прогрева в секундах.
+    """
+    global warm_up_seconds
+
+    started = time.perf_counter()
+    matplotlib.use("Agg", force=True)
+    font_manager.findfont(font_manager.FontProperties(
+        family=matplotlib.rcParams["font.family"]))
+    plot_kpv(100, 50, 80, 60)
+    plot_market_equilibrium(100, 2, 10, 3)
+    warm_up_seconds = time.perf_counter() - started
+    return warm_up_seconds
+
+
+# Функции построения графиков, доступные сервису рендеринга по имени
+RENDERERS = {
+    "kpv": plot_kpv,
+    "kpv_frontier": plot_kpv_frontier,
+    "market_equilibrium": plot_market_equilibrium,
+    "deficit_sweep": plot_deficit_sweep,
+    "profit_heatmap": plot_profit_heatmap,
+}
@@ -0,0 +1,388 @@
+import numpy as np
+
+
+def solve_market_equilibrium(A, B, C, D):
+    """
+    Векторный расчет равновесной цены и объема для многих рынков сразу.
+
+    Повторяет calculate_market_equilibrium из bot.py, но принимает
+    массивы коэффициентов. Рынки, где D + B == 0, не вызывают исключения:
+    они отмечаются в маске valid, а цена и объем для них равны NaN.
+
+    Args:
+    - A (array_like): Коэффициенты A.
+    - B (array_like): Коэффициенты B.
+    - C (array_like): Коэффициенты C.
+    - D (array_like): Коэффициенты D.
+
+    Returns:
+    - Tuple[np.ndarray, np.ndarray, np.ndarray]: Равновесные цены, объемы
+     и маска рынков, для которых равновесие определено.
+    """
+    A, B, C, D = (np.asarray(x, dtype=float) for x in (A, B, C, D))
+
+    denominator = D + B
+    valid = denominator != 0
+
+    # Рассчитываем равновесную цену (P*) и объем (Q*)
+    price = np.divide(A - C, denominator,
+                      out=np.full(denominator.shape, np.nan), where=valid)
+    value = A - B * price
+
+    return price, value, valid
+
+
+def deficit_surplus(A, B, C, D, price_level):
+    """
+    Векторный расчет разницы спроса и предложения для многих рынков.
+
+    Повторяет calculate_deficit_surplus из bot.py для массивов
+    коэффициентов и уровней цены.
+
+    Args:
+    - A (array_like): Коэффициенты A.
+    - B (array_like): Коэффициенты B.
+    - C (array_like): Коэффициенты C.
+    - D (array_like): Коэффициенты D.
+    - price_level (array_like): Уровни цены (E).
+
+    Returns:
+    - np.ndarray: Разница спроса и предложения (больше нуля - дефицит,
+     меньше нуля - излишек).
+    """
+    A, B, C, D, price_level = (
+        np.asarray(x, dtype=float) for x in (A, B, C, D, price_level))
+
+    # Рассчитываем спрос и предложение
+    demand = A - B * price_level
+    supply = C + D * price_level
+
+    return demand - supply
+
+
+def price_grid(start, stop, step):
+    """
+    Создает равномерную сетку цен от start до stop включительно.
+
+    Args:
+    - start (float): Начальная цена.
+    - stop (float): Конечная цена.
+    - step (float): Шаг цены.
+
+    Returns:
+    - np.ndarray: Цены.
+
+    Raises:
+    - ValueError: Если шаг не положителен или stop < start.
+    """
+    if step <= 0 or stop < start:
+        raise ValueError("Шаг должен быть положительным, а конечная цена"
+                         " - не меньше начальной.")
+    # Количество точек считаем заранее, чтобы шаг не накапливал ошибку
+    points = int(np.floor((stop - start) / step + 1e-9)) + 1
+    return start + step * np.arange(points)
+
+
+def sweep_transitions(prices, gap):
+    """
+    Находит цены, при которых ситуация на рынке меняется.
+
+    Args:
+    - prices (np.ndarray): Цены по возрастанию.
+    - gap (np.ndarray): Разница спроса и предложения при этих ценах.
+
+    Returns:
+    - List[Tuple[float, float, int, int]]: Для каждой смены ситуации -
+     цены до и после смены и знаки разницы до и после (1 - дефицит,
+     -1 - излишек, 0 - равновесие).
+    """
+    sign = np.sign(gap)
+    changes = np.flatnonzero(sign[1:] != sign[:-1])
+    return [
+        (float(prices[i]), float(prices[i + 1]),
+         int(sign[i]), int(sign[i + 1]))
+        for i in changes
+    ]
+
+
+def kpv_frontier(max_a, max_b):
+    """
+    Строит общую кривую производственных возможностей многих
+    производителей двух товаров (А и Б).
+
+    Производители переключаются с товара А на товар Б в порядке
+    возрастания альтернативной стоимости товара Б (max_a / max_b), то есть
+    по сравнительному преимуществу. Сортировка занимает O(N log N), а
+    вершины кривой - накопленные суммы объемов в этом порядке.
+
+    Args:
+    - max_a (array_like): Максимальные объемы производства товара А.
+    - max_b (array_like): Максимальные объемы производства товара Б.
+
+    Returns:
+    - Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: Номера
+     производителей (с нуля) в порядке переключения, их альтернативные
+     стоимости товара Б, объемы товара Б и товара А в вершинах кривой.
+     Вершин на одну больше, чем производителей: первая - все производят
+     товар А.
+
+    Raises:
+    - ValueError: Если объемы отрицательны, не конечны или их списки
+     разной длины.
+    """
+    max_a = np.asarray(max_a, dtype=float)
+    max_b = np.asarray(max_b, dtype=float)
+    if max_a.shape != max_b.shape or max_a.ndim != 1:
+        raise ValueError("Для каждого производителя нужны объемы обоих"
+                         " товаров.")
+    if not (np.isfinite(max_a).all() and np.isfinite(max_b).all()
+            and (max_a >= 0).all() and (max_b >= 0).all()):
+        raise ValueError("Объемы производства должны быть"
+                         " неотрицательными числами.")
+
+    # Производитель, не способный выпускать товар Б, переключается
+    # последним; 0 / 0 тоже считаем бесконечностью
+    cost = np.full(max_a.shape, np.inf)
+    np.divide(max_a, max_b, out=cost, where=max_b > 0)
+    # Устойчивая сортировка сохраняет порядок равных производителей
+    order = np.argsort(cost, kind="stable")
+
+    vertex_b = np.concatenate(([0.0], np.cumsum(max_b[order])))
+    vertex_a = max_a.sum() - np.concatenate(([0.0],
+                                             np.cumsum(max_a[order])))
+    # Накопленная ошибка округления не должна давать отрицательный объем
+    np.maximum(vertex_a, 0, out=vertex_a)
+    return order, cost[order], vertex_b, vertex_a
+
+
+# Виды кривых спроса и предложения и количество их коэффициентов
+# (None - любое количество)
+CURVE_FORMS = {
+    "linear": 2,        # a + b * P
+    "power": 2,         # a * P ** b
+    "exponential": 2,   # a * e ** (b * P)
+    "polynomial": None,  # c0 + c1 * P + c2 * P ** 2 + ...
+}
+
+
+def curve_terms(form, *coefficients):
+    """
+    Представляет кривую спроса или предложения суммой слагаемых вида
+    c * P ** e * exp(k * P).
+
+    Такое представление покрывает все виды из CURVE_FORMS, поэтому один
+    векторный решатель работает для любых их сочетаний.
+
+    Args:
+    - form (str): Вид кривой из CURVE_FORMS.
+    - coefficients (array_like): Коэффициенты кривой; массивы задают
+     коэффициенты для многих рынков сразу.
+
+    Returns:
+    - Tuple[np.ndarray, np.ndarray, np.ndarray]: Множители c, степени e и
+     показатели k формы (рынки, слагаемые).
+
+    Raises:
+    - ValueError: Если вид кривой неизвестен или количество
+     коэффициентов не подходит.
+    """
+    if form not in CURVE_FORMS:
+        raise ValueError(f"Неизвестный вид кривой: {form}.")
+    expected = CURVE_FORMS[form]
+    if not coefficients:
+        raise ValueError(f"Для кривой {form} нужны коэффициенты.")
+    if expected is not None and len(coefficients) != expected:
+        raise ValueError(
+            f"Для кривой {form} нужно коэффициентов: {expected}.")
+
+    columns = [np.atleast_1d(np.asarray(c, dtype=float))
+               for c in coefficients]
+    columns = np.broadcast_arrays(*columns)
+    zero = np.zeros_like(columns[0])
+
+    if form == "linear":
+        c = [columns[0], columns[1]]
+        e = [zero, zero + 1]
+        k = [zero, zero]
+    elif form == "power":
+        c, e, k = [columns[0]], [columns[1]], [zero]
+    elif form == "exponential":
+        c, e, k = [columns[0]], [zero], [columns[1]]
+    else:
+        c = columns
+        e = [zero + power for power in range(len(columns))]
+        k = [zero] * len(columns)
+
+    return tuple(np.stack(x, axis=1) for x in (c, e, k))
+
+
+def _excess_demand(terms, price):
+    """
+    Вычисляет избыточный спрос Qd - Qs и его производную по цене.
+
+    Args:
+    - terms (Tuple[np.ndarray, np.ndarray, np.ndarray]): Слагаемые
+     избыточного спроса формы (рынки, слагаемые).
+    - price (np.ndarray): Цены рынков.
+
+    Returns:
+    - Tuple[np.ndarray, np.ndarray]: Значения и производные.
+    """
+    c, e, k = terms
+    p = price[:, None]
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        # P ** 0 = 1 и при P = 0
+        powers = np.where(e == 0, 1.0, p ** e)
+        value = c * powers * np.exp(k * p)
+        slope = value * (np.where(e == 0, 0.0, e / p) + k)
+    return value.sum(axis=1), slope.sum(axis=1)
+
+
+def solve_nonlinear_equilibrium(demand, supply, tol=1e-10, max_iter=100,
+                                max_price=1e12):
+    """
+    Векторный поиск равновесной цены (Qd = Qs) для многих рынков сразу.
+
+    Для каждого рынка сначала ищется отрезок цен [0, hi], на концах
+    которого избыточный спрос имеет разные знаки (hi удваивается), затем
+    корень уточняется методом Ньютона; шаг, выходящий за отрезок,
+    заменяется делением отрезка пополам, поэтому метод всегда сходится.
+    На каждой итерации вычисляются только еще не сошедшиеся рынки.
+
+    Args:
+    - demand (tuple): Слагаемые спроса (результат curve_terms).
+    - supply (tuple): Слагаемые предложения (результат curve_terms).
+    - tol (float): Относительная точность по цене и объему.
+    - max_iter (int): Максимальное количество итераций уточнения.
+    - max_price (float): Верхняя граница поиска цены.
+
+    Returns:
+    - Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: Равновесные
+     цены и объемы (NaN, если равновесие не найдено), маска сошедшихся
+     рынков и количество итераций для каждого рынка.
+    """
+    markets = max(demand[0].shape[0], supply[0].shape[0])
+    # Избыточный спрос: слагаемые спроса и слагаемые предложения со знаком
+    # минус
+    c, e, k = (
+        np.concatenate([np.broadcast_to(d, (markets, d.shape[1])),
+                        np.broadcast_to(s, (markets, s.shape[1]))], axis=1)
+        for d, s in zip(demand, supply))
+    c[:, demand[0].shape[1]:] *= -1
+    terms = (c, e, k)
+
+    lo = np.zeros(markets)
+    f_lo, _ = _excess_demand(terms, lo)
+    # Кривые с отрицательной степенью не определены при P = 0
+    undefined = ~np.isfinite(f_lo)
+    lo[undefined] = tol
+    f_lo[undefined], _ = _excess_demand(
+        tuple(x[undefined] for x in terms), lo[undefined])
+
+    hi = np.ones(markets)
+    f_hi, _ = _excess_demand(terms, hi)
+    search = np.sign(f_hi) == np.sign(f_lo)
+    while search.any():
+        hi[search] *= 2
+        f_hi[search], _ = _excess_demand(
+            tuple(x[search] for x in terms), hi[search])
+        search &= (np.sign(f_hi) == np.sign(f_lo)) & (hi < max_price)
+
+    price = np.full(markets, np.nan)
+    iterations = np.zeros(markets, dtype=int)
+    converged = f_lo == 0
+    price[converged] = lo[converged]
+    active = np.flatnonzero(~converged & (np.sign(f_hi) != np.sign(f_lo))
+                            & np.isfinite(f_lo) & np.isfinite(f_hi))
+
+    x = (lo + hi) / 2
+    for _ in range(max_iter):
+        if not len(active):
+            break
+        part = tuple(t[active] for t in terms)
+        fx, dfx = _excess_demand(part, x[active])
+        iterations[active] += 1
+
+        # Сужаем отрезок, сохраняя разные знаки на концах
+        left = np.sign(fx) == np.sign(f_lo[active])
+        lo[active] = np.where(left, x[active], lo[active])
+        f_lo[active] = np.where(left, fx, f_lo[active])
+        hi[active] = np.where(left, hi[active], x[active])
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            newton = x[active] - fx / dfx
+        inside = (newton > lo[active]) & (newton < hi[active])
+        step = np.where(inside, newton, (lo[active] + hi[active]) / 2)
+        # Точный корень: отрезок уже сжался до него, шаг не нужен
+        step = np.where(fx == 0, x[active], step)
+
+        done = ((np.abs(step - x[active]) <= tol * (1 + np.abs(step)))
+                | (fx == 0))
+        x[active] = step
+        converged[active[done]] = True
+        price[active[done]] = step[done]
+        active = active[~done]
+
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        quantity, _ = _excess_demand(demand, np.nan_to_num(price))
+    quantity = np.broadcast_to(quantity, (markets,)).copy()
+    quantity[~converged] = np.nan
+    return price, quantity, converged, iterations
+
+
+def profit_grid(quantities, prices, fixed_costs, variable_costs):
+    """
+    Рассчитывает прибыль для всех сочетаний объема и цены.
+
+    Прибыль = Q * (P - AVC) - FC, где AVC - переменные издержки на
+    единицу товара, FC - постоянные издержки.
+
+    Args:
+    - quantities (array_like): Объемы производства (строки таблицы).
+    - prices (array_like): Цены за единицу товара (столбцы таблицы).
+    - fixed_costs (float): Постоянные издержки.
+    - variable_costs (float): Переменные издержки на единицу товара.
+
+    Returns:
+    - np.ndarray: Прибыль формы (объемы, цены).
+    """
+    quantities = np.asarray(quantities, dtype=float)
+    prices = np.asarray(prices, dtype=float)
+    return (quantities[:, None] * (prices[None, :] - variable_costs)
+            - fixed_costs)
+
+
+def break_even_volume(prices, fixed_costs, variable_costs):
+    """
+    Объем безубыточности при заданных ценах: FC / (P - AVC).
+
+    Args:
+    - prices (array_like): Цены за единицу товара.
+    - fixed_costs (float): Постоянные издержки.
+    - variable_costs (float): Переменные издержки на единицу товара.
+
+    Returns:
+    - np.ndarray: Объемы (inf, если цена не выше AVC и FC > 0).
+    """
+    margin = np.asarray(prices, dtype=float) - variable_costs
+    volume = np.full(margin.shape, np.inf if fixed_costs > 0 else 0.0)
+    np.divide(fixed_costs, margin, out=volume, where=margin > 0)
+    return volume
+
+
+def break_even_price(quantities, fixed_costs, variable_costs):
+    """
+    Цена безубыточности при заданных объемах: AVC + FC / Q.
+
+    Args:
+    - quantities (array_like): Объемы производства.
+    - fixed_costs (float): Постоянные издержки.
+    - variable_costs (float): Переменные издержки на единицу товара.
+
+    Returns:
+    - np.ndarray: Цены (inf при нулевом объеме и FC > 0).
+    """
+    quantities = np.asarray(quantities, dtype=float)
+    price = np.full(quantities.shape, np.inf if fixed_costs > 0 else 0.0)
+    np.divide(fixed_costs, quantities, out=price, where=quantities > 0)
+    return price + variable_costs
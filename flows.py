@@ -0,0 +1,529 @@
+import math
+import re
+
+# Значение вида 'A=100' в сообщении с несколькими значениями
+NAMED_VALUE = re.compile(r"(\w+)\s*=\s*([^\s,;=]+)")
+
+# Разделители значений в сообщении с несколькими значениями: пробелы,
+# точка с запятой или запятая с пробелом после нее
+VALUE_SEPARATOR = re.compile(r"\s*;\s*|,\s+|\s+")
+
+# Запятая между цифрами: неясно, дробное ли это число или два значения
+AMBIGUOUS_COMMA = re.compile(r"\d,\d")
+
+# Кириллические буквы, совпадающие по написанию с латинскими именами полей
+LOOKALIKES = str.maketrans("АВСЕавсе", "ABCEabce")
+
+
+def finite_float(text):
+    """
+    Разбирает конечное число; парсер полей по умолчанию.
+
+    Args:
+    - text (str): Введенный текст.
+
+    Returns:
+    - float: Число.
+
+    Raises:
+    - ValueError: Если текст не число или число не конечное (nan, inf).
+    """
+    value = float(text)
+    if not math.isfinite(value):
+        raise ValueError(text)
+    return value
+
+
+class Field:
+    """
+    Описание одного поля, которое пользователь вводит в ходе задачи.
+
+    Обычное поле принимает одно значение. Повторяемое поле (repeat=True)
+    принимает значения, пока пользователь не введет done_word, и сводит
+    их функцией collect (по умолчанию - в список). Многострочное
+    повторяемое поле (multiline=True) принимает в одном сообщении или
+    файле по значению на строке.
+    """
+
+    __slots__ = ("name", "prompt", "parse", "error", "validators",
+                 "repeat", "done_word", "multiline", "collect", "added")
+
+    def __init__(self, name, prompt, parse=finite_float,
+                 error="Пожалуйста, введите числовое значение.",
+                 validators=(), repeat=False, done_word="готово",
+                 multiline=False, collect=None, added=None):
+        """
+        Args:
+        - name (str): Имя значения в собранных данных задачи.
+        - prompt (str): Приглашение к вводу.
+        - parse (Callable[[str], object]): Преобразует текст в значение,
+         при некорректном вводе бросает ValueError или IndexError.
+        - error (str): Сообщение при некорректном вводе.
+        - validators (Iterable[Tuple[Callable, str]]): Проверки значения
+         и сообщения, отправляемые при их провале.
+        - repeat (bool): Поле принимает несколько значений.
+        - done_word (str): Слово, завершающее ввод повторяемого поля.
+        - multiline (bool): Каждая непустая строка сообщения - отдельное
+         значение повторяемого поля.
+        - collect (Optional[Callable[[object, list], object]]): Добавляет
+         новые значения к собранным (None до первого ввода) и возвращает
+         результат, пригодный для сериализации в JSON. По умолчанию
+         значения собираются в список.
+        - added (Optional[Callable[[list, object], str]]): Подтверждение
+         для новых значений и собранного результата.
+        """
+        self.name = name
+        self.prompt = prompt
+        self.parse = parse
+        self.error = error
+        self.validators = tuple(validators)
+        self.repeat = repeat
+        self.done_word = done_word
+        self.multiline = multiline
+        self.collect = collect or _collect_list
+        self.added = added
+
+
+class Flow:
+    """
+    Задача: упорядоченный список полей и действие по завершении ввода.
+    """
+
+    __slots__ = ("name", "fields", "on_complete", "intro", "reply_markup",
+                 "bulk")
+
+    def __init__(self, name, fields, on_complete, intro=None,
+                 reply_markup=None, bulk=False):
+        """
+        Args:
+        - name (str): Имя задачи.
+        - fields (List[Field]): Поля в порядке ввода.
+        - on_complete (Callable[[types.Message, dict], None]): Вызывается
+         с сообщением пользователя и собранными значениями.
+        - intro (Optional[str]): Пояснение, отправляемое перед первым полем.
+        - reply_markup: Клавиатура, отправляемая в начале задачи.
+        - bulk (bool): Разрешить ввод нескольких полей одним сообщением
+         ("100 2 10 3" или "A=100, B=2, C=10, D=3").
+        """
+        self.name = name
+        self.fields = list(fields)
+        self.on_complete = on_complete
+        self.intro = intro
+        self.reply_markup = reply_markup
+        self.bulk = bulk
+
+
+class FlowState:
+    """
+    Состояние задачи в чате: имя задачи, номер поля и собранные значения.
+    """
+
+    __slots__ = ("flow", "step", "values")
+
+    def __init__(self, flow, step=0, values=None):
+        self.flow = flow
+        self.step = step
+        self.values = {} if values is None else values
+
+    def to_dict(self):
+        """
+        Returns:
+        - dict: Состояние в виде, пригодном для сериализации в JSON.
+        """
+        return {"flow": self.flow, "step": self.step, "values": self.values}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Args:
+        - data (dict): Результат to_dict.
+
+        Returns:
+        - FlowState: Восстановленное состояние.
+        """
+        return cls(data["flow"], data["step"], data["values"])
+
+
+class BulkInputError(ValueError):
+    """
+    Ошибка разбора сообщения с несколькими значениями; текст исключения
+    отправляется пользователю.
+    """
+
+
+def parse_bulk(fields, text):
+    """
+    Разбирает несколько значений полей из одного сообщения.
+
+    Значения перечисляются по порядку полей через пробел, точку с запятой
+    или запятую с пробелом ("100 2 10 3", "100, 2, 10, 3") либо
+    указываются по именам ("A=100, B=2, C=10, D=3"). Запятая между
+    цифрами ("2,5") не принимается: дробная часть отделяется точкой.
+
+    Args:
+    - fields (List[Field]): Поля, которые еще не заполнены, по порядку.
+    - text (str): Текст сообщения.
+
+    Returns:
+    - Optional[dict]: Значения по именам полей или None, если в сообщении
+     только одно значение без имени.
+
+    Raises:
+    - BulkInputError: Если значение некорректно или не относится ни к
+     одному полю.
+    """
+    if AMBIGUOUS_COMMA.search(text):
+        raise BulkInputError(
+            "Непонятно, что означает запятая между цифрами. Дробную часть"
+            " отделяйте точкой (2.5), а значения - пробелом (2 5).")
+    if "=" in text:
+        by_name = {field.name.casefold(): field for field in fields}
+        raw = []
+        for name, value in NAMED_VALUE.findall(text):
+            field = by_name.get(name.translate(LOOKALIKES).casefold())
+            if field is None:
+                raise BulkInputError(f"Неизвестное значение: {name}.")
+            raw.append((field, value))
+    else:
+        tokens = [token for token in VALUE_SEPARATOR.split(text) if token]
+        if len(tokens) <= 1:
+            return None
+        if len(tokens) > len(fields):
+            raise BulkInputError(
+                f"Слишком много значений: ожидается не более {len(fields)}.")
+        raw = list(zip(fields, tokens))
+
+    values = {}
+    for field, token in raw:
+        try:
+            values[field.name] = check_value(field, token)
+        except BulkInputError as e:
+            raise BulkInputError(f"{field.name}: {e}")
+    return values
+
+
+def _collect_list(collected, values):
+    """
+    Сборка значений повторяемого поля по умолчанию: список.
+
+    Args:
+    - collected (Optional[list]): Уже собранные значения.
+    - values (list): Новые значения.
+
+    Returns:
+    - list: Все значения.
+    """
+    return (collected or []) + values
+
+
+def check_value(field, text):
+    """
+    Разбирает и проверяет значение поля.
+
+    Args:
+    - field (Field): Поле.
+    - text (str): Введенный текст.
+
+    Returns:
+    - object: Значение.
+
+    Raises:
+    - BulkInputError: С сообщением поля, если значение некорректно.
+    """
+    try:
+        value = field.parse(text)
+    except (ValueError, IndexError):
+        raise BulkInputError(field.error)
+    for check, error in field.validators:
+        if not check(value):
+            raise BulkInputError(error)
+    return value
+
+
+def non_negative(error):
+    """
+    Проверка неотрицательности значения для Field.validators.
+
+    Args:
+    - error (str): Сообщение при отрицательном значении.
+
+    Returns:
+    - Tuple[Callable[[float], bool], str]: Проверка и сообщение.
+    """
+    return (lambda value: value >= 0), error
+
+
+class FlowEngine:
+    """
+    Табличный движок многошаговых задач.
+
+    Состояние каждого чата хранится в хранилище (store) одной записью
+    FlowState; обработка сообщения - это поиск состояния по идентификатору
+    чата и поля по номеру шага, без регистрации обработчика на каждый шаг.
+    """
+
+    def __init__(self, bot, store, on_back, back_text="Назад",
+                 read_document=None, executor=None):
+        """
+        Args:
+        - bot (telebot.TeleBot): Бот для отправки сообщений.
+        - store: Хранилище состояний с методами find, put и pop.
+        - on_back (Callable[[types.Message], None]): Вызывается, когда
+         пользователь прерывает задачу кнопкой back_text.
+        - back_text (str): Текст кнопки возврата в меню.
+        - read_document (Optional[Callable[[types.Message], str]]):
+         Возвращает текст присланного файла для многострочных полей; при
+         ошибке бросает ValueError с сообщением для пользователя.
+        - executor (Optional[concurrent.futures.Executor]): Пул, в котором
+         скачиваются файлы, чтобы не занимать поток обработчика (None -
+         файл скачивается в самом обработчике).
+        """
+        self.bot = bot
+        self.store = store
+        self.on_back = on_back
+        self.back_text = back_text
+        self.read_document = read_document
+        self.executor = executor
+        self.flows = {}
+
+    def add(self, flow):
+        """
+        Регистрирует задачу.
+
+        Args:
+        - flow (Flow): Задача.
+
+        Returns:
+        - Flow: Та же задача.
+        """
+        self.flows[flow.name] = flow
+        return flow
+
+    def is_active(self, chat_id):
+        """
+        Args:
+        - chat_id (int): Идентификатор чата.
+
+        Returns:
+        - bool: В чате выполняется задача.
+        """
+        return self.store.find(chat_id) is not None
+
+    def cancel(self, chat_id):
+        """
+        Прерывает задачу в чате, если она выполняется.
+
+        Args:
+        - chat_id (int): Идентификатор чата.
+
+        Returns:
+            None
+        """
+        self.store.pop(chat_id)
+
+    def start(self, message, name, values=None):
+        """
+        Начинает задачу в чате пользователя.
+
+        Args:
+        - message (types.Message): Объект сообщения пользователя.
+        - name (str): Имя задачи.
+        - values (Optional[dict]): Уже известные значения первых полей.
+
+        Returns:
+            None
+        """
+        flow = self.flows[name]
+        state = FlowState(name)
+        chat_id = message.chat.id
+
+        if flow.intro is not None:
+            self.bot.send_message(chat_id, flow.intro,
+                                  reply_markup=flow.reply_markup)
+            self._resume(message, flow, state, values)
+        else:
+            self._resume(message, flow, state, values,
+                         reply_markup=flow.reply_markup)
+
+    def _resume(self, message, flow, state, values=None, reply_markup=None):
+        """
+        Переходит к первому еще не заполненному полю или завершает задачу.
+
+        Args:
+        - message (types.Message): Объект сообщения пользователя.
+        - flow (Flow): Задача.
+        - state (FlowState): Состояние задачи.
+        - values (Optional[dict]): Значения, добавляемые к собранным.
+        - reply_markup: Клавиатура для приглашения к вводу.
+
+        Returns:
+            None
+        """
+        if values:
+            state.values.update(values)
+        while (state.step < len(flow.fields)
+               and flow.fields[state.step].name in state.values):
+            state.step += 1
+
+        if state.step == len(flow.fields):
+            self.store.pop(message.chat.id)
+            flow.on_complete(message, state.values)
+            return
+
+        self.store.put(message.chat.id, state)
+        self.bot.send_message(message.chat.id,
+                              flow.fields[state.step].prompt,
+                              reply_markup=reply_markup)
+
+    def handle(self, message):
+        """
+        Обрабатывает ввод пользователя для текущего поля задачи.
+
+        Args:
+        - message (types.Message): Объект сообщения пользователя.
+
+        Returns:
+        - bool: Сообщение относилось к задаче и было обработано.
+        """
+        chat_id = message.chat.id
+        state = self.store.find(chat_id)
+        if state is None:
+            return False
+
+        if message.text == self.back_text:
+            self.cancel(chat_id)
+            self.on_back(message)
+            return True
+
+        flow = self.flows[state.flow]
+        field = flow.fields[state.step]
+        text = message.text
+
+        if (text is None and field.multiline
+                and message.content_type == "document"
+                and self.read_document is not None):
+            if self.executor is not None:
+                self._read_later(message, state)
+                return True
+            try:
+                text = self.read_document(message)
+            except ValueError as e:
+                self.bot.send_message(chat_id, str(e))
+                return True
+
+        self._accept(message, flow, state, text)
+        return True
+
+    def _read_later(self, message, state):
+        """
+        Скачивает файл в пуле executor и передает его текст задаче, если
+        она все еще ждет ввода того же поля.
+
+        Args:
+        - message (types.Message): Сообщение пользователя с файлом.
+        - state (FlowState): Состояние задачи на момент получения файла.
+
+        Returns:
+            None
+        """
+        chat_id = message.chat.id
+        # Состояние меняется на месте, поэтому шаг запоминаем сейчас
+        flow, step = state.flow, state.step
+
+        def finished(future):
+            current = self.store.find(chat_id)
+            if current is not state or current.flow != flow \
+                    or current.step != step:
+                # Задачу прервали, начали заново или продолжили, пока
+                # файл скачивался
+                self.bot.send_message(
+                    chat_id, "Файл пришел слишком поздно: задача уже"
+                    " перешла к другому шагу. Отправьте его еще раз, если"
+                    " он нужен.")
+                return
+            try:
+                text = future.result()
+            except ValueError as e:
+                self.bot.send_message(chat_id, str(e))
+                return
+            except Exception as e:
+                print(e)
+                self.bot.send_message(
+                    chat_id, "Не удалось скачать файл. Попробуйте еще раз.")
+                return
+            self._accept(message, self.flows[flow], state, text)
+
+        self.executor.submit(self.read_document, message)\
+            .add_done_callback(finished)
+
+    def _accept(self, message, flow, state, text):
+        """
+        Проверяет текст для текущего поля задачи и сохраняет значения.
+
+        Args:
+        - message (types.Message): Объект сообщения пользователя.
+        - flow (Flow): Задача.
+        - state (FlowState): Состояние задачи.
+        - text (Optional[str]): Текст сообщения или присланного файла.
+
+        Returns:
+            None
+        """
+        chat_id = message.chat.id
+        field = flow.fields[state.step]
+
+        if text is None:
+            self.bot.send_message(chat_id, field.error)
+            return
+
+        if field.repeat and text.strip().lower() == field.done_word:
+            if field.name not in state.values:
+                state.values[field.name] = field.collect(None, [])
+            self._resume(message, flow, state)
+            return
+
+        if flow.bulk and not field.repeat:
+            # Несколько значений одним сообщением заполняют сразу
+            # несколько полей подряд
+            remaining = []
+            for next_field in flow.fields[state.step:]:
+                if next_field.repeat:
+                    break
+                remaining.append(next_field)
+            try:
+                values = parse_bulk(remaining, text)
+            except BulkInputError as e:
+                self.bot.send_message(chat_id, str(e))
+                return
+            if values:
+                self._resume(message, flow, state, values)
+                return
+
+        if field.multiline:
+            lines = [line for line in text.splitlines() if line.strip()]
+            if not lines:
+                self.bot.send_message(chat_id, field.error)
+                return
+        else:
+            lines = [text]
+
+        # Сообщение принимается целиком или не принимается вовсе
+        values = []
+        for number, line in enumerate(lines, 1):
+            try:
+                values.append(check_value(field, line))
+            except BulkInputError as e:
+                if len(lines) > 1:
+                    e = f"Строка {number} ({line.strip()}): {e}"
+                self.bot.send_message(chat_id, str(e))
+                return
+
+        if not field.repeat:
+            state.values[field.name] = values[0]
+            self._resume(message, flow, state)
+            return
+
+        collected = field.collect(state.values.get(field.name), values)
+        state.values[field.name] = collected
+        self.bot.send_message(chat_id, field.added(values, collected))
+        self.store.put(chat_id, state)
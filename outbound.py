@@ -0,0 +1,566 @@
+import heapq
+import itertools
+import time
+from collections import deque
+from concurrent.futures import Future
+from threading import Condition, Lock, Thread, local
+
+import telebot
+
+# Максимальная длина текста сообщения Telegram (в единицах UTF-16)
+MAX_MESSAGE_LENGTH = 4096
+
+# Разделитель текстов, объединенных в одно сообщение
+MESSAGE_SEPARATOR = "\n\n"
+
+
+class TokenBucket:
+    """
+    Ограничитель частоты: не более rate операций в секунду в среднем и
+    не более capacity подряд.
+
+    Не потокобезопасен: вызывающий код держит собственную блокировку.
+    """
+
+    def __init__(self, rate, capacity, now=0.0):
+        """
+        Args:
+        - rate (float): Пополнение в токенах в секунду.
+        - capacity (float): Максимальное количество токенов.
+        - now (float): Текущее время.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = now
+
+    def _refill(self, now):
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, now):
+        """
+        Args:
+        - now (float): Текущее время.
+
+        Returns:
+        - float: Сколько секунд ждать до появления токена (0 - токен есть).
+        """
+        self._refill(now)
+        return max(0.0, (1 - self._tokens) / self.rate)
+
+    def take(self, now):
+        """
+        Забирает один токен (после проверки delay).
+
+        Args:
+        - now (float): Текущее время.
+
+        Returns:
+            None
+        """
+        self._refill(now)
+        self._tokens -= 1
+
+    def is_full(self, now):
+        """
+        Args:
+        - now (float): Текущее время.
+
+        Returns:
+        - bool: Токены полностью восстановлены.
+        """
+        self._refill(now)
+        return self._tokens >= self.capacity
+
+
+class _Chat:
+    """
+    Очередь исходящих сообщений одного чата.
+    """
+
+    __slots__ = ("pending", "bucket", "busy", "not_before")
+
+    def __init__(self, bucket):
+        # (future, функция, args, kwargs, количество повторов, позиции
+        # файлов в аргументах)
+        self.pending = deque()
+        self.bucket = bucket
+        # Сообщение чата отправляется прямо сейчас
+        self.busy = False
+        # Время, до которого Telegram просил не отправлять (retry_after)
+        self.not_before = 0.0
+
+
+class OutboundQueue:
+    """
+    Центральная очередь исходящих запросов к Telegram.
+
+    Запросы каждого чата отправляются строго по порядку и не чаще
+    chat_rate в секунду, все вместе - не чаще rate в секунду. Ответ 429
+    (Too Many Requests) не считается ошибкой: запрос повторяется через
+    указанное Telegram время retry_after, а остальные чаты продолжают
+    получать сообщения. Вызывающий код получает Future и не ждет
+    отправки, если ему не нужен результат.
+    """
+
+    def __init__(self, rate=30, chat_rate=1, chat_burst=3, workers=4,
+                 max_retries=5, clock=time.monotonic):
+        """
+        Args:
+        - rate (float): Общий лимит запросов в секунду.
+        - chat_rate (float): Лимит запросов в секунду для одного чата.
+        - chat_burst (int): Сколько запросов чата можно отправить подряд
+         (например, ответ и меню).
+        - workers (int): Количество потоков отправки.
+        - max_retries (int): Максимальное количество повторов после 429.
+        - clock (Callable[[], float]): Источник текущего времени.
+        """
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._clock = clock
+        self._lock = Lock()
+        self._wakeup = Condition(self._lock)
+        self._drained = Condition(self._lock)
+        self._global = TokenBucket(rate, rate, clock())
+        self._chats = {}
+        # Чаты с ожидающими запросами: (время готовности, номер, chat_id)
+        self._ready = []
+        self._order = itertools.count()
+        self._depth = 0
+        # Размер словаря чатов, при котором удаляются простаивающие
+        self._prune_at = 1024
+        self._closed = False
+
+        self._threads = [
+            Thread(target=self._work, daemon=True) for _ in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, chat_id, func, *args, **kwargs):
+        """
+        Ставит запрос к Telegram в очередь чата.
+
+        Args:
+        - chat_id (int): Идентификатор чата.
+        - func (Callable): Функция запроса, например TeleBot.send_message.
+        - args, kwargs: Аргументы функции.
+
+        Returns:
+        - concurrent.futures.Future: Будущий результат запроса.
+
+        Raises:
+        - RuntimeError: Если очередь закрыта.
+        """
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Очередь отправки закрыта.")
+            chat = self._chats.get(chat_id)
+            if chat is None:
+                chat = self._chats[chat_id] = _Chat(TokenBucket(
+                    self.chat_rate, self.chat_burst, self._clock()))
+                if len(self._chats) > self._prune_at:
+                    self._prune()
+            chat.pending.append([future, func, args, kwargs, 0,
+                                 _file_positions(args, kwargs)])
+            self._depth += 1
+            if len(chat.pending) == 1 and not chat.busy:
+                self._schedule(chat_id, chat)
+        return future
+
+    def depth(self):
+        """
+        Returns:
+        - int: Количество запросов в очереди, включая отправляемые.
+        """
+        with self._lock:
+            return self._depth
+
+    def join(self, timeout=None):
+        """
+        Ждет, пока очередь опустеет.
+
+        Args:
+        - timeout (Optional[float]): Максимальное время ожидания в секундах.
+
+        Returns:
+        - bool: Очередь пуста.
+        """
+        with self._lock:
+            return self._drained.wait_for(lambda: self._depth == 0, timeout)
+
+    def close(self, timeout=None):
+        """
+        Отправляет оставшиеся запросы и останавливает потоки отправки.
+
+        Args:
+        - timeout (Optional[float]): Максимальное время ожидания отправки.
+
+        Returns:
+            None
+        """
+        self.join(timeout)
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _schedule(self, chat_id, chat):
+        """
+        Добавляет чат в очередь готовых со временем, когда его запрос
+        можно будет отправить (блокировка захвачена).
+        """
+        now = self._clock()
+        ready_at = max(chat.not_before, now + chat.bucket.delay(now))
+        heapq.heappush(self._ready, (ready_at, next(self._order), chat_id))
+        self._wakeup.notify()
+
+    def _prune(self):
+        """
+        Удаляет простаивающие чаты с восстановленным лимитом
+        (блокировка захвачена).
+        """
+        now = self._clock()
+        for chat_id in [
+            chat_id for chat_id, chat in self._chats.items()
+            if not chat.pending and not chat.busy and chat.bucket.is_full(now)
+        ]:
+            del self._chats[chat_id]
+        self._prune_at = max(1024, 2 * len(self._chats))
+
+    def _next(self):
+        """
+        Ждет чат, запрос которого можно отправить по обоим лимитам.
+
+        Returns:
+        - Optional[Tuple[int, _Chat]]: Чат или None, если очередь закрыта.
+        """
+        with self._lock:
+            while True:
+                if self._closed:
+                    return None
+                if not self._ready:
+                    self._wakeup.wait()
+                    continue
+
+                ready_at, _, chat_id = self._ready[0]
+                chat = self._chats[chat_id]
+                now = self._clock()
+                wait = max(ready_at - now, self._global.delay(now))
+                if wait > 0:
+                    self._wakeup.wait(wait)
+                    continue
+                wait = chat.bucket.delay(now)
+                if wait > 0:
+                    # Чат исчерпал свой лимит: пропускаем вперед другие
+                    heapq.heapreplace(self._ready, (
+                        now + wait, next(self._order), chat_id))
+                    continue
+
+                heapq.heappop(self._ready)
+                chat.bucket.take(now)
+                self._global.take(now)
+                chat.busy = True
+                return chat_id, chat
+
+    def _work(self):
+        """
+        Поток отправки: берет по одному запросу готовых чатов.
+
+        Returns:
+            None
+        """
+        while True:
+            picked = self._next()
+            if picked is None:
+                return
+            chat_id, chat = picked
+            item = chat.pending[0]
+            future, func, args, kwargs, retries, positions = item
+
+            retry_after = None
+            result = error = None
+            try:
+                # Повтор отправляет файлы с того же места, что и первая
+                # попытка, а не с конца, до которого их дочитала она
+                for file, position in positions:
+                    file.seek(position)
+                result = func(*args, **kwargs)
+            except telebot.apihelper.ApiTelegramException as e:
+                if e.error_code == 429 and retries < self.max_retries:
+                    retry_after = (e.result_json or {}).get(
+                        "parameters", {}).get("retry_after", 1)
+                else:
+                    error = e
+            except Exception as e:
+                error = e
+
+            with self._lock:
+                chat.busy = False
+                if retry_after is not None:
+                    # Запрос остается первым в очереди чата
+                    item[4] += 1
+                    chat.not_before = self._clock() + retry_after
+                else:
+                    chat.pending.popleft()
+                    self._depth -= 1
+                    if not self._depth:
+                        self._drained.notify_all()
+                if chat.pending:
+                    self._schedule(chat_id, chat)
+
+            if retry_after is not None:
+                continue
+            # Результат устанавливается вне блокировки: обработчики Future
+            # могут сразу поставить в очередь следующий запрос
+            if error is not None:
+                print(error)
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+def _file_positions(args, kwargs):
+    """
+    Args:
+    - args (tuple): Позиционные аргументы запроса.
+    - kwargs (dict): Именованные аргументы запроса.
+
+    Returns:
+    - List[tuple]: Файловые объекты среди аргументов (в том числе во
+     вторых элементах кортежей (имя, файл)) и их текущие позиции.
+    """
+    positions = []
+    for value in (*args, *kwargs.values()):
+        if isinstance(value, tuple) and len(value) > 1:
+            value = value[1]
+        if hasattr(value, "seek") and hasattr(value, "tell") \
+                and getattr(value, "seekable", lambda: False)():
+            positions.append((value, value.tell()))
+    return positions
+
+
+def _text_length(text):
+    """
+    Args:
+    - text (str): Текст сообщения.
+
+    Returns:
+    - int: Длина текста так, как ее считает Telegram (в единицах UTF-16).
+    """
+    return len(text.encode("utf-16-le")) // 2
+
+
+class _BufferedFuture(Future):
+    """
+    Future сообщения, ожидающего отправки в буфере обработчика.
+
+    Ожидание результата сначала отправляет буфер, иначе обработчик ждал
+    бы сообщение, которое уйдет только после его завершения.
+    """
+
+    def __init__(self, flush):
+        super().__init__()
+        self._flush = flush
+
+    def result(self, timeout=None):
+        if not self.done():
+            self._flush()
+        return super().result(timeout)
+
+    def exception(self, timeout=None):
+        if not self.done():
+            self._flush()
+        return super().exception(timeout)
+
+
+class _PendingText:
+    """
+    Текст, накопленный для одного чата за время работы обработчика.
+    """
+
+    __slots__ = ("text", "kwargs", "futures")
+
+    def __init__(self, text, kwargs, future):
+        self.text = text
+        self.kwargs = kwargs
+        self.futures = [future]
+
+    def merge(self, text, kwargs, future):
+        """
+        Добавляет текст следующего сообщения, если Telegram позволяет
+        отправить оба одним сообщением.
+
+        Объединяются сообщения с одинаковыми параметрами; ответ на
+        сообщение пользователя (reply_parameters) может быть только
+        первым, клавиатура - только у одного из них, причем встроенная
+        клавиатура - только у последнего.
+
+        Args:
+        - text (str): Текст следующего сообщения.
+        - kwargs (dict): Его параметры send_message.
+        - future (Future): Его будущий результат.
+
+        Returns:
+        - bool: Сообщение объединено с накопленным.
+        """
+        markup = self.kwargs.get("reply_markup")
+        new_markup = kwargs.get("reply_markup")
+        if markup is not None and (
+                new_markup is not None
+                or isinstance(markup, telebot.types.InlineKeyboardMarkup)):
+            return False
+        if "reply_parameters" in kwargs:
+            return False
+        same = {
+            key: value for key, value in self.kwargs.items()
+            if key not in ("reply_markup", "reply_parameters")
+        }
+        if same != {
+                key: value for key, value in kwargs.items()
+                if key != "reply_markup"}:
+            return False
+
+        merged = self.text + MESSAGE_SEPARATOR + text
+        if _text_length(merged) > MAX_MESSAGE_LENGTH:
+            return False
+
+        self.text = merged
+        if new_markup is not None:
+            self.kwargs["reply_markup"] = new_markup
+        self.futures.append(future)
+        return True
+
+
+class QueuedTeleBot(telebot.TeleBot):
+    """
+    TeleBot, отправляющий сообщения, фотографии и файлы через
+    OutboundQueue.
+
+    send_message, send_photo, send_document (и reply_to) возвращают
+    Future вместо сообщения; вызывающий код ждет результат только если
+    он нужен или если передает файл, который закроет после отправки.
+
+    Тексты, которые обработчик одного обновления отправляет подряд в один
+    чат (например, ответ и приглашение с клавиатурой), накапливаются и
+    уходят одним сообщением при завершении обработчика или перед
+    отправкой файла в тот же чат. Future каждого из них получает общее
+    отправленное сообщение.
+    """
+
+    def __init__(self, token, outbound, **kwargs):
+        """
+        Args:
+        - token (str): Токен бота.
+        - outbound (OutboundQueue): Очередь исходящих запросов.
+        - kwargs: Параметры telebot.TeleBot.
+        """
+        super().__init__(token, **kwargs)
+        self.outbound = outbound
+        # Буфер текстов обработчика, выполняемого в текущем потоке:
+        # {chat_id: _PendingText} или None вне обработчика
+        self._local = local()
+
+    def _exec_task(self, task, *args, **kwargs):
+        super()._exec_task(self._coalesced(task), *args, **kwargs)
+
+    def _coalesced(self, task):
+        """
+        Оборачивает обработчик: тексты, отправленные им, накапливаются и
+        отправляются при его завершении (в том числе с ошибкой).
+
+        Args:
+        - task (Callable): Обработчик обновления.
+
+        Returns:
+        - Callable: Обработчик с буфером сообщений.
+        """
+        def run(*args, **kwargs):
+            if getattr(self._local, "pending", None) is not None:
+                return task(*args, **kwargs)
+            self._local.pending = {}
+            try:
+                return task(*args, **kwargs)
+            finally:
+                pending, self._local.pending = self._local.pending, None
+                for chat_id, text in pending.items():
+                    self._submit_text(chat_id, text)
+
+        return run
+
+    def flush(self, chat_id=None):
+        """
+        Отправляет тексты, накопленные обработчиком в текущем потоке.
+
+        Args:
+        - chat_id (Optional[int]): Чат; None - все чаты.
+
+        Returns:
+            None
+        """
+        pending = getattr(self._local, "pending", None)
+        if not pending:
+            return
+        chat_ids = list(pending) if chat_id is None else [chat_id]
+        for chat_id in chat_ids:
+            text = pending.pop(chat_id, None)
+            if text is not None:
+                self._submit_text(chat_id, text)
+
+    def _submit_text(self, chat_id, pending):
+        """
+        Ставит накопленный текст в очередь одним сообщением.
+
+        Args:
+        - chat_id (int): Идентификатор чата.
+        - pending (_PendingText): Накопленный текст.
+
+        Returns:
+            None
+        """
+        def resolve(sent):
+            error = sent.exception()
+            for future in pending.futures:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(sent.result())
+
+        self.outbound.submit(
+            chat_id, super().send_message, chat_id, pending.text,
+            **pending.kwargs).add_done_callback(resolve)
+
+    def send_message(self, chat_id, *args, **kwargs):
+        pending = getattr(self._local, "pending", None)
+        # Сущности разметки привязаны к позициям в тексте, а позиционные
+        # параметры после текста не сравниваются - такие сообщения
+        # отправляются как есть
+        if pending is None or len(args) != 1 or kwargs.get("entities"):
+            self.flush(chat_id)
+            return self.outbound.submit(
+                chat_id, super().send_message, chat_id, *args, **kwargs)
+
+        kwargs = {
+            key: value for key, value in kwargs.items() if value is not None
+        }
+        future = _BufferedFuture(lambda: self.flush(chat_id))
+        text = pending.get(chat_id)
+        if text is None or not text.merge(args[0], kwargs, future):
+            self.flush(chat_id)
+            pending[chat_id] = _PendingText(args[0], kwargs, future)
+        return future
+
+    def send_photo(self, chat_id, *args, **kwargs):
+        self.flush(chat_id)
+        return self.outbound.submit(
+            chat_id, super().send_photo, chat_id, *args, **kwargs)
+
+    def send_document(self, chat_id, *args, **kwargs):
+        self.flush(chat_id)
+        return self.outbound.submit(
+            chat_id, super().send_document, chat_id, *args, **kwargs)
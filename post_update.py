@@ -0,0 +1,86 @@
+"""
+Отправка синтетического обновления боту, запущенному в режиме webhook.
+
+Формирует обновление Telegram с текстовым сообщением и отправляет его
+POST-запросом на встроенный HTTP-сервер бота, как это делает Telegram.
+Позволяет проверить режим webhook локально, без публичного адреса.
+
+Использование:
+    python post_update.py [--url http://127.0.0.1:8443/] [--secret ...]
+        [--chat 1] "/start"
+"""
+import argparse
+import json
+import sys
+import time
+import urllib.error
+import urllib.request
+
+
+def make_update(update_id, chat_id, text):
+    """
+    Формирует обновление с текстовым сообщением пользователя.
+
+    Args:
+    - update_id (int): Номер обновления.
+    - chat_id (int): Идентификатор чата (и пользователя).
+    - text (str): Текст сообщения.
+
+    Returns:
+    - dict: Обновление в формате Bot API.
+    """
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": "test"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{
+            "type": "bot_command",
+            "offset": 0,
+            "length": len(text.split()[0]),
+        }]
+    return {"update_id": update_id, "message": message}
+
+
+def main():
+    """
+    Отправляет обновление и печатает код ответа сервера.
+
+    Returns:
+    - int: Код завершения (0 - обновление принято).
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("text", help="текст сообщения")
+    parser.add_argument("--url", default="http://127.0.0.1:8443/",
+                        help="адрес встроенного сервера с путем webhook")
+    parser.add_argument("--secret", default=None,
+                        help="значение WEBHOOK_SECRET")
+    parser.add_argument("--chat", type=int, default=1,
+                        help="идентификатор чата")
+    args = parser.parse_args()
+
+    update_id = int(time.time() * 1000) % 2 ** 31
+    headers = {"Content-Type": "application/json"}
+    if args.secret is not None:
+        headers["X-Telegram-Bot-Api-Secret-Token"] = args.secret
+    request = urllib.request.Request(
+        args.url,
+        data=json.dumps(make_update(update_id, args.chat, args.text))
+        .encode("utf-8"),
+        headers=headers,
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    print(f"Ответ сервера: {status}")
+    return 0 if status == 200 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,270 @@
+import multiprocessing
+import os
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import BoundedSemaphore, Lock
+
+
+class RenderQueueFull(Exception):
+    """
+    Исключение, возникающее, когда очередь на построение графиков заполнена.
+    """
+
+
+class RenderFailed(Exception):
+    """
+    Исключение, возникающее, когда график не удалось построить: функция
+    построения завершилась ошибкой или процесс-исполнитель упал.
+    """
+
+
+# Как часто warm_up проверяет, не упали ли процессы, в секундах
+WARM_UP_POLL_INTERVAL = 0.1
+
+# matplotlib импортируется только в процессах-исполнителях (модуль charts),
+# чтобы основной процесс бота запускался без загрузки библиотек графиков.
+
+
+def _init_worker(ready):
+    """
+    Инициализирует процесс-исполнитель: загружает и прогревает matplotlib
+    и сообщает о готовности.
+
+    Args:
+    - ready (multiprocessing.Queue): Очередь, в которую процесс передает
+     свой идентификатор и время прогрева.
+
+    Returns:
+        None
+    """
+    import charts
+
+    charts.warm_up()
+    ready.put((os.getpid(), charts.warm_up_seconds))
+
+
+def _run_job(name, args):
+    """
+    Выполняет задачу построения графика внутри процесса-исполнителя.
+
+    Args:
+    - name (str): Имя функции построения из charts.RENDERERS.
+    - args (tuple): Аргументы функции построения.
+
+    Returns:
+    - bytes: Изображение графика в формате PNG.
+
+    Raises:
+    - KeyError: Если функция построения с таким именем не найдена.
+    """
+    import charts
+
+    if name not in charts.RENDERERS:
+        raise KeyError(f"Неизвестный тип графика: {name}")
+    return charts.RENDERERS[name](*args)
+
+
+def _noop():
+    """
+    Пустая задача: заставляет пул запустить еще один процесс.
+
+    Returns:
+        None
+    """
+
+
+class RenderService:
+    """
+    Сервис построения графиков в пуле отдельных процессов.
+
+    Построение графиков matplotlib нагружает процессор и из-за GIL
+    блокирует остальные потоки бота. Сервис выносит его в отдельные
+    процессы, а количество ожидающих задач ограничивает очередью. Если
+    процесс-исполнитель падает, пул пересоздается при первой же задаче,
+    заметившей это.
+    """
+
+    def __init__(self, max_workers=1, queue_size=32):
+        """
+        Args:
+        - max_workers (int): Количество процессов-исполнителей.
+        - queue_size (int): Максимальное количество задач, ожидающих
+         или выполняющихся одновременно.
+        """
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self._slots = BoundedSemaphore(queue_size)
+        # spawn: процессы не наследуют потоки и соединения бота;
+        # каждый процесс прогревает matplotlib до первой задачи
+        self._context = multiprocessing.get_context("spawn")
+        # Процессы сообщают сюда о завершении прогрева
+        self._ready = self._context.Queue()
+        self._lock = Lock()
+        self._executor = self._new_executor()
+
+    def _new_executor(self):
+        """
+        Returns:
+        - ProcessPoolExecutor: Новый пул процессов-исполнителей.
+        """
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=self._context,
+            initializer=_init_worker,
+            initargs=(self._ready,),
+        )
+
+    def _restart(self, broken):
+        """
+        Заменяет сломанный пул новым (если его еще не заменили).
+
+        Args:
+        - broken (ProcessPoolExecutor): Пул, в котором упал процесс.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if self._executor is not broken:
+                return
+            print("Процесс построения графиков упал, пул пересоздается.")
+            self._executor = self._new_executor()
+        broken.shutdown(wait=False)
+
+    def warm_up(self, timeout=None):
+        """
+        Запускает все процессы-исполнители и дожидается их прогрева.
+
+        Вызывается до начала приема обновлений, чтобы первый график после
+        запуска строился так же быстро, как и последующие. Возвращает
+        управление, когда о готовности сообщил каждый процесс (или по
+        истечении timeout).
+
+        Args:
+        - timeout (Optional[float]): Максимальное время ожидания в секундах.
+
+        Returns:
+        - Tuple[float, Dict[int, float]]: Общее время прогрева и время
+         прогрева каждого процесса по его идентификатору.
+
+        Raises:
+        - BrokenProcessPool: Если процессы-исполнители не запускаются
+         (например, не загружается matplotlib).
+        """
+        started = time.perf_counter()
+        # Пул запускает процессы по мере поступления задач, пока нет
+        # свободных: задачи отправляются одновременно, поэтому запускаются
+        # все процессы сразу
+        executor = self._executor
+        futures = [executor.submit(_noop) for _ in range(self.max_workers)]
+
+        workers = {}
+        while len(workers) < self.max_workers:
+            wait = WARM_UP_POLL_INTERVAL
+            if timeout is not None:
+                remaining = timeout - (time.perf_counter() - started)
+                if remaining <= 0:
+                    break
+                wait = min(wait, remaining)
+            try:
+                pid, seconds = self._ready.get(timeout=wait)
+            except queue.Empty:
+                # Процесс, упавший при инициализации, о готовности не
+                # сообщит: об этом говорят только задачи пула
+                for future in futures:
+                    if future.done() and isinstance(
+                            future.exception(), BrokenProcessPool):
+                        self._restart(executor)
+                        raise future.exception()
+                continue
+            workers[pid] = seconds
+        return time.perf_counter() - started, workers
+
+    def submit(self, name, *args, block_timeout=None):
+        """
+        Ставит задачу построения графика в очередь.
+
+        Args:
+        - name (str): Имя функции построения из charts.RENDERERS.
+        - args: Аргументы функции построения.
+        - block_timeout (Optional[float]): Сколько секунд ждать свободного
+         места в очереди. None - не ждать.
+
+        Returns:
+        - concurrent.futures.Future: Будущий результат (PNG в байтах).
+         Если функция построения неизвестна или завершилась ошибкой,
+         результат завершается ее исключением; если упал процесс -
+         BrokenProcessPool.
+
+        Raises:
+        - RenderQueueFull: Если очередь заполнена.
+        """
+        if block_timeout is None:
+            acquired = self._slots.acquire(blocking=False)
+        else:
+            acquired = self._slots.acquire(timeout=block_timeout)
+        if not acquired:
+            raise RenderQueueFull(
+                "Очередь на построение графиков заполнена.")
+
+        try:
+            executor = self._executor
+            try:
+                future = executor.submit(_run_job, name, args)
+            except BrokenProcessPool:
+                self._restart(executor)
+                executor = self._executor
+                future = executor.submit(_run_job, name, args)
+        except BaseException:
+            self._slots.release()
+            raise
+
+        def finished(future):
+            self._slots.release()
+            if isinstance(future.exception(), BrokenProcessPool):
+                self._restart(executor)
+
+        future.add_done_callback(finished)
+        return future
+
+    def render(self, name, *args, timeout=None):
+        """
+        Строит график в пуле процессов и дожидается результата.
+
+        Args:
+        - name (str): Имя функции построения из charts.RENDERERS.
+        - args: Аргументы функции построения.
+        - timeout (Optional[float]): Максимальное время ожидания в секундах.
+
+        Returns:
+        - bytes: Изображение графика в формате PNG.
+
+        Raises:
+        - RenderQueueFull: Если очередь заполнена.
+        - RenderFailed: Если график не удалось построить.
+        - concurrent.futures.TimeoutError: Если график не построен за
+         timeout секунд.
+        """
+        future = self.submit(name, *args)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            raise
+        except Exception as e:
+            raise RenderFailed(f"{name}: {e}") from e
+
+    def shutdown(self, wait=True):
+        """
+        Останавливает процессы-исполнители.
+
+        Args:
+        - wait (bool): Дождаться завершения уже поставленных задач.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            executor = self._executor
+        executor.shutdown(wait=wait)
@@ -0,0 +1,118 @@
+class Router:
+    """
+    Маршрутизатор текстовых сообщений.
+
+    Тексты кнопок и команды хранятся в словарях, поэтому выбор обработчика
+    занимает одинаковое время при любом количестве задач и кнопок.
+    """
+
+    def __init__(self):
+        self._texts = {}
+        self._commands = {}
+
+    @staticmethod
+    def normalize(text):
+        """
+        Приводит текст к виду ключа словаря (без пробелов по краям и без
+        учета регистра).
+
+        Args:
+        - text (str): Текст сообщения.
+
+        Returns:
+        - str: Ключ.
+        """
+        return text.strip().casefold()
+
+    @staticmethod
+    def command_name(text):
+        """
+        Извлекает имя команды из текста сообщения.
+
+        Args:
+        - text (str): Текст сообщения, например '/kpv@bot 1 2 3 4'.
+
+        Returns:
+        - Optional[str]: Имя команды ('kpv') или None, если это не команда.
+        """
+        if not text.startswith("/") or len(text) == 1:
+            return None
+        name = text[1:].split(maxsplit=1)
+        if not name:
+            return None
+        return name[0].split("@", 1)[0].casefold()
+
+    def routes(self, text):
+        """
+        Args:
+        - text (str): Текст сообщения.
+
+        Returns:
+        - bool: Текст - команда или текст зарегистрированной кнопки.
+        """
+        return self.command_name(text) is not None \
+            or self.normalize(text) in self._texts
+
+    def text(self, *texts):
+        """
+        Декоратор: обработчик сообщений с одним из указанных текстов.
+
+        Args:
+        - texts (str): Тексты кнопок.
+
+        Returns:
+        - Callable: Декоратор.
+        """
+        def decorator(handler):
+            for text in texts:
+                self._texts[self.normalize(text)] = handler
+            return handler
+        return decorator
+
+    def command(self, *names):
+        """
+        Декоратор: обработчик команд с указанными именами.
+
+        Args:
+        - names (str): Имена команд без '/'.
+
+        Returns:
+        - Callable: Декоратор.
+        """
+        def decorator(handler):
+            for name in names:
+                self._commands[name.casefold()] = handler
+            return handler
+        return decorator
+
+    def resolve(self, message):
+        """
+        Находит обработчик текстового сообщения.
+
+        Args:
+        - message (types.Message): Объект сообщения пользователя.
+
+        Returns:
+        - Optional[Callable]: Обработчик или None.
+        """
+        text = message.text
+        name = self.command_name(text)
+        if name is not None:
+            return self._commands.get(name)
+        return self._texts.get(self.normalize(text))
+
+    def dispatch(self, message):
+        """
+        Передает текстовое сообщение найденному обработчику.
+
+        Args:
+        - message (types.Message): Объект сообщения пользователя.
+
+        Returns:
+        - bool: Обработчик найден и вызван.
+        """
+        handler = self.resolve(message)
+        if handler is None:
+            return False
+        handler(message)
+        return True
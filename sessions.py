@@ -0,0 +1,103 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class SessionStore:
+    """
+    Хранилище сессий пользователей, изолированных по идентификатору чата.
+
+    Сессии, к которым не обращались дольше ttl секунд, удаляются; при
+    превышении max_sessions удаляются давно не использованные сессии.
+    """
+
+    def __init__(self, ttl=3600, max_sessions=10000, clock=time.monotonic):
+        """
+        Args:
+        - ttl (float): Время жизни неактивной сессии в секундах.
+        - max_sessions (int): Максимальное количество сессий.
+        - clock (Callable[[], float]): Источник текущего времени.
+        """
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._clock = clock
+        # chat_id -> (время последнего обращения, сессия); порядок
+        # совпадает с порядком обращений
+        self._sessions = OrderedDict()
+        self._lock = Lock()
+
+    def _evict(self, now):
+        """
+        Удаляет устаревшие сессии и сессии сверх лимита.
+
+        Сессии упорядочены по времени обращения, поэтому устаревшие
+        всегда находятся в начале.
+
+        Args:
+        - now (float): Текущее время.
+
+        Returns:
+            None
+        """
+        while self._sessions:
+            touched, _ = next(iter(self._sessions.values()))
+            if now - touched <= self.ttl:
+                break
+            self._sessions.popitem(last=False)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def find(self, chat_id):
+        """
+        Возвращает сессию чата, не создавая новую.
+
+        Args:
+        - chat_id (int): Идентификатор чата.
+
+        Returns:
+        - Optional[object]: Сессия чата или None, если ее нет или она
+         устарела.
+        """
+        with self._lock:
+            now = self._clock()
+            entry = self._sessions.pop(chat_id, None)
+            if entry is None or now - entry[0] > self.ttl:
+                return None
+            self._sessions[chat_id] = (now, entry[1])
+            return entry[1]
+
+    def put(self, chat_id, session):
+        """
+        Сохраняет сессию чата.
+
+        Args:
+        - chat_id (int): Идентификатор чата.
+        - session (object): Сессия чата.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            now = self._clock()
+            self._sessions.pop(chat_id, None)
+            self._sessions[chat_id] = (now, session)
+            self._evict(now)
+
+    def pop(self, chat_id):
+        """
+        Удаляет сессию чата и возвращает ее.
+
+        Args:
+        - chat_id (int): Идентификатор чата.
+
+        Returns:
+        - Optional[object]: Сессия чата или None, если ее нет.
+        """
+        with self._lock:
+            entry = self._sessions.pop(chat_id, None)
+            return None if entry is None else entry[1]
+
+    def __len__(self):
+        with self._lock:
+            self._evict(self._clock())
+            return len(self._sessions)
@@ -0,0 +1,173 @@
+import json
+import sqlite3
+import time
+from threading import Event, Lock, Thread
+
+from flows import FlowState
+from sessions import SessionStore
+
+
+class SQLiteStateStore:
+    """
+    Хранилище состояний задач в локальном файле SQLite.
+
+    Для каждого чата сохраняются имя задачи, номер шага и уже собранные
+    значения, поэтому после перезапуска бота пользователь продолжает
+    задачу с того же шага. Рабочая копия состояний хранится в памяти
+    (SessionStore с ограничением по времени и количеству), а изменения
+    записываются на диск одной транзакцией раз в delay секунд.
+    """
+
+    def __init__(self, filename="state.sqlite3", delay=2,
+                 ttl=24 * 60 * 60, max_sessions=10000):
+        """
+        Args:
+        - filename (str): Путь к файлу базы данных.
+        - delay (float): Интервал между записями на диск в секундах.
+        - ttl (float): Время жизни незавершенной задачи в секундах.
+        - max_sessions (int): Максимальное количество состояний в памяти.
+        """
+        self.delay = delay
+        self.ttl = ttl
+        self._sessions = SessionStore(ttl=ttl, max_sessions=max_sessions)
+        self._lock = Lock()
+        # chat_id -> состояние в JSON, еще не записанное на диск
+        # (None - удалить)
+        self._pending = {}
+        self._stopped = Event()
+
+        self._connection = sqlite3.connect(filename, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS flow_states ("
+            " chat_id INTEGER PRIMARY KEY,"
+            " state TEXT NOT NULL,"
+            " updated REAL NOT NULL)"
+        )
+        self._connection.commit()
+        self._load()
+
+        self._flusher = Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+
+    def _load(self):
+        """
+        Загружает сохраненные состояния из базы данных.
+
+        Returns:
+            None
+        """
+        rows = self._connection.execute(
+            "SELECT chat_id, state FROM flow_states"
+            " WHERE updated >= ? ORDER BY updated",
+            (time.time() - self.ttl,),
+        )
+        for chat_id, state in rows:
+            self._sessions.put(chat_id, FlowState.from_dict(json.loads(state)))
+
+    def find(self, chat_id):
+        """
+        Args:
+        - chat_id (int): Идентификатор чата.
+
+        Returns:
+        - Optional[FlowState]: Состояние задачи в чате.
+        """
+        return self._sessions.find(chat_id)
+
+    def put(self, chat_id, state):
+        """
+        Сохраняет состояние задачи в чате.
+
+        Args:
+        - chat_id (int): Идентификатор чата.
+        - state (FlowState): Состояние задачи.
+
+        Returns:
+            None
+        """
+        self._sessions.put(chat_id, state)
+        with self._lock:
+            self._pending[chat_id] = json.dumps(
+                state.to_dict(), ensure_ascii=False)
+
+    def pop(self, chat_id):
+        """
+        Удаляет состояние задачи в чате.
+
+        Args:
+        - chat_id (int): Идентификатор чата.
+
+        Returns:
+        - Optional[FlowState]: Удаленное состояние.
+        """
+        state = self._sessions.pop(chat_id)
+        with self._lock:
+            self._pending[chat_id] = None
+        return state
+
+    def flush(self):
+        """
+        Записывает накопленные изменения на диск одной транзакцией и
+        удаляет устаревшие состояния.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        now = time.time()
+        updates = [
+            (chat_id, state, now)
+            for chat_id, state in pending.items()
+            if state is not None
+        ]
+        deletes = [
+            (chat_id,) for chat_id, state in pending.items()
+            if state is None
+        ]
+
+        try:
+            with self._connection:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO flow_states"
+                    " (chat_id, state, updated) VALUES (?, ?, ?)",
+                    updates,
+                )
+                self._connection.executemany(
+                    "DELETE FROM flow_states WHERE chat_id = ?", deletes)
+                self._connection.execute(
+                    "DELETE FROM flow_states WHERE updated < ?",
+                    (now - self.ttl,),
+                )
+        except sqlite3.Error:
+            # Возвращаем незаписанные изменения, если их еще не обновили
+            with self._lock:
+                for chat_id, state in pending.items():
+                    self._pending.setdefault(chat_id, state)
+            raise
+
+    def _flush_loop(self):
+        """
+        Периодически записывает изменения на диск в фоновом потоке.
+
+        Returns:
+            None
+        """
+        while not self._stopped.wait(self.delay):
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(e)
+
+    def close(self):
+        """
+        Останавливает фоновую запись, сохраняет изменения и закрывает базу.
+
+        Returns:
+            None
+        """
+        self._stopped.set()
+        self._flusher.join()
+        self.flush()
+        self._connection.close()
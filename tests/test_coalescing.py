@@ -0,0 +1,223 @@
+from concurrent.futures import Future
+
+import pytest
+from telebot import types
+
+from outbound import MAX_MESSAGE_LENGTH, MESSAGE_SEPARATOR, QueuedTeleBot
+
+
+class FakeOutbound:
+    """
+    Очередь отправки, которая сразу "отправляет" запрос и запоминает его.
+    """
+
+    def __init__(self, error=None):
+        """
+        Args:
+        - error (Optional[Exception]): Ошибка, которой завершаются запросы.
+        """
+        self.error = error
+        self.sent = []
+
+    def submit(self, chat_id, func, *args, **kwargs):
+        self.sent.append((func.__name__, args, kwargs))
+        future = Future()
+        if self.error is not None:
+            future.set_exception(self.error)
+        else:
+            future.set_result({"chat_id": chat_id, "args": args})
+        return future
+
+    def texts(self):
+        return [args[1] for name, args, _ in self.sent
+                if name == "send_message"]
+
+
+@pytest.fixture
+def outbound():
+    return FakeOutbound()
+
+
+@pytest.fixture
+def bot(outbound):
+    return QueuedTeleBot("1:test", outbound, threaded=False)
+
+
+def run_handler(bot, handler):
+    """
+    Выполняет функцию так, как telebot выполняет обработчик обновления.
+    """
+    bot._coalesced(handler)()
+
+
+def test_texts_are_merged_in_order_per_chat(bot, outbound):
+    def handler():
+        bot.send_message(1, "first")
+        bot.send_message(2, "other chat")
+        bot.send_message(1, "second")
+        bot.send_message(1, "third")
+        # До завершения обработчика ничего не отправлено
+        assert outbound.sent == []
+
+    run_handler(bot, handler)
+
+    assert outbound.texts() == [
+        MESSAGE_SEPARATOR.join(["first", "second", "third"]),
+        "other chat",
+    ]
+
+
+def test_text_outside_handler_is_sent_at_once(bot, outbound):
+    bot.send_message(1, "first")
+    bot.send_message(1, "second")
+
+    assert outbound.texts() == ["first", "second"]
+
+
+def test_merge_stops_at_message_length(bot, outbound):
+    half = (MAX_MESSAGE_LENGTH - len(MESSAGE_SEPARATOR)) // 2
+
+    def handler():
+        bot.send_message(1, "a" * half)
+        bot.send_message(1, "b" * half)
+        bot.send_message(1, "c")
+
+    run_handler(bot, handler)
+
+    texts = outbound.texts()
+    assert texts == ["a" * half + MESSAGE_SEPARATOR + "b" * half, "c"]
+    assert len(texts[0]) == MAX_MESSAGE_LENGTH
+
+
+def test_length_is_counted_in_utf16_units(bot, outbound):
+    # Каждый эмодзи занимает в Telegram две единицы UTF-16
+    emoji = "\U0001F4C8" * (MAX_MESSAGE_LENGTH // 4)
+
+    def handler():
+        bot.send_message(1, emoji)
+        bot.send_message(1, emoji)
+
+    run_handler(bot, handler)
+
+    assert outbound.texts() == [emoji, emoji]
+
+
+def test_different_parse_mode_is_not_merged(bot, outbound):
+    def handler():
+        bot.send_message(1, "plain")
+        bot.send_message(1, "*bold*", parse_mode="Markdown")
+        bot.send_message(1, "_more_", parse_mode="Markdown")
+
+    run_handler(bot, handler)
+
+    assert outbound.texts() == [
+        "plain", "*bold*" + MESSAGE_SEPARATOR + "_more_"]
+
+
+def test_keyboard_goes_to_merged_message(bot, outbound):
+    keyboard = types.ReplyKeyboardMarkup()
+
+    def handler():
+        bot.send_message(1, "answer")
+        bot.send_message(1, "menu", reply_markup=keyboard)
+
+    run_handler(bot, handler)
+
+    (_, args, kwargs), = outbound.sent
+    assert args[1] == "answer" + MESSAGE_SEPARATOR + "menu"
+    assert kwargs["reply_markup"] is keyboard
+
+
+def test_second_keyboard_is_not_merged(bot, outbound):
+    def handler():
+        bot.send_message(1, "one", reply_markup=types.ReplyKeyboardMarkup())
+        bot.send_message(1, "two", reply_markup=types.ReplyKeyboardMarkup())
+
+    run_handler(bot, handler)
+
+    assert outbound.texts() == ["one", "two"]
+
+
+def test_text_after_inline_keyboard_is_not_merged(bot, outbound):
+    def handler():
+        bot.send_message(1, "choose",
+                         reply_markup=types.InlineKeyboardMarkup())
+        bot.send_message(1, "next")
+
+    run_handler(bot, handler)
+
+    assert outbound.texts() == ["choose", "next"]
+
+
+def test_reply_is_merged_only_as_first_text(bot, outbound):
+    reply = types.ReplyParameters(message_id=7)
+
+    def handler():
+        bot.send_message(1, "reply", reply_parameters=reply)
+        bot.send_message(1, "then")
+        bot.send_message(1, "another reply", reply_parameters=reply)
+
+    run_handler(bot, handler)
+
+    assert outbound.texts() == [
+        "reply" + MESSAGE_SEPARATOR + "then", "another reply"]
+
+
+def test_file_flushes_texts_before_it(bot, outbound):
+    def handler():
+        bot.send_message(1, "before")
+        bot.send_photo(1, "photo")
+        bot.send_message(1, "after")
+
+    run_handler(bot, handler)
+
+    assert [name for name, _, _ in outbound.sent] == [
+        "send_message", "send_photo", "send_message"]
+    assert outbound.texts() == ["before", "after"]
+
+
+def test_merged_futures_resolve_to_combined_message(bot, outbound):
+    futures = []
+
+    def handler():
+        futures.append(bot.send_message(1, "first"))
+        futures.append(bot.send_message(1, "second"))
+
+    run_handler(bot, handler)
+
+    combined = {"chat_id": 1,
+                "args": (1, "first" + MESSAGE_SEPARATOR + "second")}
+    assert [future.result(0) for future in futures] == [combined, combined]
+
+
+def test_waiting_inside_handler_sends_buffer(bot, outbound):
+    results = []
+
+    def handler():
+        bot.send_message(1, "first")
+        future = bot.send_message(1, "second")
+        # Ожидание результата не ждет завершения обработчика
+        results.append(future.result(1))
+        bot.send_message(1, "third")
+
+    run_handler(bot, handler)
+
+    assert results == [{"chat_id": 1,
+                        "args": (1, "first" + MESSAGE_SEPARATOR + "second")}]
+    assert outbound.texts() == [
+        "first" + MESSAGE_SEPARATOR + "second", "third"]
+
+
+def test_send_error_reaches_every_merged_future():
+    error = RuntimeError("network")
+    bot = QueuedTeleBot("1:test", FakeOutbound(error), threaded=False)
+    futures = []
+
+    def handler():
+        futures.append(bot.send_message(1, "first"))
+        futures.append(bot.send_message(1, "second"))
+
+    run_handler(bot, handler)
+
+    for future in futures:
+        assert future.exception(0) is error
@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+# Токен нужен только для создания бота при импорте
+os.environ.setdefault("BOT_TOKEN", "1:test")
+
+from bot import collect_costs, parse_cost  # noqa: E402
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Аренда, 1000", ("Аренда", 1000.0)),
+    ("Сырье; 20,5", ("Сырье", 20.5)),
+    ("Свет: 200 руб.", ("Свет", 200.0)),
+    ("Свет\t200 ₽", ("Свет", 200.0)),
+    ("Аренда 1 000 рублей", ("Аренда", 1000.0)),
+    ("Налог 12 000,50 р.", ("Налог", 12000.5)),
+    # Числа в названии не принимаются за размер
+    ("Зарплата 2 сотрудников 30 000", ("Зарплата 2 сотрудников", 30000.0)),
+    ("Кофе 3 000", ("Кофе", 3000.0)),
+    ("Склад 0", ("Склад", 0.0)),
+])
+def test_amount_is_taken_from_end_of_line(text, expected):
+    assert parse_cost(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "1000",
+    "Аренда",
+    "Аренда 1000 в месяц",
+    "Аренда, 1e5",
+    "Аренда, inf",
+    "Аренда, nan",
+    "Аренда 000",
+])
+def test_line_without_amount_at_end_is_rejected(text):
+    with pytest.raises(ValueError):
+        parse_cost(text)
+
+
+def test_costs_with_same_name_are_summed():
+    costs = collect_costs(None, [("Аренда", 1000.0), ("Свет", 200.0)])
+    costs = collect_costs(costs, [("Аренда", 500.0)])
+
+    assert costs["total"] == 1700.0
+    assert costs["count"] == 3
+    assert costs["items"] == {"Аренда": 1500.0, "Свет": 200.0}
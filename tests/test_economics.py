@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from economics import curve_terms, solve_nonlinear_equilibrium
+
+
+def test_linear_equilibrium():
+    price, quantity, converged, _ = solve_nonlinear_equilibrium(
+        curve_terms("linear", 100, -2), curve_terms("linear", 10, 3))
+
+    assert converged.tolist() == [True]
+    assert price[0] == pytest.approx(18)
+    assert quantity[0] == pytest.approx(64)
+
+
+def test_no_root_gives_nan():
+    # Спрос при любой цене меньше предложения
+    price, quantity, converged, iterations = solve_nonlinear_equilibrium(
+        curve_terms("linear", 10, -1), curve_terms("linear", 20, 1))
+
+    assert converged.tolist() == [False]
+    assert np.isnan(price[0]) and np.isnan(quantity[0])
+    assert iterations[0] == 0
+
+
+def test_several_roots_give_one_of_them():
+    # Qd - Qs = P^2 - 5.5P + 6 = (P - 1.5)(P - 4): кривые пересекаются
+    # дважды, решатель находит корень на первом отрезке смены знака
+    price, quantity, converged, _ = solve_nonlinear_equilibrium(
+        curve_terms("polynomial", 6, 0, 1), curve_terms("linear", 0, 5.5))
+
+    assert converged.tolist() == [True]
+    assert price[0] == pytest.approx(1.5)
+    assert quantity[0] == pytest.approx(1.5 * 5.5)
+    assert price[0] ** 2 - 5.5 * price[0] + 6 == pytest.approx(0, abs=1e-9)
+
+
+def test_markets_are_solved_independently():
+    # Второй рынок без равновесия не мешает первому
+    price, quantity, converged, _ = solve_nonlinear_equilibrium(
+        curve_terms("polynomial", [6, 6], [0, 0], [1, 1]),
+        curve_terms("linear", [0, 0], [5.5, -1]))
+
+    assert converged.tolist() == [True, False]
+    assert price[0] == pytest.approx(1.5)
+    assert np.isnan(price[1]) and np.isnan(quantity[1])
+
+
+def test_power_curve_undefined_at_zero_price():
+    # Спрос 100 / sqrt(P) не определен при P = 0
+    price, quantity, converged, _ = solve_nonlinear_equilibrium(
+        curve_terms("power", 100, -0.5), curve_terms("linear", 10, 3))
+
+    assert converged.tolist() == [True]
+    assert 100 / np.sqrt(price[0]) == pytest.approx(10 + 3 * price[0])
+    assert quantity[0] == pytest.approx(10 + 3 * price[0])
@@ -0,0 +1,294 @@
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import pytest
+
+from flows import (BulkInputError, Field, Flow, FlowEngine, finite_float,
+                   non_negative, parse_bulk)
+
+LATE_FILE = "Файл пришел слишком поздно"
+
+
+class FakeBot:
+    """
+    Бот, который запоминает отправленные сообщения.
+    """
+
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+    def texts(self):
+        return [text for _, text in self.sent]
+
+
+class DictStore:
+    """
+    Хранилище состояний задач в словаре.
+    """
+
+    def __init__(self):
+        self.states = {}
+
+    def find(self, chat_id):
+        return self.states.get(chat_id)
+
+    def put(self, chat_id, state):
+        self.states[chat_id] = state
+
+    def pop(self, chat_id):
+        return self.states.pop(chat_id, None)
+
+
+class ManualExecutor:
+    """
+    Пул, в котором задачи выполняются только по вызову finish.
+    """
+
+    def __init__(self):
+        self.pending = []
+
+    def submit(self, func, *args):
+        future = Future()
+        self.pending.append((future, func, args))
+        return future
+
+    def finish(self):
+        """
+        Выполняет все отложенные задачи по порядку.
+        """
+        pending, self.pending = self.pending, []
+        for future, func, args in pending:
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                future.set_exception(e)
+
+
+def message(text=None, chat_id=1, document=None):
+    """
+    Returns:
+    - SimpleNamespace: Сообщение с текстом или файлом (document - текст
+     файла).
+    """
+    return SimpleNamespace(
+        chat=SimpleNamespace(id=chat_id), text=text,
+        content_type="text" if document is None else "document",
+        document=document)
+
+
+def collect_sum(collected, values):
+    return (collected or 0) + sum(values)
+
+
+@pytest.fixture
+def completed():
+    return []
+
+
+@pytest.fixture
+def backs():
+    return []
+
+
+@pytest.fixture
+def executor():
+    return ManualExecutor()
+
+
+@pytest.fixture
+def engine(completed, backs, executor):
+    engine = FlowEngine(
+        FakeBot(), DictStore(), on_back=backs.append,
+        read_document=lambda message: message.document, executor=executor)
+    engine.add(Flow("market", [
+        Field("A", "Введите A:", validators=[non_negative("A < 0")]),
+        Field("B", "Введите B:"),
+    ], on_complete=lambda message, values: completed.append(values),
+        bulk=True))
+    engine.add(Flow("costs", [
+        Field("costs", "Введите издержки:", repeat=True, multiline=True,
+              collect=collect_sum,
+              added=lambda values, total: f"Итого: {total}"),
+        Field("Q", "Введите Q:"),
+    ], on_complete=lambda message, values: completed.append(values)))
+    return engine
+
+
+def test_fields_are_asked_in_order(engine, completed):
+    engine.start(message(), "market")
+    engine.handle(message("100"))
+    engine.handle(message("2"))
+
+    assert engine.bot.texts() == ["Введите A:", "Введите B:"]
+    assert completed == [{"A": 100.0, "B": 2.0}]
+    assert not engine.is_active(1)
+
+
+def test_invalid_value_keeps_step(engine, completed):
+    engine.start(message(), "market")
+    engine.handle(message("сто"))
+    engine.handle(message("-1"))
+    engine.handle(message("100"))
+
+    assert engine.bot.texts() == [
+        "Введите A:", "Пожалуйста, введите числовое значение.", "A < 0",
+        "Введите B:"]
+    assert engine.store.find(1).step == 1
+
+
+@pytest.mark.parametrize("text", ["nan", "inf", "-inf", "1e999"])
+def test_non_finite_value_is_rejected(engine, completed, text):
+    engine.start(message(), "market")
+    engine.handle(message(text))
+
+    assert engine.bot.texts()[-1] == "Пожалуйста, введите числовое значение."
+    assert engine.store.find(1).step == 0
+
+
+@pytest.mark.parametrize("text", ["nan", "inf", "-Infinity", "1e999"])
+def test_finite_float_rejects_non_finite(text):
+    with pytest.raises(ValueError):
+        finite_float(text)
+
+
+def test_back_button_cancels_flow(engine, completed, backs):
+    engine.start(message(), "market")
+    engine.handle(message("100"))
+    back = message("Назад")
+
+    assert engine.handle(back)
+    assert backs == [back]
+    assert completed == []
+    assert not engine.is_active(1)
+    assert not engine.handle(message("2"))
+
+
+def test_done_word_finishes_repeat_field(engine, completed):
+    engine.start(message(), "costs")
+    engine.handle(message("10\n20"))
+    engine.handle(message("5"))
+    engine.handle(message("Готово"))
+    engine.handle(message("3"))
+
+    assert engine.bot.texts()[1:] == [
+        "Итого: 30.0", "Итого: 35.0", "Введите Q:"]
+    assert completed == [{"costs": 35.0, "Q": 3.0}]
+
+
+def test_done_word_without_values_collects_nothing(engine, completed):
+    engine.start(message(), "costs")
+    engine.handle(message("готово"))
+    engine.handle(message("3"))
+
+    assert completed == [{"costs": 0, "Q": 3.0}]
+
+
+def test_bad_line_rejects_whole_message(engine):
+    engine.start(message(), "costs")
+    engine.handle(message("10\nдвадцать"))
+
+    assert engine.bot.texts()[-1] == (
+        "Строка 2 (двадцать): Пожалуйста, введите числовое значение.")
+    assert "costs" not in engine.store.find(1).values
+
+
+def test_bulk_message_fills_several_fields(engine, completed):
+    engine.start(message(), "market")
+    engine.handle(message("100, 2"))
+
+    assert completed == [{"A": 100.0, "B": 2.0}]
+
+
+def test_bulk_error_keeps_step(engine, completed):
+    engine.start(message(), "market")
+    engine.handle(message("1,5"))
+
+    assert engine.bot.texts()[-1].startswith("Непонятно")
+    assert engine.store.find(1).step == 0
+    assert completed == []
+
+
+def test_file_is_applied_when_downloaded(engine, executor, completed):
+    engine.start(message(), "costs")
+    engine.handle(message(document="10\n20\n"))
+    assert engine.bot.texts() == ["Введите издержки:"]
+
+    executor.finish()
+    engine.handle(message("готово"))
+    engine.handle(message("1"))
+
+    assert engine.bot.texts()[1] == "Итого: 30.0"
+    assert completed == [{"costs": 30.0, "Q": 1.0}]
+
+
+def test_late_file_after_step_change_is_dropped(engine, executor, completed):
+    engine.start(message(), "costs")
+    engine.handle(message(document="10\n20\n"))
+    # Пока файл скачивается, пользователь завершает ввод издержек
+    engine.handle(message("готово"))
+    executor.finish()
+
+    assert engine.bot.texts()[-1].startswith(LATE_FILE)
+    state = engine.store.find(1)
+    assert state.step == 1
+    assert state.values == {"costs": 0}
+
+
+def test_late_file_after_restart_is_dropped(engine, executor):
+    engine.start(message(), "costs")
+    engine.handle(message(document="10\n20\n"))
+    engine.handle(message("Назад"))
+    engine.start(message(), "costs")
+    executor.finish()
+
+    assert engine.bot.texts()[-1].startswith(LATE_FILE)
+    assert "costs" not in engine.store.find(1).values
+
+
+def test_file_read_error_is_reported(engine, executor):
+    def unreadable(message):
+        raise ValueError("Файл слишком большой.")
+
+    engine.read_document = unreadable
+    engine.start(message(), "costs")
+    engine.handle(message(document=""))
+    executor.finish()
+
+    assert engine.bot.texts()[-1] == "Файл слишком большой."
+    assert engine.store.find(1).step == 0
+
+
+FIELDS = [Field("A", ""), Field("B", ""), Field("C", "")]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("1 5", {"A": 1.0, "B": 5.0}),
+    ("1, 5", {"A": 1.0, "B": 5.0}),
+    ("1; 5;2.5", {"A": 1.0, "B": 5.0, "C": 2.5}),
+    ("B=5, A=1", {"A": 1.0, "B": 5.0}),
+    # Кириллическая А вместо латинской
+    ("А=1", {"A": 1.0}),
+    ("b = 2.5", {"B": 2.5}),
+])
+def test_parse_bulk(text, expected):
+    assert parse_bulk(FIELDS, text) == expected
+
+
+@pytest.mark.parametrize("text", ["5", " 1.5 ", "-2"])
+def test_parse_bulk_single_value_is_not_bulk(text):
+    assert parse_bulk(FIELDS, text) is None
+
+
+@pytest.mark.parametrize("text, error", [
+    ("1,5", "Непонятно"),
+    ("A=1,5", "Непонятно"),
+    ("1 2 3 4", "Слишком много значений"),
+    ("D=1", "Неизвестное значение: D"),
+    ("1 nan", "B: Пожалуйста, введите числовое значение."),
+])
+def test_parse_bulk_errors(text, error):
+    with pytest.raises(BulkInputError, match=error):
+        parse_bulk(FIELDS, text)
@@ -0,0 +1,186 @@
+import io
+import time
+from threading import Event, Lock
+
+import pytest
+from telebot.apihelper import ApiTelegramException
+
+from outbound import OutboundQueue, TokenBucket
+
+
+def too_many_requests(retry_after):
+    """
+    Returns:
+    - ApiTelegramException: Ответ 429 с заданным retry_after.
+    """
+    return ApiTelegramException("sendMessage", None, {
+        "error_code": 429,
+        "description": "Too Many Requests",
+        "parameters": {"retry_after": retry_after},
+    })
+
+
+class Recorder:
+    """
+    Функция запроса для очереди: запоминает порядок и время вызовов.
+    """
+
+    def __init__(self, failures=None):
+        """
+        Args:
+        - failures (Optional[dict]): Сколько раз ответить 429 на запрос
+         с данным текстом.
+        """
+        self.calls = []
+        self.failures = dict(failures or {})
+        self._lock = Lock()
+
+    def __call__(self, chat_id, text):
+        with self._lock:
+            self.calls.append((chat_id, text, time.monotonic()))
+            if self.failures.get(text):
+                self.failures[text] -= 1
+                raise too_many_requests(retry_after=1)
+        return f"sent {text}"
+
+    def texts(self, chat_id):
+        return [text for chat, text, _ in self.calls if chat == chat_id]
+
+    def times(self, chat_id):
+        return [moment for chat, _, moment in self.calls if chat == chat_id]
+
+
+@pytest.fixture
+def make_queue():
+    queues = []
+
+    def make(**kwargs):
+        queue = OutboundQueue(**kwargs)
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        queue.close(timeout=5)
+
+
+def test_token_bucket_allows_burst_then_rate():
+    bucket = TokenBucket(rate=2, capacity=3, now=0.0)
+    for _ in range(3):
+        assert bucket.delay(0.0) == 0
+        bucket.take(0.0)
+    assert bucket.delay(0.0) == pytest.approx(0.5)
+    assert bucket.delay(0.25) == pytest.approx(0.25)
+    assert bucket.delay(0.5) == 0
+
+
+def test_token_bucket_refill_is_capped():
+    bucket = TokenBucket(rate=10, capacity=2, now=0.0)
+    bucket.take(0.0)
+    bucket.take(0.0)
+    assert not bucket.is_full(0.1)
+    assert bucket.is_full(100.0)
+    bucket.take(100.0)
+    bucket.take(100.0)
+    assert bucket.delay(100.0) > 0
+
+
+def test_chat_limit_keeps_order_and_spacing(make_queue):
+    queue = make_queue(rate=1000, chat_rate=20, chat_burst=2, workers=4)
+    send = Recorder()
+    futures = [queue.submit(1, send, 1, f"m{i}") for i in range(6)]
+
+    assert [future.result(5) for future in futures] == [
+        f"sent m{i}" for i in range(6)]
+    assert send.texts(1) == [f"m{i}" for i in range(6)]
+    times = send.times(1)
+    # Два сообщения уходят сразу, остальные - не чаще 20 в секунду
+    assert times[5] - times[0] >= (6 - 2) / 20 * 0.9
+
+
+def test_global_limit_spans_chats(make_queue):
+    queue = make_queue(rate=10, chat_rate=100, chat_burst=100, workers=4)
+    send = Recorder()
+    futures = [queue.submit(chat_id, send, chat_id, "m")
+               for chat_id in range(15)]
+
+    for future in futures:
+        future.result(5)
+    moments = sorted(moment for _, _, moment in send.calls)
+    # Первые 10 запросов - запас общего лимита, еще 5 - по 10 в секунду
+    assert moments[-1] - moments[0] >= 5 / 10 * 0.9
+
+
+def test_too_many_requests_is_retried_in_order(make_queue):
+    queue = make_queue(rate=100, chat_rate=100, chat_burst=100, workers=4)
+    send = Recorder(failures={"first": 1})
+    first = queue.submit(1, send, 1, "first")
+    second = queue.submit(1, send, 1, "second")
+
+    assert first.result(5) == "sent first"
+    assert second.result(5) == "sent second"
+    assert send.texts(1) == ["first", "first", "second"]
+    times = send.times(1)
+    # Повтор не раньше retry_after
+    assert times[1] - times[0] >= 0.9
+
+
+def test_retry_sends_file_from_the_start(make_queue):
+    queue = make_queue(rate=100, chat_rate=100, chat_burst=100, workers=1)
+    uploads = []
+
+    def send(chat_id, document):
+        uploads.append(document.read())
+        if len(uploads) == 1:
+            raise too_many_requests(retry_after=1)
+        return "sent"
+
+    document = io.BytesIO(b"A,B\n1,2\n")
+    assert queue.submit(1, send, 1, document).result(5) == "sent"
+    assert uploads == [b"A,B\n1,2\n", b"A,B\n1,2\n"]
+
+
+def test_retry_after_does_not_block_other_chats(make_queue):
+    queue = make_queue(rate=100, chat_rate=100, chat_burst=100, workers=1)
+    send = Recorder(failures={"slow": 1})
+    slow = queue.submit(1, send, 1, "slow")
+    started = time.monotonic()
+    fast = queue.submit(2, send, 2, "fast")
+
+    assert fast.result(5) == "sent fast"
+    assert time.monotonic() - started < 0.5
+    assert not slow.done()
+    assert slow.result(5) == "sent slow"
+
+
+def test_too_many_requests_gives_up_after_max_retries(make_queue):
+    queue = make_queue(rate=100, chat_rate=100, chat_burst=100, workers=1,
+                       max_retries=0)
+    send = Recorder(failures={"m": 1})
+    future = queue.submit(1, send, 1, "m")
+
+    with pytest.raises(ApiTelegramException):
+        future.result(5)
+    assert queue.join(5)
+
+
+def test_close_drains_queue(make_queue):
+    queue = make_queue(rate=1000, chat_rate=1000, chat_burst=1000,
+                       workers=2)
+    release = Event()
+
+    def send(chat_id, text):
+        release.wait(5)
+        return text
+
+    futures = [queue.submit(chat_id % 3, send, chat_id, f"m{chat_id}")
+               for chat_id in range(9)]
+    assert queue.depth() == 9
+    release.set()
+    queue.close(timeout=5)
+
+    assert [future.result(0) for future in futures] == [
+        f"m{chat_id}" for chat_id in range(9)]
+    assert queue.depth() == 0
+    with pytest.raises(RuntimeError):
+        queue.submit(1, send, 1, "late")
@@ -0,0 +1,258 @@
+import random
+import socket
+import time
+from threading import Lock
+
+import requests
+from requests.adapters import HTTPAdapter
+from telebot import apihelper
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+# Таймауты (соединение, чтение) в секундах для методов Bot API. Остальные
+# методы, в том числе getUpdates с долгим опросом, используют таймауты
+# telebot. Таймаут соединения чуть больше интервала повтора SYN (3 с).
+METHOD_TIMEOUTS = {
+    "sendmessage": (3.05, 10),
+    "sendphoto": (3.05, 60),
+    "senddocument": (3.05, 120),
+    "getfile": (3.05, 10),
+}
+
+# Методы, повтор которых не меняет состояние, кроме методов get*
+IDEMPOTENT_METHODS = frozenset({
+    "setwebhook", "deletewebhook", "setmycommands", "deletemycommands",
+})
+
+# Ответы сервера, после которых идемпотентный запрос повторяется
+RETRY_STATUSES = frozenset({500, 502, 503, 504})
+
+# Время простоя соединения до первой TCP keep-alive проверки в секундах
+TCP_KEEPALIVE_IDLE = 60
+
+
+def _socket_options():
+    """
+    Returns:
+    - List[tuple]: Параметры сокета по умолчанию и TCP keep-alive, чтобы
+     оборванные соединения из пула обнаруживались до отправки запроса.
+    """
+    options = list(HTTPConnection.default_socket_options)
+    options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        options.append(
+            (socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, TCP_KEEPALIVE_IDLE))
+    return options
+
+
+class _KeepAliveAdapter(HTTPAdapter):
+    """
+    Адаптер requests с TCP keep-alive, считающий открытые соединения.
+    """
+
+    def __init__(self, on_connect, **kwargs):
+        """
+        Args:
+        - on_connect (Callable[[], None]): Вызывается при открытии нового
+         соединения.
+        - kwargs: Параметры HTTPAdapter.
+        """
+        self._on_connect = on_connect
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs.setdefault("socket_options", _socket_options())
+        super().init_poolmanager(*args, **kwargs)
+
+        on_connect = self._on_connect
+
+        class CountingHTTPPool(HTTPConnectionPool):
+            def _new_conn(self):
+                on_connect()
+                return super()._new_conn()
+
+        class CountingHTTPSPool(HTTPSConnectionPool):
+            def _new_conn(self):
+                on_connect()
+                return super()._new_conn()
+
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPPool,
+            "https": CountingHTTPSPool,
+        }
+
+
+class BotTransport:
+    """
+    Транспорт запросов к Bot API: общий пул постоянных соединений,
+    таймауты по методам и повторы с экспоненциальной задержкой со
+    случайным разбросом.
+
+    Повторяются только запросы, которые можно безопасно отправить еще раз:
+    методы get* и IDEMPOTENT_METHODS - при любой сетевой ошибке и ответах
+    5xx, остальные (отправка сообщений) - только если соединение не
+    удалось установить и запрос до Telegram не дошел. Ответ 429 не
+    повторяется здесь: его обрабатывает очередь отправки.
+    """
+
+    def __init__(self, pool_size=8, max_retries=3, backoff=0.5,
+                 max_backoff=8.0):
+        """
+        Args:
+        - pool_size (int): Максимальное количество постоянных соединений
+         с Bot API; должно быть не меньше числа потоков, делающих запросы.
+        - max_retries (int): Максимальное количество повторов запроса.
+        - backoff (float): Базовая задержка перед повтором в секундах.
+        - max_backoff (float): Максимальная задержка перед повтором.
+        """
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._lock = Lock()
+        self._requests = 0
+        self._retries = 0
+        self._errors = 0
+        self._connections = 0
+
+        self.session = requests.Session()
+        adapter = _KeepAliveAdapter(
+            self._count_connection,
+            pool_connections=1,
+            pool_maxsize=pool_size,
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def install(self):
+        """
+        Направляет запросы telebot к Bot API через этот транспорт.
+
+        Returns:
+            None
+        """
+        apihelper.CUSTOM_REQUEST_SENDER = self.request
+
+    def request(self, method, url, params=None, files=None, timeout=None,
+                proxies=None):
+        """
+        Выполняет запрос к Bot API (сигнатура
+        apihelper.CUSTOM_REQUEST_SENDER).
+
+        Args:
+        - method (str): HTTP-метод.
+        - url (str): Адрес метода Bot API.
+        - params (Optional[dict]): Параметры запроса.
+        - files (Optional[dict]): Отправляемые файлы.
+        - timeout (Optional[Tuple[float, float]]): Таймауты telebot.
+        - proxies (Optional[dict]): Прокси.
+
+        Returns:
+        - requests.Response: Ответ сервера.
+
+        Raises:
+        - requests.RequestException: Если запрос не удался после повторов.
+        """
+        name = url.rsplit("/", 1)[-1].lower()
+        timeout = METHOD_TIMEOUTS.get(name, timeout)
+        idempotent = name.startswith("get") or name in IDEMPOTENT_METHODS
+        # Файлы читаются заново при каждой попытке
+        positions = [
+            (file, file.tell()) for file in _file_objects(files)
+            if getattr(file, "seekable", lambda: False)()
+        ]
+
+        attempt = 0
+        while True:
+            with self._lock:
+                self._requests += 1
+            try:
+                response = self.session.request(
+                    method, url, params=params, files=files,
+                    timeout=timeout, proxies=proxies)
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as e:
+                error, retry = e, idempotent or _not_sent(e)
+            else:
+                if not (idempotent and response.status_code in RETRY_STATUSES
+                        and attempt < self.max_retries):
+                    return response
+                error, retry = None, True
+
+            if not retry or attempt >= self.max_retries:
+                with self._lock:
+                    self._errors += 1
+                raise error
+            with self._lock:
+                self._retries += 1
+            # Полный случайный разброс: одновременные повторы многих потоков
+            # не приходят в Telegram одной волной
+            time.sleep(random.uniform(
+                0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+            attempt += 1
+            for file, position in positions:
+                file.seek(position)
+
+    def stats(self):
+        """
+        Returns:
+        - dict: Количество попыток запросов (requests), повторов (retries),
+         неудачных запросов (errors), открытых соединений (connections) и
+         доля попыток, отправленных по уже открытому соединению (reuse).
+        """
+        with self._lock:
+            requests_made = self._requests
+            connections = self._connections
+            return {
+                "requests": requests_made,
+                "retries": self._retries,
+                "errors": self._errors,
+                "connections": connections,
+                "reuse": (
+                    max(0, requests_made - connections) / requests_made
+                    if requests_made else 0.0
+                ),
+            }
+
+    def close(self):
+        """
+        Закрывает соединения пула.
+
+        Returns:
+            None
+        """
+        self.session.close()
+
+    def _count_connection(self):
+        with self._lock:
+            self._connections += 1
+
+
+def _not_sent(error):
+    """
+    Args:
+    - error (requests.RequestException): Ошибка запроса.
+
+    Returns:
+    - bool: Соединение не было установлено, и запрос не дошел до сервера.
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+
+def _file_objects(files):
+    """
+    Args:
+    - files (Optional[dict]): Файлы запроса в формате requests.
+
+    Returns:
+    - Iterator: Файловые объекты среди значений (включая кортежи
+     (имя, файл, ...)).
+    """
+    for value in (files or {}).values():
+        if isinstance(value, tuple) and len(value) > 1:
+            value = value[1]
+        if hasattr(value, "seek") and hasattr(value, "tell"):
+            yield value
@@ -0,0 +1,221 @@
+import hmac
+import json
+import queue
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+from telebot import types
+
+# Максимальный размер тела запроса с обновлением в байтах
+MAX_UPDATE_SIZE = 1024 * 1024
+
+# Поля обновления, содержащие сообщение с чатом
+MESSAGE_FIELDS = ("message", "edited_message", "channel_post",
+                  "edited_channel_post")
+
+
+def chat_key(update):
+    """
+    Args:
+    - update (types.Update): Обновление.
+
+    Returns:
+    - int: Идентификатор чата обновления или, если чата нет, номер
+     обновления.
+    """
+    for name in MESSAGE_FIELDS:
+        message = getattr(update, name, None)
+        if message is not None:
+            return message.chat.id
+    query = getattr(update, "callback_query", None)
+    if query is not None and query.message is not None:
+        return query.message.chat.id
+    return update.update_id
+
+
+class WebhookServer:
+    """
+    HTTP-сервер для приема обновлений от Telegram (режим webhook).
+
+    Запрос с обновлением подтверждается сразу после постановки в очередь,
+    а обработчики выполняются потоками-исполнителями через тот же
+    диспетчер, что и при long polling (bot.process_new_updates).
+    Обновления одного чата всегда попадают в один поток и
+    обрабатываются по порядку. Если очередь потока заполнена, сервер
+    отвечает 503, и Telegram повторяет доставку позже.
+    """
+
+    def __init__(self, bot, host="0.0.0.0", port=8443, path="/",
+                 secret_token=None, workers=4, queue_size=256):
+        """
+        Args:
+        - bot (telebot.TeleBot): Бот, обрабатывающий обновления.
+        - host (str): Адрес, на котором принимаются запросы.
+        - port (int): Порт (0 - любой свободный).
+        - path (str): Путь, на который Telegram отправляет обновления.
+        - secret_token (Optional[str]): Значение заголовка
+         X-Telegram-Bot-Api-Secret-Token, переданное в set_webhook.
+        - workers (int): Количество потоков-исполнителей.
+        - queue_size (int): Максимальное количество обновлений в очереди
+         одного потока.
+        """
+        self.bot = bot
+        self.path = path
+        self.secret_token = secret_token
+        self._queues = [queue.Queue(maxsize=queue_size)
+                        for _ in range(workers)]
+        self._threads = [
+            Thread(target=self._work, args=(updates,), daemon=True)
+            for updates in self._queues
+        ]
+        for thread in self._threads:
+            thread.start()
+
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+
+    @property
+    def server_address(self):
+        """
+        Returns:
+        - Tuple[str, int]: Адрес и порт, на которых принимаются запросы.
+        """
+        return self.httpd.server_address
+
+    def submit(self, update):
+        """
+        Ставит обновление в очередь потока его чата.
+
+        Args:
+        - update (types.Update): Обновление.
+
+        Returns:
+        - bool: Обновление принято (False - очередь заполнена).
+        """
+        updates = self._queues[hash(chat_key(update)) % len(self._queues)]
+        try:
+            updates.put_nowait(update)
+        except queue.Full:
+            return False
+        return True
+
+    def depth(self):
+        """
+        Returns:
+        - int: Количество обновлений, ожидающих обработки.
+        """
+        return sum(updates.qsize() for updates in self._queues)
+
+    def serve_forever(self):
+        """
+        Принимает обновления до вызова shutdown.
+
+        Returns:
+            None
+        """
+        self.httpd.serve_forever()
+
+    def shutdown(self, timeout=None):
+        """
+        Прекращает прием запросов и обрабатывает уже принятые обновления.
+
+        Args:
+        - timeout (Optional[float]): Максимальное время ожидания каждого
+         потока-исполнителя.
+
+        Returns:
+            None
+        """
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        for updates in self._queues:
+            updates.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _work(self, updates):
+        """
+        Поток-исполнитель: обрабатывает обновления из своей очереди.
+
+        Args:
+        - updates (queue.Queue): Очередь потока.
+
+        Returns:
+            None
+        """
+        while True:
+            update = updates.get()
+            if update is None:
+                return
+            try:
+                self.bot.process_new_updates([update])
+            except Exception as e:
+                print(e)
+
+    def _make_handler(self):
+        """
+        Returns:
+        - type: Класс обработчика HTTP-запросов этого сервера.
+        """
+        server = self
+
+        class UpdateHandler(BaseHTTPRequestHandler):
+            # Постоянные соединения: Telegram отправляет обновления подряд
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                if self.path != server.path:
+                    self._reply(404)
+                    return
+                expected = server.secret_token
+                secret = self.headers.get(
+                    "X-Telegram-Bot-Api-Secret-Token", "")
+                if expected is not None \
+                        and not hmac.compare_digest(secret, expected):
+                    self._reply(403)
+                    return
+
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                except ValueError:
+                    length = -1
+                if not 0 < length <= MAX_UPDATE_SIZE:
+                    self._reply(413 if length > MAX_UPDATE_SIZE else 400)
+                    return
+
+                try:
+                    data = json.loads(self.rfile.read(length))
+                    if not isinstance(data, dict) or "update_id" not in data:
+                        raise ValueError("Нет update_id.")
+                    update = types.Update.de_json(data)
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    self._reply(400)
+                    return
+
+                if not server.submit(update):
+                    self._reply(503, {"Retry-After": "1"})
+                    return
+                self._reply(200)
+
+            def do_GET(self):
+                # Проверка работоспособности процесса
+                if self.path == "/healthz":
+                    self._reply(200)
+                else:
+                    self._reply(404)
+
+            def _reply(self, code, headers=None):
+                self.send_response(code)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", "0")
+                if code >= 400:
+                    # Тело запроса могло остаться непрочитанным
+                    self.send_header("Connection", "close")
+                    self.close_connection = True
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return UpdateHandler